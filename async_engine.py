@@ -0,0 +1,166 @@
+import asyncio
+from cmadevops_deployment_scheduler.modules.octopus_deploy import *
+from cmadevops_deployment_scheduler.modules.service_now import *
+from cmadevops_deployment_scheduler.modules.scheduler import *
+from cmadevops_deployment_scheduler.modules.webex import post_to_webex
+from cmadevops_deployment_scheduler.modules.run_fingerprint import run_fingerprint, can_skip_run, save_run_fingerprint
+from cmadevops_deployment_scheduler.modules.clients import call_report
+from cmadevops_deployment_scheduler.modules.task_store import changed_items
+from cmadevops_deployment_scheduler.modules.logwrite import log
+
+import os
+
+# The async engine drives the same pooled clients as the synchronous engine, every blocking call runs on a
+# worker thread through asyncio.to_thread so calls that do not depend on each other are in flight at the same
+# time. The per host limits of the clients still apply to every call.
+
+
+async def find_releases_async(project_id: str, release_numbers: list) -> dict:
+    """Async counterpart of find_releases"""
+    return await asyncio.to_thread(find_releases, project_id=project_id, release_numbers=release_numbers)
+
+
+async def promotable_async(release_id: str) -> bool:
+    """Async counterpart of promotable"""
+    return await asyncio.to_thread(promotable, release_id=release_id)
+
+
+async def octopus_snapshot() -> ProjectCatalog:
+    """
+    Downloads the projects and then the queued tasks from Octopus Deploy, the task index needs the projects
+    to read the project names of the tasks
+    """
+    catalog = await asyncio.to_thread(project_catalog, refresh=True)
+    await asyncio.to_thread(task_index, catalog=catalog, refresh=True)
+    return catalog
+
+
+async def prefetch_releases_async(plans: list, catalog: ProjectCatalog = None) -> None:
+    """
+    Looks up the releases of every planned item for every project at the same time,
+    then checks if the releases that still have to be scheduled can be promoted, all at the same time
+        Parameters:
+            plans: planned ServiceNow items
+            catalog: project catalog for the run
+    """
+    groups = {}
+    for plan in plans:
+        if plan["project_id"] and plan["release_number"]:
+            groups.setdefault(plan["project_id"], set()).add(plan["release_number"])
+
+    found = await asyncio.gather(
+        *(
+            find_releases_async(project_id=project_id, release_numbers=list(release_numbers))
+            for project_id, release_numbers in groups.items()
+        )
+    )
+
+    # releases that are already scheduled are never checked by schedule_item so they are not checked here either
+    release_ids = set()
+    for plan in plans:
+        if not plan["project_id"] or not plan["release_number"]:
+            continue
+        release = found[list(groups).index(plan["project_id"])].get(plan["release_number"].upper())
+        if release and not scheduled(
+            release_number=plan["release_number"], project_name=plan["project_name"], catalog=catalog
+        ):
+            release_ids.add(str(release["Id"]))
+
+    await asyncio.gather(*(promotable_async(release_id=release_id) for release_id in release_ids))
+
+
+async def schedule_async(snow_items: list, catalog: ProjectCatalog = None) -> None:
+    """
+    Async counterpart of schedule, items of different projects are scheduled at the same time and
+    items of the same project one after the other
+        Parameters:
+            snow_items: JSON response from ServiceNow
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    if not snow_items:
+        return
+
+    catalog = catalog if catalog is not None else await asyncio.to_thread(project_catalog)
+    snow_items = list(changed_items(snow_items))
+    limit = asyncio.Semaphore(int(scheduler_config.get("ScheduleWorkers", 4)))
+
+    async def schedule_group(plans: list) -> None:
+        async with limit:
+            await asyncio.to_thread(schedule_items, plans=plans, catalog=catalog)
+
+    batch_size = int(scheduler_config.get("ScheduleBatchSize", 100))
+    for i in range(0, len(snow_items), batch_size):
+        plans = [plan_item(snow_item=snow_item, catalog=catalog) for snow_item in snow_items[i : i + batch_size]]
+        await prefetch_releases_async(plans, catalog=catalog)
+        await asyncio.gather(*(schedule_group(group) for group in project_groups(plans)))
+
+        # items sent back to the queue are updated together once the batch is done
+        await asyncio.to_thread(change_task_writes().flush)
+
+
+async def run_async():
+    """Entry point for Deployment Scheduler on the async engine, see main.run"""
+    log("--------------------\n")
+    log(
+        f"PROCESS STARTED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log(f"ENVIRONMENT: {os.getenv('ASPNETCORE_ENVIRONMENT').upper()}\n")
+
+    # most runs have nothing to do, a couple of cheap probes tell us if anything changed since the last run
+    call_report().phase("FINGERPRINT")
+    fingerprint = await asyncio.to_thread(run_fingerprint)
+    if await asyncio.to_thread(can_skip_run, fingerprint):
+        log(
+            f"NOTHING CHANGED, PROCESS SKIPPED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+        )
+        log("-------------------- \n")
+        return
+
+    # the change tasks from SNOW and the projects, tasks and queued deployments from OD are read at the same time
+    call_report().phase("GET TASKS AND QUEUED DEPLOYMENTS")
+    snapshot, catalog, deployments = await asyncio.gather(
+        asyncio.to_thread(change_task_snapshot, refresh=True),
+        octopus_snapshot(),
+        asyncio.to_thread(queued_deployments),
+    )
+    log(
+        f"GET TASKS AND QUEUED DEPLOYMENTS {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
+
+    # tasks assigned to AUTOOCTOPUS that were not processed go back to the queue, see main.run
+    call_report().phase("UNASSIGN")
+    await asyncio.to_thread(unassign, snow_items=snapshot.assigned())
+    log(
+        f"UNASSIGN {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
+
+    call_report().phase("SCHEDULE")
+    await schedule_async(snow_items=snapshot.unassigned(), catalog=catalog)
+    log(
+        f"SCHEDULE {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
+
+    # deployments scheduled this run are not in the queue we read at the start, they were scheduled
+    # from an assigned task so there is nothing to authorize and they are checked again next run
+    call_report().phase("AUTHORIZE DEPLOYMENTS")
+    await asyncio.to_thread(
+        authorize_deployments, snow_items=snapshot.assigned(), deployments=deployments, catalog=catalog
+    )
+    log(
+        f"AUTHORIZE DEPLOYMENTS {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
+
+    # the next run is skipped if nothing changes until then
+    call_report().phase("SAVE FINGERPRINT")
+    await asyncio.to_thread(
+        save_run_fingerprint, fingerprint, snow_items=snapshot.snow_items, deployments=deployments
+    )
+
+    log(
+        f"PROCESS FINISHED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
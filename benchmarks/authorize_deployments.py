@@ -0,0 +1,185 @@
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from scheduler_engines import build_package
+
+WORDS = [
+    "Billing", "Claims", "Member", "Portal", "API", "Service", "Batch", "Sync", "Gateway", "Provider",
+    "Eligibility", "Pharmacy", "Reporting", "Auth", "Web", "Worker", "Export", "Import", "Audit", "Core",
+]
+
+# change tasks and queued deployments per run, and the share of change tasks whose title does not have an exact
+# project name in it. Those go through closest_project on top of the exact match
+SIZES = ((100, 400), (500, 2000))
+UNMATCHED_SHARES = (0.0, 0.25, 1.0)
+
+
+class StubClient:
+    """Answers every write with a success without a service, authorize only writes"""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.writes = 0
+        self.cancelled = []
+
+    def post(self, endpoint: str, **kwargs):
+        self.writes += 1
+        if endpoint.endswith("/cancel"):
+            self.cancelled.append(endpoint.split("/")[-2])
+        if endpoint.endswith("/batch"):
+            rest_requests = json.loads(kwargs["data"])["rest_requests"]
+            return self.clients.fake_response(
+                200, {"serviced_requests": [{"id": r["id"], "status_code": 200} for r in rest_requests]}
+            )
+        return self.clients.fake_response(200, {})
+
+    def put(self, endpoint: str, **kwargs):
+        self.writes += 1
+        return self.clients.fake_response(200, {"result": {}})
+
+
+def generate_projects(count: int) -> list:
+    """Builds a list of unique fake Octopus Deploy projects"""
+    random.seed(count)
+    names = set()
+    while len(names) < count:
+        names.add(" ".join(random.sample(WORDS, random.randint(1, 3))) + f" {random.randint(1, 99)}")
+    return [{"Id": f"Projects-{i}", "Name": name, "Slug": name.lower().replace(" ", "-")} for i, name in enumerate(names)]
+
+
+def unmatched_title(name: str) -> str:
+    """A project name as people get it wrong, either with other separators or misspelled"""
+    if random.random() < 0.5:
+        return name.replace(" ", "-")
+    position = random.randrange(len(name))
+    return name[:position] + name[position + 1 :]
+
+
+def generate_workload(od_projects: list, deployment_count: int, task_count: int, unmatched_share: float) -> tuple:
+    """Builds change tasks and queued deployments, most deployments have a matching change task"""
+    random.seed(task_count)
+    start = datetime(2030, 1, 1, 14, 0, 0)
+    snow_items = []
+    for i in range(task_count):
+        project = random.choice(od_projects)
+        release_number = f"2024.{random.randint(1, 12)}.0.{random.randint(1, 500)}"
+        name = unmatched_title(project["Name"]) if random.random() < unmatched_share else project["Name"]
+        snow_items.append(
+            {
+                "sys_id": f"{i:032d}",
+                "short_description": f"Deploy {name} {release_number} PROCESSED",
+                "planned_start_date": (start + timedelta(minutes=15 * random.randint(0, 2000))).strftime("%Y-%m-%d %H:%M:%S"),
+                "assigned_to": "automation",
+                "change_request": "c" * 32,
+                "change_request.type": "normal",
+                "deployment_title": f"Deploy {project['Name']} release {release_number} to Prod",
+            }
+        )
+
+    deployments = []
+    for i in range(deployment_count):
+        snow_item = random.choice(snow_items)
+        queue_time = pytz.utc.localize(datetime.strptime(snow_item["planned_start_date"], "%Y-%m-%d %H:%M:%S"))
+        # one in ten deployments has no change task and is cancelled
+        if i % 10 == 0:
+            queue_time += timedelta(hours=1)
+        deployments.append(
+            {
+                "Id": f"ServerTasks-{i}",
+                "State": "Queued",
+                "Description": snow_item["deployment_title"],
+                "QueueTime": queue_time.strftime("%Y-%m-%dT%H:%M:%S.000%z"),
+            }
+        )
+    return snow_items, deployments
+
+
+def nested_loop_authorize(snow_items: list, deployments: list, catalog) -> None:
+    """
+    authorize_deployments before the change tasks were read into a set, every change task is parsed again
+    for every queued deployment. Kept as the reference the benchmark compares with
+    """
+    from cmadevops_deployment_scheduler.modules.octopus_deploy import (
+        assign_snow_item, cancel_deployment, extract_release, filter_deployments, find_project_name, format_od_time,
+        post_to_webex, resolve_title, to_central_time,
+    )
+
+    for deployment in filter_deployments(deployments):
+        found = False
+        release_number = extract_release(deployment["Description"], catalog=catalog).upper()
+        project_name = find_project_name(deployment["Description"], catalog=catalog).upper()
+
+        for snow_item in snow_items:
+            deployment_time = format_od_time(time_string=deployment["QueueTime"])
+            snow_time = to_central_time(snow_item["planned_start_date"], add_delta=False)
+            snow_project_name, snow_release_number = resolve_title(snow_item["short_description"], catalog=catalog)
+            if (
+                project_name == snow_project_name.upper()
+                and release_number == snow_release_number.upper()
+                and deployment_time == snow_time
+            ):
+                found = True
+                break
+
+        if not found:
+            cancel_deployment(id=deployment["Id"])
+            post_to_webex(message=f"Deployment **{deployment['Description']}** was cancelled")
+            for snow_item in snow_items:
+                if project_name in str(snow_item["short_description"]).upper():
+                    assign_snow_item(snow_item=snow_item, assign_to_queue=True)
+
+
+def timed(authorize, snow_items: list, deployments: list, catalog, clients) -> tuple:
+    """Runs one implementation on fresh copies of the change tasks, returns the time, the writes and what it cancelled"""
+    from cmadevops_deployment_scheduler.modules import octopus_deploy
+
+    stub = StubClient(clients)
+    clients._octopus_client = clients._service_now_client = clients._webex_client = stub
+    octopus_deploy._change_task_writes = None
+    snow_items = [dict(snow_item) for snow_item in snow_items]
+
+    started = time.perf_counter()
+    authorize(snow_items=snow_items, deployments=deployments, catalog=catalog)
+    return time.perf_counter() - started, stub.writes, sorted(stub.cancelled)
+
+
+def main():
+    state_directory = tempfile.mkdtemp()
+    sys.path.insert(0, build_package("http://127.0.0.1:9", state_directory))
+
+    from cmadevops_deployment_scheduler.modules import clients, octopus_deploy
+
+    catalog = octopus_deploy.ProjectCatalog(generate_projects(1000))
+
+    for deployment_count, task_count in SIZES:
+        for unmatched_share in UNMATCHED_SHARES:
+            snow_items, deployments = generate_workload(catalog.projects, deployment_count, task_count, unmatched_share)
+
+            # the catalog indexes are built before the clock starts, as they are on a real run by the time authorize runs
+            timed(octopus_deploy.authorize_deployments, snow_items[:1], deployments[:1], catalog, clients)
+
+            loop_time, loop_writes, loop_cancelled = timed(nested_loop_authorize, snow_items, deployments, catalog, clients)
+            set_time, set_writes, set_cancelled = timed(
+                octopus_deploy.authorize_deployments, snow_items, deployments, catalog, clients
+            )
+            assert loop_cancelled == set_cancelled, "both checks should cancel the same deployments"
+
+            print(
+                f"{deployment_count} deployments x {task_count} change tasks, {unmatched_share:.0%} without an exact project name, "
+                f"{len(set_cancelled)} cancelled"
+            )
+            print(f"  nested loop:           {loop_time * 1000:.0f} ms, {loop_writes} writes")
+            print(f"  authorize_deployments: {set_time * 1000:.0f} ms, {set_writes} writes")
+
+    shutil.rmtree(state_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
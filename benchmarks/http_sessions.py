@@ -0,0 +1,100 @@
+import json
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from scheduler_engines import build_package
+
+# calls made by a typical run, change tasks and their parent changes from ServiceNow,
+# releases, progressions and tasks from Octopus Deploy and the change task updates
+CALLS_PER_RUN = 300
+UPDATES_PER_RUN = 60
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every request with a small json body and keeps the connection open"""
+
+    protocol_version = "HTTP/1.1"
+
+    # a new connection to the real servers also pays for a TLS handshake, this stands in for it
+    connect_delay = 0.0
+
+    def setup(self):
+        time.sleep(self.connect_delay)
+        super().setup()
+        # like the real servers, do not hold back small writes on a kept alive connection
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        body = json.dumps({"result": [{"sys_id": "0" * 32, "short_description": "Deploy Billing 1.0.5"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = respond
+    do_PUT = respond
+
+
+def run(get, put) -> float:
+    """Returns the seconds a run of calls takes, get and put are called with an endpoint"""
+    started = time.perf_counter()
+    for i in range(CALLS_PER_RUN):
+        get(f"/api/now/table/change_task?sysparm_offset={i}").json()
+    for i in range(UPDATES_PER_RUN):
+        put(f"/api/now/table/change_task/{i}", data=json.dumps({"state": "Ready"})).json()
+    return time.perf_counter() - started
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # the pooled case is the ServiceNow client the scheduler ships, built from the config of a temporary package
+    state_directory = tempfile.mkdtemp()
+    sys.path.insert(0, build_package(base_url, state_directory))
+    from cmadevops_deployment_scheduler.modules import clients
+
+    print(f"{CALLS_PER_RUN} reads and {UPDATES_PER_RUN} updates per run")
+    for delay in (0.0, 0.02):
+        StandInHandler.connect_delay = delay
+
+        bare = run(
+            lambda endpoint: requests.get(f"{base_url}{endpoint}", auth=("user", "password")),
+            lambda endpoint, data: requests.put(f"{base_url}{endpoint}", auth=("user", "password"), data=data),
+        )
+
+        # a new client per delay so no connection is left open from the last one
+        clients._service_now_client = None
+        client = clients.service_now_client()
+        pooled = run(client.get, client.put)
+        client.session.close()
+
+        print(f"  {delay * 1000:.0f} ms per new connection")
+        print(f"    bare requests:               {bare * 1000:.0f} ms per run")
+        print(
+            f"    clients.ServiceNowClient:    {pooled * 1000:.0f} ms per run "
+            f"(pool_size {client.session.get_adapter(base_url)._pool_maxsize}, "
+            f"max_concurrency {client.limit._initial_value})"
+        )
+
+    server.shutdown()
+    shutil.rmtree(state_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+# Add the repository root to the Python path so the catalog can be imported without the package installed
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from octopus_catalog import ProjectCatalog
+
+WORDS = [
+    "Billing", "Claims", "Member", "Portal", "API", "Service", "Batch", "Sync", "Gateway", "Provider",
+    "Eligibility", "Pharmacy", "Reporting", "Auth", "Web", "Worker", "Export", "Import", "Audit", "Core",
+]
+
+
+def generate_projects(count: int) -> list:
+    """Builds a list of unique fake Octopus Deploy projects"""
+    random.seed(count)
+    names = set()
+    while len(names) < count:
+        names.add(" ".join(random.sample(WORDS, random.randint(1, 3))) + f" {random.randint(1, 99)}")
+    return [{"Id": f"Projects-{i}", "Name": name, "Slug": name.lower().replace(" ", "-")} for i, name in enumerate(names)]
+
+
+def regex_per_project(od_projects: list, short_description: str) -> str:
+    """The original lookup, one regex per project"""
+    for project in od_projects:
+        if re.search(r"\b{}\b".format(str(project["Name"])), short_description, re.IGNORECASE) is not None:
+            return project["Name"]
+    return ""
+
+
+def catalog_match(catalog: ProjectCatalog, short_description: str) -> str:
+    found = catalog.match(short_description)
+    return found[0]["Name"] if found else ""
+
+
+def measure(function, argument, descriptions: list) -> float:
+    """Returns the average milliseconds per description"""
+    started = time.perf_counter()
+    for description in descriptions:
+        function(argument, description)
+    return (time.perf_counter() - started) * 1000 / len(descriptions)
+
+
+def main():
+    for count in (1000, 10000):
+        od_projects = generate_projects(count)
+        descriptions = [
+            f"Deploy {random.choice(od_projects)['Name']} 2024.{random.randint(1, 12)}.0.{random.randint(1, 500)}"
+            for _ in range(200)
+        ]
+
+        started = time.perf_counter()
+        catalog = ProjectCatalog(od_projects)
+        catalog.match("warm up")
+        build = (time.perf_counter() - started) * 1000
+
+        # the regex cache only holds a few hundred patterns so most lookups recompile
+        before = measure(regex_per_project, od_projects, descriptions)
+        after = measure(catalog_match, catalog, descriptions)
+
+        print(f"{count} projects")
+        print(f"  regex per project: {before:.3f} ms per description")
+        print(f"  catalog matcher:   {after:.3f} ms per description (built once in {build:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
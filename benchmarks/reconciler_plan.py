@@ -0,0 +1,109 @@
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import pytz
+
+from scheduler_engines import build_package
+
+# planning needs no ServiceNow or Octopus Deploy, the snapshot is generated and the plan is computed in memory
+SIZES = (200, 1000, 5000)
+PROJECT_COUNT = 300
+
+
+def generate_snapshot(modules, task_count: int) -> dict:
+    """Builds a snapshot like take_snapshot returns, with change tasks in every state the plan handles"""
+    random.seed(task_count)
+    octopus_deploy, scheduler = modules
+    od_projects = [
+        {"Id": f"Projects-{i}", "Name": f"Claims Service {i}", "Slug": f"claims-service-{i}"} for i in range(PROJECT_COUNT)
+    ]
+    catalog = octopus_deploy.ProjectCatalog(od_projects)
+    start = datetime(2030, 1, 1, 14, 0, 0)
+
+    snow_items = []
+    for i in range(task_count):
+        project = random.choice(od_projects)
+        keyword = random.choice(["", "", "", "", " SKIP", " MANUAL"])
+        snow_items.append(
+            {
+                "sys_id": f"{i:032d}",
+                "task_effective_number": f"CTASK{i:07d}",
+                "short_description": f"Deploy {project['Name']} 2024.1.{random.randint(1, 50)}{keyword}",
+                "planned_start_date": (start + timedelta(minutes=15 * random.randint(0, 2000))).strftime("%Y-%m-%d %H:%M:%S"),
+                # one in four tasks was assigned by an earlier run
+                "assigned_to": "automation" if i % 4 == 0 else "",
+                "change_request": "c" * 32,
+                "change_request.type": "normal",
+            }
+        )
+
+    candidates = [snow_item for snow_item in snow_items if "PROCESSED" not in snow_item["short_description"]]
+    plans = [scheduler.plan_item(snow_item=snow_item, catalog=catalog) for snow_item in candidates]
+
+    # most releases exist and can be promoted, a few are already queued
+    releases, promotions, queued = {}, {}, set()
+    for n, plan in enumerate(plans):
+        if not plan["project_id"] or n % 10 == 0:
+            continue
+        release_id = f"Releases-{plan['project_id']}-{plan['release_number']}"
+        releases[(plan["project_id"], plan["release_number"])] = {
+            "Id": release_id, "ProjectId": plan["project_id"], "ChannelId": "Channels-1"
+        }
+        promotions[release_id] = n % 7 != 0
+        if n % 5 == 0:
+            queued.add((plan["project_name"], plan["release_number"]))
+
+    deployments = []
+    for i, snow_item in enumerate(random.sample(snow_items, task_count // 10)):
+        queue_time = pytz.utc.localize(datetime.strptime(snow_item["planned_start_date"], "%Y-%m-%d %H:%M:%S"))
+        # one in ten deployments has no change task and is cancelled
+        if i % 10 == 0:
+            queue_time += timedelta(hours=1)
+        deployments.append(
+            {
+                "Id": f"ServerTasks-{i}",
+                "State": "Queued",
+                "Description": f"{snow_item['short_description']} release to Prod",
+                "QueueTime": queue_time.strftime("%Y-%m-%dT%H:%M:%S.000%z"),
+            }
+        )
+
+    return {
+        "snow_items": snow_items,
+        "plans": plans,
+        "catalog": catalog,
+        "queued": queued,
+        "deployments": deployments,
+        "releases": releases,
+        "promotions": promotions,
+        "standard": set(),
+    }
+
+
+def main():
+    state_directory = tempfile.mkdtemp()
+    sys.path.insert(0, build_package("http://127.0.0.1:9", state_directory))
+
+    from cmadevops_deployment_scheduler.modules import octopus_deploy, reconciler, scheduler
+
+    for size in SIZES:
+        snapshot = generate_snapshot((octopus_deploy, scheduler), size)
+        started = time.perf_counter()
+        actions = reconciler.plan_changes(snapshot)
+        elapsed = time.perf_counter() - started
+
+        counts = {}
+        for action in actions:
+            counts[action["action"]] = counts.get(action["action"], 0) + 1
+        print(f"{size} change tasks, {len(snapshot['deployments'])} queued deployments: {elapsed * 1000:.0f} ms to plan")
+        print(f"  {', '.join(f'{name}: {count}' for name, count in sorted(counts.items()))}")
+
+    shutil.rmtree(state_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
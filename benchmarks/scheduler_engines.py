@@ -0,0 +1,260 @@
+import asyncio
+import base64
+import json
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlparse
+
+REPO = Path(__file__).parent.parent
+
+# modules of the scheduler package, they are copied into a temporary package since the repository is not installed
+MODULES = [
+    "clients", "local_state", "octopus_catalog", "octopus_deploy", "service_now", "scheduler", "webex",
+    "run_fingerprint", "task_store", "async_engine", "reconciler", "main",
+]
+
+# a workload shaped like a busy release night, change tasks spread over a few projects with a couple of
+# deployments already queued. There is no recording of the real services so the workload is generated
+PROJECT_COUNT = 12
+TASK_COUNT = 48
+RELEASES_PER_PROJECT = 40
+
+# time every call to the stand in services takes, roughly a call to the real servers from the build agent
+LATENCIES = (0.0, 0.02, 0.05)
+
+
+def generate_workload() -> dict:
+    """Builds projects, releases, change tasks and queued deployments for the stand in services"""
+    projects = [
+        {"Id": f"Projects-{i}", "Name": f"Claims Service {i}", "Slug": f"claims-service-{i}", "LastModifiedOn": ""}
+        for i in range(1, PROJECT_COUNT + 1)
+    ]
+    releases = {
+        project["Id"]: [
+            {"Id": f"Releases-{project['Id']}-{v}", "Version": f"2024.1.{v}", "ProjectId": project["Id"], "ChannelId": "Channels-1"}
+            for v in range(RELEASES_PER_PROJECT, 0, -1)
+        ]
+        for project in projects
+    }
+    change_tasks = [
+        {
+            "sys_id": f"{i:032d}",
+            "number": f"CTASK{i:07d}",
+            "task_effective_number": f"CTASK{i:07d}",
+            "short_description": f"Deploy {projects[i % PROJECT_COUNT]['Name']} 2024.1.{i % RELEASES_PER_PROJECT + 1}",
+            "planned_start_date": f"2030-01-{i % 28 + 1:02d} 15:00:00",
+            "planned_end_date": f"2030-01-{i % 28 + 1:02d} 16:00:00",
+            "assigned_to": "",
+            "change_request": "c" * 32,
+            "change_request.type": "normal",
+            "active": "true",
+            "sys_updated_on": "2024-01-01 00:00:00",
+        }
+        for i in range(TASK_COUNT)
+    ]
+    tasks = [
+        {
+            "Id": f"ServerTasks-{i}",
+            "State": "Queued",
+            "Name": "Deploy",
+            "Description": f"Deploy {projects[i]['Name']} release 2024.1.1 to Prod",
+            "QueueTime": "2030-02-01T15:00:00.000+00:00",
+        }
+        for i in range(2)
+    ]
+    return {"projects": projects, "releases": releases, "change_tasks": change_tasks, "tasks": tasks}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers the ServiceNow, Octopus Deploy and Webex calls of a run from the workload"""
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    workload = {}
+
+    def setup(self):
+        super().setup()
+        # like the real servers, do not hold back small writes on a kept alive connection
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, body, status: int = 200, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def page(self, items: list, query: dict, path: str) -> dict:
+        skip, take = int(query.get("skip", ["0"])[0]), int(query.get("take", ["30"])[0])
+        body = {"Items": items[skip : skip + take], "TotalResults": len(items), "Links": {}}
+        if skip + take < len(items):
+            next_query = {name: values[0] for name, values in query.items()}
+            next_query.update(skip=skip + take, take=take)
+            body["Links"]["Page.Next"] = f"{path}?{urlencode(next_query)}"
+        return body
+
+    def respond(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query, path = parse_qs(url.query), url.path
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        workload = self.workload
+
+        if path == "/api/now/stats/change_task":
+            return self.send({"result": {"stats": {"count": str(len(workload["change_tasks"])), "max": {"sys_updated_on": "2024-01-01 00:00:00"}}}})
+        if path == "/api/now/table/change_task" and self.command == "GET":
+            items = workload["change_tasks"]
+            return self.send({"result": items}, headers={"X-Total-Count": str(len(items))})
+        if path.startswith("/api/now/table/change_task/"):
+            return self.send({"result": json.loads(raw or b"{}")})
+        if path == "/api/now/v1/batch":
+            body = json.loads(raw)
+            serviced = [{"id": r["id"], "status_code": 200, "body": base64.b64encode(b"{}").decode()} for r in body["rest_requests"]]
+            return self.send({"batch_request_id": body["batch_request_id"], "serviced_requests": serviced, "unserviced_requests": []})
+        if path == "/api/now/table/change_request":
+            return self.send({"result": [{"sys_id": "c" * 32, "type": "normal"}]}, headers={"X-Total-Count": "1"})
+        if path == "/api/projects":
+            return self.send(self.page(workload["projects"], query, path))
+        found = re.match(r"/api/projects/([^/]+)/releases/(.+)$", path)
+        if found:
+            release = [r for r in workload["releases"].get(found.group(1), []) if r["Version"] == found.group(2)]
+            return self.send(release[0]) if release else self.send({"ErrorMessage": "not found"}, status=404)
+        found = re.match(r"/api/projects/([^/]+)/releases$", path)
+        if found:
+            return self.send(self.page(workload["releases"].get(found.group(1), []), query, path))
+        if re.match(r"/api/releases/.+/progression$", path):
+            return self.send({"Phases": [{"Name": "Prod", "Blocked": False, "Progress": "Current"}]})
+        if path == "/api/tasks":
+            return self.send(self.page(workload["tasks"], query, path))
+        if path == "/api/deployments":
+            return self.send({"Id": "Deployments-1", "TaskId": "ServerTasks-1"}, status=201)
+        if re.match(r"/api/tasks/.+/cancel$", path):
+            return self.send({})
+        if path == "/api/events":
+            return self.send({"Items": [], "Links": {}})
+        # webex messages
+        return self.send({})
+
+    do_GET = respond
+    do_POST = respond
+    do_PUT = respond
+
+
+def build_package(base_url: str, state_directory: str) -> str:
+    """
+    Copies the scheduler modules into a temporary cmadevops_deployment_scheduler package
+    with a config pointing at the stand in services, returns the directory to put on the path
+    """
+    root = tempfile.mkdtemp()
+    package = Path(root, "cmadevops_deployment_scheduler")
+    (package / "modules").mkdir(parents=True)
+    (package / "config").mkdir()
+    for directory in (package, package / "modules", package / "config"):
+        (directory / "__init__.py").write_text("")
+
+    for module in MODULES:
+        shutil.copy(REPO / f"{module}.py", package / "modules" / f"{module}.py")
+    (package / "modules" / "logwrite.py").write_text("def log(message):\n    pass\n")
+
+    config = {
+        "BaseUrl": base_url,
+        "QueryChangeTaskEndpoint": "/api/now/table/change_task?sysparm_query=",
+        "UpdateChangeTaskEndpoint": "/api/now/table/change_task",
+        "ChsDevOpsSoftwareSolutionsId": "group",
+        "AutomationUserId": "automation",
+        "OctopusDeployApiKey": "API-KEY",
+        "OctopusDeployBaseUrl": base_url,
+        "ReleaseEndpoint": "/api/releases",
+        "TasksEndpoint": "/api/tasks",
+        "DeploymentsEndpoint": "/api/deployments",
+        "ProjectsEndpoint": "/api/projects",
+        "ApiAuthentication": {"Username": "user", "Password": "password"},
+        "ProductionEnvironmentId": "Environments-1",
+        "WebexUrl": f"{base_url}/v1/messages",
+        "WebexRoom": "room",
+        "Bearer": "token",
+        "StateDirectory": state_directory,
+    }
+    (package / "config" / "config.py").write_text(f"scheduler_config = {config!r}\n")
+    return root
+
+
+def reset(modules: dict) -> None:
+    """Forgets everything a run keeps, so every run starts like a new process"""
+    for module in modules.values():
+        if getattr(module, "_task_store", None) is not None:
+            module._task_store.close()
+    for state in ("_project_catalog", "_release_index", "_release_index_changed", "_task_index", "_change_task_snapshot", "_change_task_writes", "_task_store", "_service_now_client", "_octopus_client", "_webex_client"):
+        for module in modules.values():
+            if hasattr(module, state):
+                setattr(module, state, None)
+    for cache in ("_release_cache", "_progression_cache", "_parent_changes"):
+        for module in modules.values():
+            if isinstance(getattr(module, cache, None), dict):
+                getattr(module, cache).clear()
+    for module in modules.values():
+        if isinstance(getattr(module, "_release_index_synced", None), set):
+            module._release_index_synced.clear()
+
+
+def timed(run, modules: dict, state_directory: str) -> float:
+    """Returns the seconds a run takes, with no state left by an earlier run"""
+    shutil.rmtree(state_directory, ignore_errors=True)
+    reset(modules)
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+def main():
+    StandInHandler.workload = generate_workload()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    state_directory = tempfile.mkdtemp()
+    sys.path.insert(0, build_package(base_url, state_directory))
+
+    import os
+
+    os.environ.setdefault("ASPNETCORE_ENVIRONMENT", "benchmark")
+    from cmadevops_deployment_scheduler.modules import async_engine, reconciler, main as scheduler_main
+
+    modules = {
+        name: sys.modules[f"cmadevops_deployment_scheduler.modules.{name}"]
+        for name in MODULES
+        if f"cmadevops_deployment_scheduler.modules.{name}" in sys.modules
+    }
+
+    print(f"{TASK_COUNT} change tasks over {PROJECT_COUNT} projects per run")
+    for latency in LATENCIES:
+        StandInHandler.latency = latency
+        sync = timed(scheduler_main.run, modules, state_directory)
+        async_ = timed(lambda: asyncio.run(async_engine.run_async()), modules, state_directory)
+        reconcile = timed(reconciler.run_reconciler, modules, state_directory)
+
+        print(f"  {latency * 1000:.0f} ms per call")
+        print(f"    sync engine:  {sync * 1000:.0f} ms per run")
+        print(f"    async engine: {async_ * 1000:.0f} ms per run")
+        print(f"    reconciler:   {reconcile * 1000:.0f} ms per run")
+
+    server.shutdown()
+    shutil.rmtree(state_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import base64
+import json
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from cmadevops_deployment_scheduler.config.config import scheduler_config
+from cmadevops_deployment_scheduler.modules.logwrite import log
+
+# clients shared by every helper for the lifetime of the run, created on first use
+_octopus_client = None
+_service_now_client = None
+_webex_client = None
+
+# items are scheduled on several threads, so a client is only ever created by one of them
+_clients_lock = threading.Lock()
+
+# when set every read is made but writes are only logged and answered with a made up success, see enable_dry_run
+_dry_run = False
+
+# calls made by the run grouped by phase, created on first use
+_call_report = None
+
+
+def enable_dry_run(enabled: bool = True) -> None:
+    """
+    Turns dry run on or off for every client, in a dry run nothing is changed in ServiceNow, Octopus Deploy or Webex
+        Parameters:
+            enabled: if set to false writes are sent again
+    """
+    global _dry_run
+    _dry_run = enabled
+
+
+def dry_run_enabled() -> bool:
+    """Checks if the run is a dry run"""
+    return _dry_run
+
+
+def fake_response(status_code: int, body: dict) -> requests.Response:
+    """
+    Builds the response a write gets in a dry run
+        Parameters:
+            status_code: status code the service answers a successful write with
+            body: json body of the response
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.encoding = "utf-8"
+    response._content = json.dumps(body).encode()
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+
+def body_size(body) -> int:
+    """Number of bytes in a request body"""
+    if not body:
+        return 0
+    return len(body.encode() if isinstance(body, str) else body)
+
+
+class CallReport:
+    """
+    Counts the HTTP calls, bytes and time of the run by phase, the entry points name the phases as they go
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.current = ""
+        self.phase_started = time.perf_counter()
+        self.phase("START")
+
+    def phase(self, name: str) -> None:
+        """
+        Starts a phase, calls are counted against it until the next phase starts
+            Parameters:
+                name: name of the phase in the report
+        """
+        with self.lock:
+            now = time.perf_counter()
+            if self.current:
+                self.phases[self.current]["Seconds"] += now - self.phase_started
+            self.current = name
+            self.phase_started = now
+            self.phases.setdefault(
+                name, {"Calls": 0, "Writes": 0, "BytesSent": 0, "BytesReceived": 0, "HttpSeconds": 0.0, "Seconds": 0.0}
+            )
+
+    def record(self, method: str, sent: int, received: int, seconds: float) -> None:
+        """
+        Adds a call to the current phase
+            Parameters:
+                method: HTTP method of the call
+                sent: bytes in the request body
+                received: bytes in the response body
+                seconds: time the call took
+        """
+        with self.lock:
+            counts = self.phases[self.current]
+            counts["Calls"] += 1
+            counts["Writes"] += method != "GET"
+            counts["BytesSent"] += sent
+            counts["BytesReceived"] += received
+            counts["HttpSeconds"] += seconds
+
+    def summary(self) -> str:
+        """Report of every phase that made calls or took time, and the total"""
+        self.phase(self.current)
+        with self.lock:
+            phases = {name: counts for name, counts in self.phases.items() if counts["Calls"] or counts["Seconds"] >= 0.001}
+            total = {field: sum(counts[field] for counts in phases.values()) for field in next(iter(self.phases.values()))}
+
+        lines = [f"{'PHASE':<34}{'CALLS':>7}{'WRITES':>8}{'SENT':>12}{'RECEIVED':>12}{'HTTP':>10}{'TIME':>10}"]
+        for name, counts in list(phases.items()) + [("TOTAL", total)]:
+            lines.append(
+                f"{name:<34}{counts['Calls']:>7}{counts['Writes']:>8}{counts['BytesSent']:>12}{counts['BytesReceived']:>12}"
+                f"{counts['HttpSeconds']:>9.2f}s{counts['Seconds']:>9.2f}s"
+            )
+        return "\n".join(lines) + "\n"
+
+
+def call_report() -> CallReport:
+    """Gets the call report for the run"""
+    global _call_report
+
+    with _clients_lock:
+        if _call_report is None:
+            _call_report = CallReport()
+    return _call_report
+
+
+class ServiceClient:
+    """
+    HTTP client for a single service, every call goes through one pooled session so
+    connections are kept alive and reused instead of doing a new TCP and TLS handshake per call
+        Parameters:
+            base_url: base url of the service, endpoints are added to it
+            headers: headers sent with every request
+            auth: username and password sent with every request
+            verify: verify the TLS certificate of the service
+            pool_size: max number of connections kept open to the service
+            max_concurrency: max number of calls in flight to the service at once across every thread
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: dict = None,
+        auth: tuple = None,
+        verify: bool = True,
+        pool_size: int = 10,
+        max_concurrency: int = None,
+    ):
+        self.base_url = str(base_url or "").rstrip("/")
+        self.limit = threading.BoundedSemaphore(max_concurrency or pool_size)
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        self.session.auth = auth
+        self.session.verify = verify
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, endpoint: str) -> str:
+        # links handed back by the service are already full urls
+        if endpoint.startswith("http://") or endpoint.startswith("https://"):
+            return endpoint
+        return f"{self.base_url}{endpoint}"
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        url = self.url(endpoint)
+
+        if method != "GET" and dry_run_enabled():
+            # the body is built the same way requests would so the log shows what would have been sent
+            prepared = requests.Request(
+                method, url, params=kwargs.get("params"), data=kwargs.get("data"), json=kwargs.get("json")
+            ).prepare()
+            body = prepared.body.decode() if isinstance(prepared.body, bytes) else prepared.body or ""
+            call_report().record(method, sent=body_size(body), received=0, seconds=0.0)
+            return self.dry_run_response(method, prepared.url, body, kwargs.get("json") or kwargs.get("data"))
+
+        started = time.perf_counter()
+
+        # callers over the limit wait for a call to finish instead of piling onto the service
+        with self.limit:
+            response = self.session.request(method, url, **kwargs)
+
+        call_report().record(
+            method,
+            sent=body_size(response.request.body),
+            received=len(response.content),
+            seconds=time.perf_counter() - started,
+        )
+        return response
+
+    def dry_run_response(self, method: str, url: str, body: str, payload=None) -> requests.Response:
+        """
+        Logs a write of a dry run and answers it the way the service answers a successful one
+            Parameters:
+                method: HTTP method of the write
+                url: url of the write
+                body: body of the write as it would have been sent
+                payload: json or form data the body was built from
+        """
+        log(f"DRY RUN {method} {url} {json.dumps(payload) if isinstance(payload, (dict, list)) else body}\n")
+        return fake_response(200, {})
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, **kwargs)
+
+    def put(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("PUT", endpoint, **kwargs)
+
+
+class OctopusClient(ServiceClient):
+    """Client for the Octopus Deploy API, authenticated with the API key from config"""
+
+    def __init__(self):
+        super().__init__(
+            base_url=scheduler_config["OctopusDeployBaseUrl"],
+            headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
+            verify=False,
+            pool_size=int(scheduler_config.get("HttpPoolSize", 10)),
+            max_concurrency=int(scheduler_config.get("OctopusMaxConcurrency", 4)),
+        )
+
+    def dry_run_response(self, method: str, url: str, body: str, payload=None) -> requests.Response:
+        response = super().dry_run_response(method, url, body, payload)
+
+        # a new deployment is created, every other write is an action on something that exists
+        if url == self.url(scheduler_config["DeploymentsEndpoint"]):
+            return fake_response(201, {"Id": "Deployments-DryRun", "TaskId": "ServerTasks-DryRun"})
+        return response
+
+
+class ServiceNowClient(ServiceClient):
+    """Client for the ServiceNow Table API, authenticated with the automation account from config"""
+
+    def __init__(self):
+        super().__init__(
+            base_url=scheduler_config["BaseUrl"],
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            auth=(
+                scheduler_config["ApiAuthentication"]["Username"],
+                scheduler_config["ApiAuthentication"]["Password"],
+            ),
+            pool_size=int(scheduler_config.get("HttpPoolSize", 10)),
+            max_concurrency=int(scheduler_config.get("ServiceNowMaxConcurrency", 4)),
+        )
+
+    def dry_run_response(self, method: str, url: str, body: str, payload=None) -> requests.Response:
+        if url != self.url(scheduler_config.get("BatchEndpoint", "/api/now/v1/batch")):
+            super().dry_run_response(method, url, body, payload)
+            return fake_response(200, {"result": json.loads(body or "{}")})
+
+        # every update in a batch is logged on its own, the batch API has their bodies base64 encoded
+        batch = json.loads(body)
+        for rest_request in batch["rest_requests"]:
+            log(
+                f"DRY RUN {rest_request['method']} {self.url(rest_request['url'])} "
+                f"{base64.b64decode(rest_request['body']).decode()} (batch)\n"
+            )
+        return fake_response(
+            200,
+            {
+                "batch_request_id": batch["batch_request_id"],
+                "serviced_requests": [
+                    {"id": rest_request["id"], "status_code": 200} for rest_request in batch["rest_requests"]
+                ],
+                "unserviced_requests": [],
+            },
+        )
+
+
+class WebexClient(ServiceClient):
+    """Client for the Webex messages API, the room token is sent with each message"""
+
+    def __init__(self):
+        super().__init__(
+            base_url="",
+            pool_size=int(scheduler_config.get("HttpPoolSize", 10)),
+            max_concurrency=int(scheduler_config.get("WebexMaxConcurrency", 2)),
+        )
+
+
+def octopus_client() -> OctopusClient:
+    """Gets the Octopus Deploy client for the run"""
+    global _octopus_client
+
+    with _clients_lock:
+        if _octopus_client is None:
+            _octopus_client = OctopusClient()
+    return _octopus_client
+
+
+def service_now_client() -> ServiceNowClient:
+    """Gets the ServiceNow client for the run"""
+    global _service_now_client
+
+    with _clients_lock:
+        if _service_now_client is None:
+            _service_now_client = ServiceNowClient()
+    return _service_now_client
+
+
+def webex_client() -> WebexClient:
+    """Gets the Webex client for the run"""
+    global _webex_client
+
+    with _clients_lock:
+        if _webex_client is None:
+            _webex_client = WebexClient()
+    return _webex_client
@@ -1,9 +1,21 @@
 import os
 import sys
+import argparse
+import asyncio
 import re
+import base64
 import json
+import urllib.parse
+import uuid
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from collections import Counter
+from difflib import SequenceMatcher
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone, tzinfo
 import pytz
 from pytz import BaseTzInfo, utc
@@ -155,17 +167,396 @@ INSTANCE_URL = os.getenv("SERVICENOW_INSTANCE_URL", "https://service-now.com")
 USERNAME = os.getenv("SERVICENOW_USERNAME", "")
 PASSWORD = os.getenv("SERVICENOW_PASSWORD", "")
 
+# ---- HTTP clients ----
+# every call to the same host goes through one pooled session so connections are kept alive
+# and reused instead of doing a new TCP and TLS handshake per call
+_octopus_client = None
+_service_now_client = None
+_instance_client = None
+_webex_client = None
+
+# items are scheduled on several threads, so a client is only ever created by one of them
+_clients_lock = threading.Lock()
+
+# when set every read is made but writes are only logged and answered with a made up success, see enable_dry_run
+_dry_run = False
+
+# calls made by the run grouped by phase, created on first use
+_call_report = None
+
+def enable_dry_run(enabled: bool = True) -> None:
+    """
+    Turns dry run on or off for every client, in a dry run nothing is changed in ServiceNow, Octopus Deploy or Webex
+        Parameters:
+            enabled: if set to false writes are sent again
+    """
+    global _dry_run
+    _dry_run = enabled
+
+def dry_run_enabled() -> bool:
+    """Checks if the run is a dry run"""
+    return _dry_run
+
+def fake_response(status_code: int, body: dict) -> requests.Response:
+    """
+    Builds the response a write gets in a dry run
+        Parameters:
+            status_code: status code the service answers a successful write with
+            body: json body of the response
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.encoding = "utf-8"
+    response._content = json.dumps(body).encode()
+    response.headers["Content-Type"] = "application/json"
+    return response
+
+def body_size(body) -> int:
+    """Number of bytes in a request body"""
+    if not body:
+        return 0
+    return len(body.encode() if isinstance(body, str) else body)
+
+class CallReport:
+    """
+    Counts the HTTP calls, bytes and time of the run by phase, the entry points name the phases as they go
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.current = ""
+        self.phase_started = time.perf_counter()
+        self.phase("START")
+
+    def phase(self, name: str) -> None:
+        """
+        Starts a phase, calls are counted against it until the next phase starts
+            Parameters:
+                name: name of the phase in the report
+        """
+        with self.lock:
+            now = time.perf_counter()
+            if self.current:
+                self.phases[self.current]["Seconds"] += now - self.phase_started
+            self.current = name
+            self.phase_started = now
+            self.phases.setdefault(
+                name, {"Calls": 0, "Writes": 0, "BytesSent": 0, "BytesReceived": 0, "HttpSeconds": 0.0, "Seconds": 0.0}
+            )
+
+    def record(self, method: str, sent: int, received: int, seconds: float) -> None:
+        """
+        Adds a call to the current phase
+            Parameters:
+                method: HTTP method of the call
+                sent: bytes in the request body
+                received: bytes in the response body
+                seconds: time the call took
+        """
+        with self.lock:
+            counts = self.phases[self.current]
+            counts["Calls"] += 1
+            counts["Writes"] += method != "GET"
+            counts["BytesSent"] += sent
+            counts["BytesReceived"] += received
+            counts["HttpSeconds"] += seconds
+
+    def summary(self) -> str:
+        """Report of every phase that made calls or took time, and the total"""
+        self.phase(self.current)
+        with self.lock:
+            phases = {name: counts for name, counts in self.phases.items() if counts["Calls"] or counts["Seconds"] >= 0.001}
+            total = {field: sum(counts[field] for counts in phases.values()) for field in next(iter(self.phases.values()))}
+
+        lines = [f"{'PHASE':<34}{'CALLS':>7}{'WRITES':>8}{'SENT':>12}{'RECEIVED':>12}{'HTTP':>10}{'TIME':>10}"]
+        for name, counts in list(phases.items()) + [("TOTAL", total)]:
+            lines.append(
+                f"{name:<34}{counts['Calls']:>7}{counts['Writes']:>8}{counts['BytesSent']:>12}{counts['BytesReceived']:>12}"
+                f"{counts['HttpSeconds']:>9.2f}s{counts['Seconds']:>9.2f}s"
+            )
+        return "\n".join(lines)
+
+def call_report() -> CallReport:
+    """Gets the call report for the run"""
+    global _call_report
+
+    with _clients_lock:
+        if _call_report is None:
+            _call_report = CallReport()
+    return _call_report
+
+class ServiceClient:
+    """
+    HTTP client for a single service, every call goes through one pooled session so
+    connections are kept alive and reused instead of doing a new TCP and TLS handshake per call
+        Parameters:
+            base_url: base url of the service, endpoints are added to it
+            headers: headers sent with every request
+            auth: username and password sent with every request
+            verify: verify the TLS certificate of the service
+            pool_size: max number of connections kept open to the service
+            max_concurrency: max number of calls in flight to the service at once across every thread
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: dict = None,
+        auth: tuple = None,
+        verify: bool = True,
+        pool_size: int = 10,
+        max_concurrency: int = None,
+    ):
+        self.base_url = str(base_url or "").rstrip("/")
+        self.limit = threading.BoundedSemaphore(max_concurrency or pool_size)
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        self.session.auth = auth
+        self.session.verify = verify
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, endpoint: str) -> str:
+        # links handed back by the service are already full urls
+        if endpoint.startswith("http://") or endpoint.startswith("https://"):
+            return endpoint
+        return f"{self.base_url}{endpoint}"
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        url = self.url(endpoint)
+
+        if method != "GET" and dry_run_enabled():
+            # the body is built the same way requests would so the log shows what would have been sent
+            prepared = requests.Request(
+                method, url, params=kwargs.get("params"), data=kwargs.get("data"), json=kwargs.get("json")
+            ).prepare()
+            body = prepared.body.decode() if isinstance(prepared.body, bytes) else prepared.body or ""
+            call_report().record(method, sent=body_size(body), received=0, seconds=0.0)
+            return self.dry_run_response(method, prepared.url, body, kwargs.get("json") or kwargs.get("data"))
+
+        started = time.perf_counter()
+
+        # callers over the limit wait for a call to finish instead of piling onto the service
+        with self.limit:
+            response = self.session.request(method, url, **kwargs)
+
+        call_report().record(
+            method,
+            sent=body_size(response.request.body),
+            received=len(response.content),
+            seconds=time.perf_counter() - started,
+        )
+        return response
+
+    def dry_run_response(self, method: str, url: str, body: str, payload=None) -> requests.Response:
+        """
+        Logs a write of a dry run and answers it the way the service answers a successful one
+            Parameters:
+                method: HTTP method of the write
+                url: url of the write
+                body: body of the write as it would have been sent
+                payload: json or form data the body was built from
+        """
+        # every update in a batch is logged on its own, the batch API has their bodies base64 encoded
+        if url.endswith(scheduler_config.get("BatchEndpoint", "/api/now/v1/batch")):
+            batch = json.loads(body)
+            for rest_request in batch["rest_requests"]:
+                log(
+                    f"DRY RUN {rest_request['method']} {self.url(rest_request['url'])} "
+                    f"{base64.b64decode(rest_request['body']).decode()} (batch)"
+                )
+            return fake_response(
+                200,
+                {
+                    "batch_request_id": batch["batch_request_id"],
+                    "serviced_requests": [
+                        {"id": rest_request["id"], "status_code": 200} for rest_request in batch["rest_requests"]
+                    ],
+                    "unserviced_requests": [],
+                },
+            )
+
+        log(f"DRY RUN {method} {url} {json.dumps(payload) if isinstance(payload, (dict, list)) else body}")
+
+        # a new deployment is created, every other write is an action on something that exists
+        if url.endswith(scheduler_config["DeploymentsEndpoint"]):
+            return fake_response(201, {"Id": "Deployments-DryRun", "TaskId": "ServerTasks-DryRun"})
+        if method == "PUT":
+            return fake_response(200, {"result": json.loads(body or "{}")})
+        return fake_response(200, {})
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, **kwargs)
+
+    def put(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("PUT", endpoint, **kwargs)
+
+def octopus_client():
+    """Gets the Octopus Deploy client for the run"""
+    global _octopus_client
+
+    with _clients_lock:
+        if _octopus_client is None:
+            _octopus_client = ServiceClient(
+                base_url=scheduler_config["OctopusDeployBaseUrl"],
+                headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
+                verify=False,
+                pool_size=int(scheduler_config.get("HttpPoolSize", 10)),
+                max_concurrency=int(scheduler_config.get("OctopusMaxConcurrency", 4)),
+            )
+    return _octopus_client
+
+def service_now_client():
+    """Gets the ServiceNow client for the run, authenticated with the automation account from config"""
+    global _service_now_client
+
+    with _clients_lock:
+        if _service_now_client is None:
+            _service_now_client = ServiceClient(
+                base_url=scheduler_config["BaseUrl"],
+                headers={"Accept": "application/json", "Content-Type": "application/json"},
+                auth=(
+                    scheduler_config["ApiAuthentication"]["Username"],
+                    scheduler_config["ApiAuthentication"]["Password"],
+                ),
+                pool_size=int(scheduler_config.get("HttpPoolSize", 10)),
+                max_concurrency=int(scheduler_config.get("ServiceNowMaxConcurrency", 4)),
+            )
+    return _service_now_client
+
+def instance_client():
+    """Gets the ServiceNow client for the table reads, authenticated with the SERVICENOW_* environment variables"""
+    global _instance_client
+
+    with _clients_lock:
+        if _instance_client is None:
+            _instance_client = ServiceClient(
+                base_url=INSTANCE_URL,
+                headers={"Accept": "application/json"},
+                auth=HTTPBasicAuth(USERNAME, PASSWORD),
+                max_concurrency=int(scheduler_config.get("ServiceNowMaxConcurrency", 4)),
+            )
+    return _instance_client
+
+def webex_client():
+    """Gets the Webex client for the run, the room token is sent with each message"""
+    global _webex_client
+
+    with _clients_lock:
+        if _webex_client is None:
+            _webex_client = ServiceClient(
+                base_url="",
+                pool_size=int(scheduler_config.get("HttpPoolSize", 10)),
+                max_concurrency=int(scheduler_config.get("WebexMaxConcurrency", 2)),
+            )
+    return _webex_client
+
+# the only change task fields the scheduler reads, everything else is left on the server
+CHANGE_TASK_FIELDS = [
+    "sys_id",
+    "number",
+    "task_effective_number",
+    "short_description",
+    "planned_start_date",
+    "planned_end_date",
+    "assigned_to",
+    "change_request",
+    # dot-walked so a standard change can be spotted without reading the parent change
+    "change_request.type",
+]
+
+# keywords that defines an action item, the change task query only returns tasks with one of them
+ACTION_KEYWORDS = ["DEPLOY", "RELEASE", "MANUAL", "SKIP"]
+
+# the parent change is only read to find out if it is a standard change
+PARENT_CHANGE_FIELDS = ["sys_id", "type"]
+
+# parent changes read during the run keyed by sys_id, many change tasks share the same parent
+_parent_changes = {}
+
+# change task updates waiting to be sent through the batch API, created on first use
+_change_task_writes = None
+_change_task_writes_lock = threading.Lock()
+
+def parent_change_id(snow_item: dict) -> str:
+    """
+    Gets the sys_id of the parent change of a change task
+        Parameters:
+            snow_item: change task from ServiceNow, change_request is either a reference link or a plain sys_id
+    """
+    change_request = snow_item.get("change_request") or ""
+    if isinstance(change_request, dict):
+        change_request = change_request.get("value") or link_sys_id(change_request.get("link", ""))
+    return change_request
+
+def link_sys_id(link: str) -> str:
+    # the sys_id is the last part of the path of a record link
+    return urllib.parse.urlparse(str(link)).path.rstrip("/").split("/")[-1]
+
+def parent_change_type(snow_item: dict) -> str:
+    """
+    Gets the type of the parent change dot-walked from a change task, None if it was not read with the task
+        Parameters:
+            snow_item: change task from ServiceNow
+    """
+    change_type = snow_item.get("change_request.type")
+    if isinstance(change_type, dict):
+        change_type = change_type.get("value")
+    return change_type
+
+def parent_change_link(snow_item: dict) -> str:
+    """
+    Builds the link to the parent change of a change task
+        Parameters:
+            snow_item: change task from ServiceNow, change_request is either a reference link or a plain sys_id
+    """
+    change_request = snow_item.get("change_request") or ""
+    if isinstance(change_request, dict):
+        if change_request.get("link"):
+            return change_request["link"]
+        change_request = change_request.get("value", "")
+
+    if not change_request:
+        return ""
+
+    return f"{scheduler_config['BaseUrl']}{scheduler_config.get('ChangeRequestEndpoint', '/api/now/table/change_request')}/{change_request}"
+
+def assigned_to_id(task: dict) -> str:
+    """
+    Gets the sys_id of the user a change task is assigned to, empty if it is not assigned
+        Parameters:
+            task: change task from ServiceNow, assigned_to is either a reference link or a plain sys_id
+    """
+    assigned_to = task.get("assigned_to") or ""
+    if isinstance(assigned_to, dict):
+        assigned_to = assigned_to.get("value", "")
+    return assigned_to
+
+def assigned_to_automation(task: dict) -> bool:
+    """
+    Checks if a change task is assigned to the automation account
+        Parameters:
+            task: change task from ServiceNow
+    """
+    return assigned_to_id(task) == scheduler_config["AutomationUserId"]
+
 def get_servicenow_data(endpoint, params=None):
     """
     Makes a GET request to the ServiceNow API using basic authentication.
     """
     url = f"{INSTANCE_URL}{endpoint}"
-    headers = {"Accept": "application/json"}
     print(f"[INFO] Requesting URL: {url}")
     if params:
         print(f"[INFO] With parameters: {params}")
     try:
-        response = requests.get(url, auth=HTTPBasicAuth(USERNAME, PASSWORD), headers=headers, params=params)
+        response = instance_client().get(endpoint, params=params)
         response.raise_for_status()
         print("[SUCCESS] Data retrieved successfully.")
         return response.json()
@@ -173,28 +564,72 @@ def get_servicenow_data(endpoint, params=None):
         print(f"[ERROR] Request failed: {e}")
         return {"error": str(e)}
 
+def iter_servicenow_records(endpoint, params=None, page_size=None, client=None):
+    """
+    Yields the records of a ServiceNow table a page at a time. Pages are read in sys_id order starting after
+    the last record of the previous page, so records that are updated while we go through them are not skipped
+    """
+    client = client or instance_client()
+    params = dict(params or {})
+    page_size = page_size or int(scheduler_config.get("SnowPageSize", 200))
+    query = params.pop("sysparm_query", "")
+    last_sys_id = ""
+
+    while True:
+        page_query = f"sys_id>{last_sys_id}^ORDERBYsys_id" if last_sys_id else "ORDERBYsys_id"
+        params["sysparm_query"] = f"{query}^{page_query}" if query else page_query
+        params["sysparm_limit"] = str(page_size)
+
+        try:
+            response = client.get(endpoint, params=params)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"[ERROR] Request failed: {e}")
+            return
+
+        records = response.json().get("result", [])
+        for record in records:
+            yield record
+
+        # X-Total-Count is the number of records left from this page on, when they all fit on this page we are done
+        remaining = int(response.headers.get("X-Total-Count", len(records) + 1))
+        if len(records) < page_size or len(records) >= remaining:
+            return
+
+        last_sys_id = records[-1]["sys_id"]
+
 def get_unassigned_tasks():
     """
     Retrieves unassigned tasks from the ServiceNow task table.
     """
     print("\n[INFO] Fetching unassigned tasks...")
-    endpoint = "/api/now/table/change_task?sysparm_query="
+    endpoint = "/api/now/table/change_task"
     params = {
         "sysparm_query": "assigned_toISEMPTY",
-        "sysparm_limit": "10"
+        "sysparm_fields": ",".join(CHANGE_TASK_FIELDS),
+        "sysparm_exclude_reference_link": "true",
     }
-    return get_servicenow_data(endpoint, params)
+    return {"result": list(iter_servicenow_records(endpoint, params))}
 
 def get_change_tasks():
     """
-    Retrieves change tasks from the ServiceNow change_task table.
+    Retrieves the active change tasks of the group that are unassigned or assigned to automation from the
+    ServiceNow change_task table. They are read once per run and split into assigned and unassigned in memory
     """
     print("\n[INFO] Fetching change tasks...")
     endpoint = "/api/now/table/change_task"
     params = {
-        "sysparm_limit": "10"
+        "sysparm_query": (
+            f"assigned_toISEMPTY^ORassigned_to={scheduler_config['AutomationUserId']}"
+            f"^active=true^assignment_group={scheduler_config['ChsDevOpsSoftwareSolutionsId']}"
+            # tasks the scheduler does not act on are left on the server, action_item still checks every task
+            "^short_descriptionNOT LIKEIGNORE^"
+            + "^OR".join(f"short_descriptionLIKE{keyword}" for keyword in ACTION_KEYWORDS)
+        ),
+        "sysparm_fields": ",".join(CHANGE_TASK_FIELDS),
+        "sysparm_exclude_reference_link": "true",
     }
-    return get_servicenow_data(endpoint, params)
+    return {"result": list(iter_servicenow_records(endpoint, params))}
 
 def convert_utc_offset(date_string: str):
     """
@@ -245,49 +680,88 @@ def action_item(snow_item: str) -> bool:
         if "IGNORE" in snow_item:
             return False
 
-        # keywords that defines an action item
-        keywords = ["DEPLOY", "RELEASE", "MANUAL", "SKIP"]
-
         # find keyword
-        for k in keywords:
+        for k in ACTION_KEYWORDS:
             if k in snow_item:
                 return True
 
     # if this is reached no keyword was found
     return False
 
-def is_a_standard_change(short_description: str, parent_link: str) -> bool:
+def is_a_standard_change(short_description: str, parent_link: str, change_type: str = None) -> bool:
     """Verifies if a project is a standard change
         by checking the short description for SSIS and that the parent change is a type=standard
     Args:
         short_description (str): Short description from ServiceNow
-        parent_link (srt): comes from change_request.link in CTASK json
+        parent_link (srt): link to the parent change, see parent_change_link()
+        change_type (str): type of the parent change if it was read with the change task,
+            the parent change is only read when this is not passed in
 
     Returns:
         bool: true or false
     """
-    found = False
-    chg_record = retrieve_parent_change(parent_link)
-    if re.search(r"(ssis)", short_description, re.IGNORECASE):
-        if chg_record["type"] == "standard":
-            found = True
+    # only SSIS tasks can be standard changes, so the parent change is not needed for anything else
+    if not re.search(r"(ssis)", short_description, re.IGNORECASE):
+        return False
+
+    if change_type is None:
+        change_type = retrieve_parent_change(parent_link)["type"]
+
+    return change_type == "standard"
+
+def prefetch_parent_changes(snow_items: list) -> None:
+    """
+    Reads the parent changes of a batch of change tasks with one sys_idIN query per page
+    and keeps them for retrieve_parent_change
+        Parameters:
+            snow_items: change tasks from ServiceNow
+    """
+    missing = list(
+        dict.fromkeys(
+            sys_id
+            for sys_id in (
+                parent_change_id(snow_item)
+                for snow_item in snow_items
+                # only SSIS tasks without a dot-walked change type need their parent change
+                if parent_change_type(snow_item) is None
+                and re.search(r"(ssis)", str(snow_item["short_description"]), re.IGNORECASE)
+            )
+            if sys_id and sys_id not in _parent_changes
+        )
+    )
 
-    return found
+    # sys_ids are 32 characters, keep the query string well under the url length limits
+    page_size = min(int(scheduler_config.get("SnowPageSize", 200)), 100)
+    for i in range(0, len(missing), page_size):
+        for change in iter_servicenow_records(
+            scheduler_config.get("ChangeRequestEndpoint", "/api/now/table/change_request"),
+            params={
+                "sysparm_query": f"sys_idIN{','.join(missing[i : i + page_size])}",
+                "sysparm_fields": ",".join(PARENT_CHANGE_FIELDS),
+                "sysparm_exclude_reference_link": "true",
+            },
+            page_size=page_size,
+            client=service_now_client(),
+        ):
+            _parent_changes[change["sys_id"]] = change
 
 def retrieve_parent_change(parent_link: str) -> list:
     """
-    Gets parent change from link in CTASK 
+    Gets parent change from link in CTASK, each parent change is only read once per run
         Parameters:
-            parent_link: change_request.link in CTASK json
+            parent_link: link to the parent change, see parent_change_link()
     """
+    sys_id = link_sys_id(parent_link)
+    if sys_id in _parent_changes:
+        return _parent_changes[sys_id]
 
     try:
-        change = requests.get(
-            url=f"{parent_link}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
+        change = service_now_client().get(
+            f"{parent_link}",
+            params={
+                "sysparm_fields": ",".join(PARENT_CHANGE_FIELDS),
+                "sysparm_exclude_reference_link": "true",
+            },
         )
     except Exception as e:
         error_string = str(e)
@@ -296,21 +770,23 @@ def retrieve_parent_change(parent_link: str) -> list:
 
     if change.status_code == 200:
         change = change.json()
+        _parent_changes[sys_id] = change["result"]
         return change["result"]
     else:
         log(change.text)
         return []
 
-def set_processed(short_description: str, assign_to_queue: bool, parent_link: str) -> str:
+def set_processed(short_description: str, assign_to_queue: bool, parent_link: str, change_type: str = None) -> str:
     """Injects PROCESSED to the end of the short desciption in ServiceNow"
 
     Keyword arguments:
     short_description -- short description in ServiceNow
     assign_to_queue: bool
+    change_type -- type of the parent change if it was read with the change task
     Return: str
     """
 
-    if is_a_standard_change(short_description, parent_link) == False:
+    if is_a_standard_change(short_description, parent_link, change_type) == False:
         if assign_to_queue:
             # if its assigned to the queue we need to remove the PROCESSED from the title
             return short_description.replace(
@@ -321,14 +797,13 @@ def set_processed(short_description: str, assign_to_queue: bool, parent_link: st
             # we attempt to replace PROCESSED if it already exists to keep it from stacking in the string
             return f"{short_description.replace('PROCESSED','').rstrip()} PROCESSED"
 
-def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
+def change_task_body(snow_item: dict, assign_to_queue: bool) -> dict:
     """
-    Assigns ServiceNow item to service account
+    Builds the fields to update when a ServiceNow item is assigned to the service account or back to the queue
         Parameters:
             snow_item: response from ServiceNow
-            assign_to_queue: if true it assigns the snow item back to the queue
+            assign_to_queue: if true the fields assign the snow item back to the queue
     """
-    # we need to update the change task body
     json_body = {
         "change_task_type": "Planning"
         if assign_to_queue
@@ -340,28 +815,71 @@ def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
         "short_description": set_processed(
             short_description=snow_item["short_description"],
             assign_to_queue=assign_to_queue,
-            parent_link=snow_item["change_request"]["link"],
+            parent_link=parent_change_link(snow_item),
+            change_type=parent_change_type(snow_item),
         ),
     }
-    endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
 
     # You cannot update descriptions in task from standard changes
     # So we need to figure out if it is a standard change
-    if is_a_standard_change(snow_item["short_description"], snow_item["change_request"]["link"]):
+    if is_a_standard_change(
+        snow_item["short_description"], parent_change_link(snow_item), parent_change_type(snow_item)
+    ):
         json_body.pop("short_description")
 
+    return json_body
+
+def pending_change(snow_item: dict, json_body: dict) -> bool:
+    """
+    Checks if an update would change the assignee or title of a ServiceNow item, see change_task_body
+        Parameters:
+            snow_item: response from ServiceNow
+            json_body: fields to update
+    """
+    return json_body["assigned_to"] != assigned_to_id(snow_item) or json_body.get(
+        "short_description", snow_item["short_description"]
+    ) != snow_item["short_description"]
+
+def assign_snow_item(snow_item: dict, assign_to_queue: bool, queue=None) -> bool:
+    """
+    Assigns ServiceNow item to service account
+        Parameters:
+            snow_item: response from ServiceNow
+            assign_to_queue: if true it assigns the snow item back to the queue
+            queue: ChangeTaskWriteQueue to send the update with later, only for callers that do not
+                   check the result as it is always true until the queue is flushed
+    """
+    # we need to update the change task body
+    json_body = change_task_body(snow_item=snow_item, assign_to_queue=assign_to_queue)
+
+    # keep the task we hold in step with ServiceNow so the rest of the run does not have to read it again,
+    # a queued update is only applied once the flush saved it so a failed write does not count as assigned
+    if queue is not None:
+        queue.add(sys_id=snow_item["sys_id"], json_body=json_body, on_saved=lambda: snow_item.update(json_body))
+        return True
+
+    if not update_change_task(sys_id=snow_item["sys_id"], json_body=json_body):
+        return False
+
+    snow_item.update(json_body)
+    return True
+
+def update_change_task(sys_id: str, json_body: dict) -> bool:
+    """
+    Updates a change task in ServiceNow
+        Parameters:
+            sys_id: sys_id of the change task
+            json_body: fields to update
+    """
+    endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
+
     # update SNOW item
     try:
-        results = requests.put(
-            url=f"{scheduler_config['BaseUrl']}{endpoint}/{snow_item['sys_id']}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
-            data=json.dumps(json_body),
+        results = service_now_client().put(
+            f"{endpoint}/{sys_id}", data=json.dumps(json_body)
         )
     except Exception as e:
-        log(e.message)
+        log(str(e))
         return False
 
     # if the status code is not 200 then it failed
@@ -370,6 +888,120 @@ def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
         return False
     else:
         return True
+
+class ChangeTaskWriteQueue:
+    """
+    Collects change task updates and sends them through the ServiceNow batch API,
+    SnowBatchSize updates per request. Updates the batch did not save are sent again on their own
+        Parameters:
+            batch_size: max number of updates per batch request, SnowBatchSize from config if not passed in
+    """
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or int(scheduler_config.get("SnowBatchSize", 25))
+        self.updates = {}
+        self.callbacks = {}
+
+        # items are scheduled on several threads that all add to the same queue
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.updates)
+
+    def add(self, sys_id: str, json_body: dict, on_saved=None) -> None:
+        """
+        Queues an update of a change task
+            Parameters:
+                sys_id: sys_id of the change task
+                json_body: fields to update
+                on_saved: called once the flush has saved the update, not called if it failed
+        """
+        # a later update of the same change task wins, the same as sending them one after the other
+        with self.lock:
+            self.updates.setdefault(sys_id, {}).update(json_body)
+            if on_saved is not None:
+                self.callbacks.setdefault(sys_id, []).append(on_saved)
+
+    def flush(self) -> dict:
+        """
+        Sends every queued update
+            Returns:
+                dict: sys_id of each change task and true if the update was saved
+        """
+        with self.lock:
+            updates, self.updates = self.updates, {}
+            callbacks, self.callbacks = self.callbacks, {}
+        items = list(updates.items())
+
+        results = {}
+        for i in range(0, len(items), self.batch_size):
+            results.update(self.send_batch(items[i : i + self.batch_size]))
+
+        for sys_id, saved in results.items():
+            if not saved:
+                results[sys_id] = update_change_task(sys_id=sys_id, json_body=updates[sys_id])
+
+        for sys_id, saved in results.items():
+            if saved:
+                for on_saved in callbacks.get(sys_id, []):
+                    on_saved()
+
+        return results
+
+    def send_batch(self, chunk: list) -> dict:
+        """
+        Sends one batch request, every update in it is a PUT on the change task
+            Parameters:
+                chunk: list of sys_id and fields to update
+        """
+        endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
+        rest_requests = [
+            {
+                "id": str(n),
+                "method": "PUT",
+                "url": f"{endpoint}/{sys_id}",
+                "headers": [
+                    {"name": "Content-Type", "value": "application/json"},
+                    {"name": "Accept", "value": "application/json"},
+                ],
+                # the batch API wants every body base64 encoded
+                "body": base64.b64encode(json.dumps(json_body).encode()).decode(),
+            }
+            for n, (sys_id, json_body) in enumerate(chunk)
+        ]
+
+        results = {sys_id: False for sys_id, _ in chunk}
+        try:
+            response = service_now_client().post(
+                scheduler_config.get("BatchEndpoint", "/api/now/v1/batch"),
+                data=json.dumps({"batch_request_id": str(uuid.uuid4()), "rest_requests": rest_requests}),
+            )
+        except Exception as e:
+            log(str(e))
+            return results
+
+        if response.status_code != 200:
+            log(response.text)
+            return results
+
+        # map each result back to its change task, requests that were not serviced stay false
+        for serviced in response.json().get("serviced_requests", []):
+            sys_id = chunk[int(serviced["id"])][0]
+            if serviced.get("status_code") == 200:
+                results[sys_id] = True
+            else:
+                log(f"Batch update of change task {sys_id} returned {serviced.get('status_code')}")
+
+        return results
+
+def change_task_writes() -> ChangeTaskWriteQueue:
+    """Gets the change task write queue for the run"""
+    global _change_task_writes
+
+    with _change_task_writes_lock:
+        if _change_task_writes is None:
+            _change_task_writes = ChangeTaskWriteQueue()
+    return _change_task_writes
     
 def post_to_webex(message=str):
     """Posts message to webex space"""
@@ -377,48 +1009,46 @@ def post_to_webex(message=str):
         payload = {"roomId": scheduler_config["WebexRoom"], "markdown": message}        
         headers = {"Authorization": "Bearer " f'{scheduler_config["Bearer"]}'}
 
-        requests.post(scheduler_config["WebexUrl"], headers=headers, data=payload).json()
+        webex_client().post(scheduler_config["WebexUrl"], headers=headers, data=payload).json()
         return True
     except Exception as e:
         error_string = str(e)
         log(error_string)
         return False
     
-def remove_project_name(short_description=str) -> str:
+def remove_project_name(short_description=str, catalog=None) -> str:
     """Removes project name from short description
 
     Args:
         short_description (_type_, optional): SNOW short description. Defaults to str.
+        catalog (ProjectCatalog, optional): project catalog for the run. Loaded once if not passed in.
 
     Returns:
         str: returns short description with project name removed
     """
     try:
-        od_projects = projects()
+        od_projects = catalog if catalog is not None else project_catalog()
     except:
         return ""
 
-    for project in od_projects:
-        if (
-            re.search(
-                r"\b{}\b".format(str(project["Name"])), short_description, re.IGNORECASE
-            )
-            is not None
-        ):
-            short_description = short_description.replace(project["Name"], "")
-            break
+    # the catalog finds the longest project name in one pass instead of running a regex per project
+    found = od_projects.match(short_description)
+    if found:
+        short_description = re.sub(
+            re.escape(str(found[0]["Name"])), "", short_description, flags=re.IGNORECASE
+        )
     return short_description
     
-def extract_release(short_description: str) -> str:
+def extract_release(short_description: str, catalog=None) -> str:
     """
     Extracts release from description in ServiceNow
         Parameters:
             short_description: short description of Change Task in ServiceNow
-
+            catalog: project catalog for the run, loaded once if not passed in
     """
     # to avoid extracting project names as version numbers due to some projects having numbers in their names
     # we find the project name in the description and remove it as we just want the version number
-    short_description = remove_project_name(short_description=short_description)
+    short_description = remove_project_name(short_description=short_description, catalog=catalog)
 
     # use regex to find version number in the short description
     release_number = ""
@@ -432,18 +1062,17 @@ def extract_release(short_description: str) -> str:
     # return extracted release number
     return release_number
 
-def find_project_id(short_description: str) -> str:
+def find_project_id(short_description: str, catalog=None) -> str:
     """
     Finds project id in OctopusDeploy from the ServiceNow description
     Parameters:
         short_description: short description of Change Task in ServiceNow
+        catalog: project catalog for the run, loaded once if not passed in
     """
 
-    # TODO improvement: convert project name in short_description to slug, pass slug to projects() function
-
     # get list of projects from OD return empty string if there is an error
     try:
-        od_projects = projects()
+        od_projects = catalog if catalog is not None else project_catalog()
     except:
         return ""
 
@@ -456,7 +1085,12 @@ def find_project_id(short_description: str) -> str:
 
     # we want to make sure that the paramters were passed in
     if short_description:
-        # look for the project name in the ServiceNow short description
+        # the longest project name that stands on its own wins
+        found = od_projects.match(short_description)
+        if found:
+            return found[0]["Id"]
+
+        # otherwise look for the project name anywhere in the ServiceNow short description
         for project in od_projects:
             if str(project["Name"]).upper() in short_description:
                 return project["Id"]
@@ -465,6 +1099,52 @@ def find_project_id(short_description: str) -> str:
     else:
         return ""
     
+def closest_project(short_description: str, catalog=None) -> tuple:
+    """
+    Finds the project a project name in the ServiceNow description refers to when it is written with other
+    separators or in another case, such as Billing-API for Billing API. Misspelled names and names with other
+    numbers are never resolved, the item would be scheduled and authorized for a project it does not name,
+    they are only suggested in the webex message, see ProjectCatalog.suggest
+    Parameters:
+        short_description: short description of Change Task in ServiceNow
+        catalog: project catalog for the run, loaded once if not passed in
+    Returns:
+        tuple: project and the name as it is written in the description,
+               otherwise an empty dict and an empty string
+    """
+    try:
+        od_projects = catalog if catalog is not None else project_catalog()
+    except:
+        return {}, ""
+
+    found = od_projects.match_joined(short_description)
+    if not found:
+        return {}, ""
+
+    project, start, end = found
+    return project, str(short_description)[start:end]
+
+def resolve_title(short_description: str, catalog=None) -> tuple:
+    """
+    Finds the project name and release number in a ServiceNow short description,
+    a project name written with other separators is resolved to its project, see closest_project
+    Parameters:
+        short_description: short description of Change Task in ServiceNow
+        catalog: project catalog for the run, loaded once if not passed in
+    Returns:
+        tuple: project name, release number
+    """
+    project_name = find_project_name(short_description, catalog=catalog)
+    if not project_name:
+        project, name_text = closest_project(short_description, catalog=catalog)
+        if project:
+            # the name may have numbers in it so it is taken out before extracting the release
+            return project["Name"], extract_release(
+                short_description.replace(name_text, ""), catalog=catalog
+            )
+
+    return project_name, extract_release(short_description, catalog=catalog)
+
 def find_release(release_number: str, project_id: str) -> dict:
     """
     Finds release in Octopus Deploy
@@ -473,84 +1153,188 @@ def find_release(release_number: str, project_id: str) -> dict:
         project_id: id of project in Octopus Deploy
     """
     # TODO can't seem to pass slug as project id for releases (https://octopusdeploy.healthspring.inside/api/projects/Projects-644/releases)
-    # TODO do we really need 999 releases?  Defaults to last 30 and returns most recent first
-    # TODO we can request specific release based on version number (https://octopusdeploy.healthspring.inside/api/projects/Projects-644/releases/2023.4.0.246)
     if release_number and project_id:
+        # the same release is often asked for more than once in a run
+        key = (project_id, release_number.upper())
+        if key in _release_cache:
+            return _release_cache[key]
+
         try:
-            # retrieve 999 releases we may need to extend the number in the future, but for now should be plenty
-            results = requests.get(
-                url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['ProjectsEndpoint']}/{project_id}/releases?take=999",
-                headers={
-                    "X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"
-                },
-                verify=False,
+            # request the release directly by its version number
+            results = octopus_client().get(
+                f"{scheduler_config['ProjectsEndpoint']}/{project_id}/releases/{urllib.parse.quote(release_number, safe='')}"
             )
         except Exception as e:
             error_string = str(e)
             log(error_string)
             return {}
 
-        # if status code is 200 then content was returned
+        release = {}
         if results.status_code == 200:
-            results = results.json()
-
-            # results we want are in the Items list
-            for r in results["Items"]:
-                # Version should equal the release number passed in
-                if r["Version"].upper() == release_number.upper():
-                    return r
-            return {}
+            release = results.json()
+
+        # the version lookup is an exact match, so if it was not found we look through the releases
+        # newest first and stop as soon as we find it
+        if not release or release.get("Version", "").upper() != release_number.upper():
+            release = {}
+            try:
+                for r in octopus_items(
+                    f"{scheduler_config['ProjectsEndpoint']}/{project_id}/releases",
+                    params={"take": 30},
+                ):
+                    # Version should equal the release number passed in
+                    if r["Version"].upper() == release_number.upper():
+                        release = r
+                        break
+            except Exception as e:
+                error_string = str(e)
+                log(error_string)
+                return {}
+
+        _release_cache[key] = release
+        return release
     else:
         return {}
-    
-def scheduled(release_number: str, project_name=str) -> bool:
+
+def find_releases(project_id: str, release_numbers: list) -> dict:
     """
-    Verifies if a release is scheduled in Octopus Deploy
+    Finds several releases of the same project in Octopus Deploy, reading the releases newest first
+    once for all of them and stopping as soon as every release was found
+    Parameters:
+        project_id: id of project in Octopus Deploy
+        release_numbers: release numbers in Octopus Deploy
+    Returns:
+        dict: upper case release number and release details, empty if the release was not found
+    """
+    if not project_id:
+        return {}
+
+    wanted = {n.upper() for n in release_numbers if n and (project_id, n.upper()) not in _release_cache}
+    if wanted:
+        found = {}
+        try:
+            for r in octopus_items(
+                f"{scheduler_config['ProjectsEndpoint']}/{project_id}/releases",
+                params={"take": 100},
+            ):
+                version = r["Version"].upper()
+                if version in wanted and version not in found:
+                    found[version] = r
+                    if len(found) == len(wanted):
+                        break
+        except Exception as e:
+            # anything not found here is looked up on its own by find_release
+            log(str(e))
+            wanted = set(found)
+
+        # releases that were not found are only cached when every release of the project was read
+        for version in wanted:
+            _release_cache[(project_id, version)] = found.get(version, {})
+
+    return {
+        n.upper(): find_release(release_number=n, project_id=project_id)
+        for n in release_numbers
+        if n
+    }
+
+def task_index(catalog=None, refresh: bool = False) -> dict:
+    """
+    Counts the queued Octopus Deploy deployment tasks by project name, release number and state,
+    the tasks are downloaded and parsed once per run
         Parameters:
-            release_number: Release number from Octopus Deploy
+            catalog: project catalog for the run, loaded once if not passed in
+            refresh: if set to true the tasks are downloaded again
     """
+    global _task_index
 
-    # retrieve current server tasks
-    if release_number:
+    with _state_lock:
+        if _task_index is not None and not refresh:
+            return _task_index
+
+        # retrieve the queued deployment tasks, the server filters them so only candidates are downloaded
         try:
-            results = requests.get(
-                url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['TasksEndpoint']}",
-                headers={
-                    "X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"
-                },
-                verify=False,
+            tasks = list(
+                octopus_items(
+                    scheduler_config["TasksEndpoint"],
+                    params={"states": "Queued", "name": "Deploy", "take": 100},
+                )
             )
         except Exception as e:
+            # the index is not kept so the next call tries again
             error_string = str(e)
             log(error_string)
-            return False
+            return {}
 
-        # we only want to results if code is 200, otherwise return false
-        if results.status_code == 200:
-            results = results.json()
+        catalog = catalog if catalog is not None else project_catalog()
 
-            # find release number in the description if it's found and the state is queued then
-            # this release is already scheduled so return true
-            for r in results["Items"]:
-                if (
-                    release_number == extract_release(r["Description"])
-                    and r["State"] == "Queued"
-                    and "Release Approval" not in r["Description"]
-                    and project_name == find_project_name(r["Description"])
-                ):
-                    return True
-        else:
-            log(results.text)
+        index = {}
+        for r in tasks:
+            if "Release Approval" in r["Description"]:
+                continue
+
+            key = (
+                find_project_name(r["Description"], catalog=catalog),
+                extract_release(r["Description"], catalog=catalog),
+                r["State"],
+            )
+            index[key] = index.get(key, 0) + 1
+
+        _task_index = index
+        return _task_index
+
+def add_queued_task(project_name: str, release_number: str) -> None:
+    """
+    Adds a deployment scheduled during the run to the task index so later items see it as scheduled
+        Parameters:
+            project_name: project name from Octopus Deploy
+            release_number: release number from Octopus Deploy
+    """
+    with _state_lock:
+        if _task_index is not None:
+            key = (project_name, release_number, "Queued")
+            _task_index[key] = _task_index.get(key, 0) + 1
+
+def scheduled(release_number: str, project_name=str, catalog=None) -> bool:
+    """
+    Verifies if a release is scheduled in Octopus Deploy
+        Parameters:
+            release_number: Release number from Octopus Deploy
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+
+    # if the release has a queued task then this release is already scheduled so return true
+    if release_number:
+        return (project_name, release_number, "Queued") in task_index(catalog=catalog)
     return False
 
+def octopus_items(endpoint: str, params: dict = None):
+    """
+    Yields every item of an Octopus Deploy collection, following the next page links
+        Parameters:
+            endpoint: Octopus Deploy API endpoint
+            params: query string parameters for the first page
+    """
+    url = endpoint
+
+    while url:
+        results = octopus_client().get(url, params=params)
+
+        if results.status_code != 200:
+            log(results.text)
+            raise Exception(f"Octopus Deploy returned {results.status_code} for {url}")
+
+        results = results.json()
+        for item in results["Items"]:
+            yield item
+
+        # the next page link already has the query string in it
+        url = results.get("Links", {}).get("Page.Next")
+        params = None
+
 def projects() -> list:
     """Gets a list of all projects from Octopus Deploy"""
     try:
-        results = requests.get(
-            url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['ProjectsEndpoint']}?take=999",
-            headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-            verify=False,
-        )
+        results = octopus_client().get(f"{scheduler_config['ProjectsEndpoint']}?take=999")
     except:
         return []
 
@@ -564,30 +1348,308 @@ def projects() -> list:
         log(results.text)
         return []
 
-def find_project_name(short_description=str) -> str:
+class ProjectMatcher:
+    """
+    Aho-Corasick automaton over project names, finds every project name in a description in a single pass
+        Parameters:
+            names: upper case project names
+    """
+
+    def __init__(self, names):
+        # node 0 is the root, every node has its children, a failure link and the names that end on it
+        self.children = [{}]
+        self.failure = [0]
+        self.endings = [[]]
+
+        for name in names:
+            if not name:
+                continue
+
+            node = 0
+            for character in name:
+                child = self.children[node].get(character)
+                if child is None:
+                    child = len(self.children)
+                    self.children[node][character] = child
+                    self.children.append({})
+                    self.failure.append(0)
+                    self.endings.append([])
+                node = child
+            self.endings[node].append(name)
+
+        # breadth first so the failure link of a parent is always known before its children
+        queue = list(self.children[0].values())
+        for node in queue:
+            for character, child in self.children[node].items():
+                fallback = self.failure[node]
+                while fallback and character not in self.children[fallback]:
+                    fallback = self.failure[fallback]
+                target = self.children[fallback].get(character, 0)
+                self.failure[child] = target if target != child else 0
+                self.endings[child] = self.endings[child] + self.endings[self.failure[child]]
+                queue.append(child)
+
+    def find_all(self, text: str):
+        """
+        Yields start, end and name of every project name found in the text
+            Parameters:
+                text: upper case text to search
+        """
+        node = 0
+        for position, character in enumerate(text):
+            while node and character not in self.children[node]:
+                node = self.failure[node]
+            node = self.children[node].get(character, 0)
+            for name in self.endings[node]:
+                yield position + 1 - len(name), position + 1, name
+
+def _word_character(character: str) -> bool:
+    return character.isalnum() or character == "_"
+
+def _trigrams(word: str) -> set:
+    # pad the word so the start and end of the word count as well
+    word = f" {word} "
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+def _upper(text: str) -> str:
+    # some characters grow when upper cased, keep those as they are so positions line up with the original text
+    upper = text.upper()
+    if len(upper) != len(text):
+        upper = "".join(c.upper() if len(c.upper()) == 1 else c for c in text)
+    return upper
+
+class ProjectCatalog:
+    """
+    Run-scoped index of Octopus Deploy projects
+        Parameters:
+            od_projects: list of projects from Octopus Deploy
+    """
+
+    def __init__(self, od_projects: list):
+        # keep the original order, some lookups still return the first project that matches
+        self.projects = list(od_projects or [])
+
+        # all keys are upper case to avoid cAsE problems
+        self.by_name = {}
+        self.by_slug = {}
+        self.by_id = {}
+        for project in self.projects:
+            self.by_name.setdefault(str(project["Name"]).upper(), project)
+            if project.get("Slug"):
+                self.by_slug.setdefault(str(project["Slug"]).upper(), project)
+            self.by_id.setdefault(str(project["Id"]).upper(), project)
+
+        # built on first use, a catalog never changes once it is loaded
+        self._matcher = None
+        self._trigram_index = None
+        self._joined_names = None
+
+    def __len__(self) -> int:
+        return len(self.projects)
+
+    def __iter__(self):
+        return iter(self.projects)
+
+    def get(self, key: str) -> dict:
+        """
+        Finds a project by name, slug or id
+            Parameters:
+                key: project name, slug or id from Octopus Deploy
+        """
+        if not key:
+            return {}
+
+        key = str(key).upper()
+        return self.by_name.get(key) or self.by_slug.get(key) or self.by_id.get(key) or {}
+
+    def match(self, text: str) -> tuple:
+        """
+        Finds the longest project name in the text that is not part of a bigger word
+            Parameters:
+                text: short description from ServiceNow or Octopus Deploy
+        Returns:
+            tuple: project, start and end of the name in the text, or None if no project was found
+        """
+        if not text:
+            return None
+
+        if self._matcher is None:
+            self._matcher = ProjectMatcher(self.by_name.keys())
+
+        upper = _upper(str(text))
+        best = None
+        for start, end, name in self._matcher.find_all(upper):
+            # the name must not be glued to the words around it
+            if start > 0 and _word_character(upper[start - 1]) and _word_character(name[0]):
+                continue
+            if end < len(upper) and _word_character(upper[end]) and _word_character(name[-1]):
+                continue
+
+            # longest name wins, if two are the same length the first one in the text wins
+            if best is None or (end - start, -start) > (best[1] - best[0], -best[0]):
+                best = (start, end, name)
+
+        if best is None:
+            return None
+
+        return self.by_name[best[2]], best[0], best[1]
+
+    def match_joined(self, text: str) -> tuple:
+        """
+        Finds the longest project name in the text written with other separators or in another case,
+        such as Billing-API or BillingAPI for Billing API. The words of the text must join up to exactly
+        the name, a release number is never joined to a word and nothing is guessed
+            Parameters:
+                text: short description from ServiceNow or Octopus Deploy
+        Returns:
+            tuple: project, start and end of the name in the text, or None if no project was found
+        """
+        if not text:
+            return None
+
+        if self._joined_names is None:
+            self._joined_names = {}
+            for key, project in self.by_name.items():
+                joined = "".join(re.findall(r"[^\W_]+", key))
+                if joined:
+                    self._joined_names.setdefault(joined, project)
+            self._longest_joined = max((len(joined) for joined in self._joined_names), default=0)
+
+        # a dotted number such as 2.1 is one word so no part of a release number ends up in a name
+        words = [(m.group(), m.start(), m.end()) for m in re.finditer(r"\d+(?:\.\d+)+|[^\W_]+", _upper(str(text)))]
+        best = None
+        for i in range(len(words)):
+            joined = ""
+            for word, _, end in words[i:]:
+                joined += word
+                if "." in word or len(joined) > self._longest_joined:
+                    break
+                if joined in self._joined_names and (best is None or end - words[i][1] > best[2] - best[1]):
+                    best = (self._joined_names[joined], words[i][1], end)
+
+        return best
+
+    def suggest(self, text: str, limit: int = 3) -> list:
+        """
+        Finds the projects with names closest to the words in the text, used when a project name is misspelled
+            Parameters:
+                text: short description from ServiceNow
+                limit: max number of suggestions
+        Returns:
+            list: score between 0 and 1, project and the words in the text that look like the project name,
+                  best match first
+        """
+        if not text:
+            return []
+
+        if self._trigram_index is None:
+            self._build_trigram_index()
+
+        # words keep their position so we can hand back the original text of the best match. A dotted release
+        # number is read as one word and left out, numbers on their own stay as names such as ETL 10 have them
+        words = [
+            (m.group(), m.start(), m.end())
+            for m in re.finditer(r"\d+(?:\.\d+)+|[^\W_]+|_+", _upper(str(text)))
+            if "." not in m.group()
+        ]
+        grams = set()
+        for word, _, _ in words:
+            grams |= _trigrams(word)
+
+        # count the trigrams each name shares with the text, only names sharing something are candidates
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigram_index.get(gram, ()))
+
+        candidates = sorted(
+            shared, key=lambda name: shared[name] / self._name_trigrams[name], reverse=True
+        )[:10]
+
+        # compare each candidate with every run of text words that is as long as the name
+        suggestions = []
+        for name in candidates:
+            name_words = name.split(" ")
+            best = (0.0, "")
+            for i in range(len(words) - len(name_words) + 1):
+                window = words[i : i + len(name_words)]
+                score = SequenceMatcher(
+                    None, name, " ".join(w for w, _, _ in window)
+                ).ratio()
+                if score > best[0]:
+                    best = (score, str(text)[window[0][1] : window[-1][2]])
+            if best[0]:
+                suggestions.append((round(best[0], 3), self._normalized[name], best[1]))
+
+        suggestions.sort(key=lambda suggestion: suggestion[0], reverse=True)
+        return suggestions[:limit]
+
+    def _build_trigram_index(self):
+        # names are compared on their words only so punctuation does not count against them
+        self._normalized = {}
+        self._name_trigrams = {}
+        self._trigram_index = {}
+        for key, project in self.by_name.items():
+            name = " ".join(re.findall(r"[^\W_]+|_+", key))
+            if not name or name in self._normalized:
+                continue
+
+            self._normalized[name] = project
+            grams = set()
+            for word in name.split(" "):
+                grams |= _trigrams(word)
+            self._name_trigrams[name] = len(grams)
+            for gram in grams:
+                self._trigram_index.setdefault(gram, []).append(name)
+
+# project catalog shared by every helper for the lifetime of the run
+_project_catalog = None
+
+# releases found during the run keyed by project id and upper case release number
+_release_cache = {}
+
+# Octopus Deploy tasks of the run keyed by project name, release number and task state, loaded on first use
+_task_index = None
+
+# promotion check of each release, a release is checked once per run no matter how many items point at it
+_progression_cache = {}
+
+# items are scheduled on several threads, the lazily loaded state above is only built and changed under this lock
+_state_lock = threading.RLock()
+
+def project_catalog(refresh: bool = False) -> ProjectCatalog:
+    """
+    Gets the project catalog for the run, projects are only downloaded from Octopus Deploy once
+        Parameters:
+            refresh: if set to true the projects are downloaded again
+    """
+    global _project_catalog
+
+    with _state_lock:
+        # an empty catalog means the download failed so we try again next time it is asked for
+        if refresh or not _project_catalog:
+            _project_catalog = ProjectCatalog(projects())
+
+        return _project_catalog
+
+def find_project_name(short_description=str, catalog=None) -> str:
     """Returns project name from short description
 
     Args:
         short_description (_type_, optional): SNOW short description. Defaults to str.
+        catalog (ProjectCatalog, optional): project catalog for the run. Loaded once if not passed in.
 
     Returns:
         str: returns project name
     """
     project_name = ""
     try:
-        od_projects = projects()
+        od_projects = catalog if catalog is not None else project_catalog()
     except:
         return project_name
 
-    for project in od_projects:
-        if (
-            re.search(
-                r"\b{}\b".format(str(project["Name"])), short_description, re.IGNORECASE
-            )
-            is not None
-        ):
-            project_name = project["Name"]
-            break
+    found = od_projects.match(short_description)
+    if found:
+        project_name = found[0]["Name"]
 
     return project_name
 
@@ -597,13 +1659,13 @@ def promotable(release_id: str) -> bool:
         Parameters:
             release_id: ID of release
     """
+    if release_id in _progression_cache:
+        return _progression_cache[release_id]
 
     # get the release progression
     try:
-        results = requests.get(
-            url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['ReleaseEndpoint']}/{release_id}/progression",
-            headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-            verify=False,
+        results = octopus_client().get(
+            f"{scheduler_config['ReleaseEndpoint']}/{release_id}/progression"
         )
     except:
         return False
@@ -624,7 +1686,9 @@ def promotable(release_id: str) -> bool:
                 and r["Progress"] == "Current"
                 or r["Progress"] == "Complete"
             ):
+                _progression_cache[release_id] = True
                 return True
+        _progression_cache[release_id] = False
         return False
     else:
         log(results.text)
@@ -701,11 +1765,8 @@ def schedule_release(deployment_resource: dict) -> bool:
 
     # verify that the deployment resource is not null
     if deployment_resource:
-        results = requests.post(
-            url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['DeploymentsEndpoint']}",
-            headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-            json=deployment_resource,
-            verify=False,
+        results = octopus_client().post(
+            scheduler_config["DeploymentsEndpoint"], json=deployment_resource
         )
 
         # if the result status code is not 201 then something failed
@@ -719,194 +1780,348 @@ def schedule_release(deployment_resource: dict) -> bool:
     else:
         return False
 
-def schedule(snow_items=list) -> bool:
+def plan_item(snow_item: dict, catalog=None) -> dict:
     """
-    Assigns and schedules ServiceNow items in Octopus Deploy
+    Reads the action, release and project from a ServiceNow item before anything is assigned or scheduled
         Parameters:
-            snow_items: JSON response from ServiceNow
+            snow_item: item from ServiceNow
+            catalog: project catalog for the run, loaded once if not passed in
     """
-    if snow_items:
-        for snow_item in snow_items:
-            # This string gets added to throughout the schedule function and posts to webex
-            webex_message = ""
-
-            # we need to convert the UTC offset that OD uses to CST
-            # TODO - why are we not pulling the planned_end_time instead of just adding 30 minutes to start time?
-            start_time = convert_utc_offset(
-                date_string=to_central_time(
-                    time=snow_item["planned_start_date"], add_delta=False
-                )
-            )
-            end_time = convert_utc_offset(
-                date_string=to_central_time(
-                    time=snow_item["planned_start_date"], add_delta=True
-                )
-            )
+    catalog = catalog if catalog is not None else project_catalog()
+
+    plan = {
+        "snow_item": snow_item,
+        "action": "",
+        "release_number": "",
+        "project_id": "",
+        "project_name": "",
+        "name_text": "",
+    }
 
-            # set the snow item number, time, and description for the webex message
-            webex_message = (
-                f'ServiceNow Item: _{snow_item["task_effective_number"]}_ \n'
-                f"Time: _{start_time} CST - {end_time} CST_ \n"
-                f'Description: _{snow_item["short_description"]}_ \n'
+    # we only want to schedule items that apply to OD
+    if not action_item(snow_item["short_description"]):
+        return plan
+
+    # convert description to all upper case to avoid any cAsE problems
+    description_upper = str(snow_item["short_description"]).upper()
+    if "SKIP" in description_upper:
+        plan["action"] = "SKIP"
+        return plan
+    if "MANUAL" in description_upper:
+        plan["action"] = "MANUAL"
+        return plan
+
+    plan["action"] = "DEPLOY"
+
+    # extract the version number from the description
+    plan["release_number"] = extract_release(snow_item["short_description"], catalog=catalog)
+    if not plan["release_number"]:
+        return plan
+
+    # get the project name and project id
+    plan["project_id"] = find_project_id(
+        short_description=snow_item["short_description"], catalog=catalog
+    )
+    plan["project_name"] = find_project_name(snow_item["short_description"], catalog=catalog)
+
+    # a project name written with other separators, such as Billing-API, is resolved to its project so the
+    # item does not go back to the queue and get evaluated again every run. A misspelled name is not resolved
+    # and the item is never scheduled for a project it does not name, the webex message suggests the project
+    if not plan["project_id"]:
+        project, name_text = closest_project(
+            short_description=snow_item["short_description"], catalog=catalog
+        )
+        if project:
+            plan["project_id"] = project["Id"]
+            plan["project_name"] = project["Name"]
+            plan["name_text"] = name_text
+            plan["release_number"] = extract_release(
+                snow_item["short_description"].replace(name_text, ""), catalog=catalog
             )
 
-            # we only want to schedule items that apply to OD
-            # TODO this could be simplified, perhaps return the action verb from action_item?
-            if action_item(snow_item["short_description"]):
-                # if skip is in the keyword we do not want schedule
-                # convert description to all upper case to avoid any cAsE problems
-                description_upper = str(snow_item["short_description"]).upper()
-
-                if "SKIP" in description_upper:
-                    if assign_snow_item(snow_item=snow_item, assign_to_queue=False):
-                        webex_message += (
-                            f"Status: **Found override keyword SKIP.** \n"
-                            f"  - ServiceNow item has been assigned to P-AUTOCTOPUS. \n"
-                            f"  - Deployment HAS NOT been scheduled in Octopus Deploy. Development team will manually trigger the deployment. \n"
-                            f"_No further action needed._ \n"
-                        )
-                    else:
-                        webex_message += "Status: ** - Failed to assign ServiceNow item to P-AUTOOCTOPUS.** \n"
-
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # if manual is in the keyword notify webex
-                if "MANUAL" in description_upper:
-                    webex_message += (
-                        "Status: **Found override keyword MANUAL** \n"
-                        "   - Please assign this ServiceNow item to whoever will be on call the week of the deployment or Production Support. \n"
-                    )
+    return plan
 
-                    post_to_webex(message=webex_message)
-                    continue
-                
-                # assign snow item to autooctopus
-                # TODO I think this needs to move later in the process to avoid the assign/unassign loop when there is an issue later in the process
-                if not assign_snow_item(snow_item=snow_item, assign_to_queue=False):
-                    webex_message += "Status: **Failed to assign ServiceNow item to P-AUTOCTOPUS.** \n"
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # extract the version number from the description
-                release_number = extract_release(snow_item["short_description"])
-
-                # we need to verify that the release number is not null
-                if not release_number:
-                    webex_message += (
-                        "Status: **Unable to extract release from ServiceNow short description.** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Please ensure title is in following format: \n"
-                        "Deploy [_project name_] [_release number_] [_override_] \n"
-                    )
-                    assign_snow_item(snow_item=snow_item, assign_to_queue=True) # TODO not necessary if we don't assign by default on line 83
-                    post_to_webex(message=webex_message)
-                    continue
+def prefetch_releases(plans: list) -> None:
+    """
+    Looks up the releases of every planned item grouped by project,
+    so each project's releases are read once no matter how many items target it
+        Parameters:
+            plans: planned ServiceNow items
+    """
+    groups = {}
+    for plan in plans:
+        if plan["project_id"] and plan["release_number"]:
+            groups.setdefault(plan["project_id"], set()).add(plan["release_number"])
 
-                # get the project name and project id
-                project_id = find_project_id(
-                    short_description=snow_item["short_description"]
-                )
+    for project_id, release_numbers in groups.items():
+        find_releases(project_id=project_id, release_numbers=list(release_numbers))
 
-                if not project_id:
-                    webex_message += (
-                        "Status: **Unable to find project in Octopus Deploy.** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Please verify that you have spelled your project name correctly in the title \n"
-                    )
-                    assign_snow_item(snow_item=snow_item, assign_to_queue=True) # TODO not necessary if we don't assign by default on line 83
-                    post_to_webex(message=webex_message)
-                    continue
+def schedule(snow_items=list, catalog=None) -> bool:
+    """
+    Assigns and schedules ServiceNow items in Octopus Deploy
+        Parameters:
+            snow_items: JSON response from ServiceNow, or any iterable of items such as iter_change_tasks
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    if snow_items:
+        # every project lookup for every item shares the same project list
+        catalog = catalog if catalog is not None else project_catalog()
+
+        # items are taken in batches so only one batch is held in memory however many items there are
+        snow_items = iter(snow_items)
+        batch_size = int(scheduler_config.get("ScheduleBatchSize", 100))
+        while True:
+            batch = list(islice(snow_items, batch_size))
+            if not batch:
+                break
+
+            # parse every item first so releases and progressions are looked up once per project
+            plans = [plan_item(snow_item=snow_item, catalog=catalog) for snow_item in batch]
+            prefetch_releases(plans)
+
+            # items are scheduled on a bounded pool of workers, the clients limit the calls in flight to each service.
+            # Items of the same project stay in one group and run in order so a release is never scheduled twice
+            workers = int(scheduler_config.get("ScheduleWorkers", 4))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(schedule_items, plans=group, catalog=catalog) for group in project_groups(plans)
+                ]
+                for future in futures:
+                    future.result()
+
+            # items sent back to the queue are updated together once the batch is done
+            change_task_writes().flush()
+
+def project_groups(plans: list) -> list:
+    """
+    Groups planned items by the project they deploy, keeping the order of the items in each group
+        Parameters:
+            plans: ServiceNow items planned by plan_item
+    """
+    groups = {}
+    for plan in plans:
+        # items without a project do not depend on any other item
+        key = plan["project_id"] or ("sys_id", plan["snow_item"].get("sys_id", id(plan)))
+        groups.setdefault(key, []).append(plan)
+    return list(groups.values())
+
+def schedule_items(plans: list, catalog=None) -> None:
+    """
+    Schedules planned items one after the other, see schedule_item
+        Parameters:
+            plans: ServiceNow items planned by plan_item
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    for plan in plans:
+        schedule_item(plan=plan, catalog=catalog)
 
-                # find release in octopus deploy
-                release_details = find_release(
-                    release_number=release_number, project_id=project_id
-                )
+def schedule_item(plan: dict, catalog=None) -> None:
+    """
+    Assigns and schedules a planned ServiceNow item in Octopus Deploy
+        Parameters:
+            plan: ServiceNow item planned by plan_item
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    snow_item = plan["snow_item"]
+    release_number = plan["release_number"]
+    project_id = plan["project_id"]
+    project_name = plan["project_name"]
+
+    # This string gets added to throughout the schedule function and posts to webex
+    webex_message = ""
+
+    # we need to convert the UTC offset that OD uses to CST
+    # TODO - why are we not pulling the planned_end_time instead of just adding 30 minutes to start time?
+    start_time = convert_utc_offset(
+        date_string=to_central_time(
+            time=snow_item["planned_start_date"], add_delta=False
+        )
+    )
+    end_time = convert_utc_offset(
+        date_string=to_central_time(
+            time=snow_item["planned_start_date"], add_delta=True
+        )
+    )
 
-                if not release_details:
-                    webex_message += (
-                        f"Status: **The release number {release_number} was not found in Octopus Deploy!** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Please ensure that the release in the ServiceNow item matches what release is being deployed. \n"
-                    )
-                    assign_snow_item(snow_item=snow_item, assign_to_queue=True)
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # if release is not scheduled
-                if not scheduled(
-                    release_number=release_number,
-                    project_name=find_project_name(snow_item["short_description"]),
-                ):
-                    # Verify that environment is able to be promoted to prod
-                    if not promotable(release_id=str(release_details["Id"])):
-                        # IF ITS NOT PROMOTABLE post message
-                        webex_message += (
-                            f"Status: **The release number {release_number} is unable to be promoted to Production!** \n"
-                            "_Possible Solutions:_ \n"
-                            "   - Please ensure that the release has gone through the lifecycle in Octopus Deploy to reach Production and is in the correct channel. \n"
-                        )
-                        assign_snow_item(snow_item=snow_item, assign_to_queue=True)
-                        post_to_webex(message=webex_message)
-                        continue
-
-                    # deployment resource for octopus deploy to create deployment
-                    deployment_resource = {
-                        "ReleaseId": release_details["Id"],
-                        "ProjectId": release_details["ProjectId"],
-                        "ChannelId": release_details["ChannelId"],
-                        "EnvironmentId": scheduler_config["ProductionEnvironmentId"],
-                        "QueueTime": to_central_time(
-                            time=snow_item["planned_start_date"], add_delta=False
-                        ),
-                        "QueueTimeExpiry": to_central_time(
-                            time=snow_item["planned_start_date"], add_delta=True
-                        ),
-                    }
+    # set the snow item number, time, and description for the webex message
+    webex_message = (
+        f'ServiceNow Item: _{snow_item["task_effective_number"]}_ \n'
+        f"Time: _{start_time} CST - {end_time} CST_ \n"
+        f'Description: _{snow_item["short_description"]}_ \n'
+    )
 
-                    # if the release is successful it will return true and we post to webex
-                    if schedule_release(deployment_resource=deployment_resource):
-                        webex_message += "Status: **Successfully assigned ServiceNow item and scheduled deployment in Octopus Deploy.** \n"
-                        webex_message += "_No further action needed._ \n"
-                    else:
-                        # if it fails post to webex about the failure
-                        webex_message += (
-                            "Status: **FAILED to schedule deployment in Octopus Deploy.** \n"
-                            "_Possible Solutions:_ \n"
-                            "   - Verify that at minimum five minutes have been alloted to schedule the deployment. \n"
-                            "   - Verify that date and time in the ServiceNow item are correct. \n"
-                            "   - Verify that the Octopus Deploy server is up and running.  \n"
-                        )
-                        assign_snow_item(snow_item=snow_item, assign_to_queue=True)
-                    post_to_webex(message=webex_message)
-                else:
-                    webex_message += (
-                        "Status: **Release has already been scheduled in Octopus Deploy!** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Deployment has previously been scheduled, but verify that the date and time match what is on Change Task.  \n"
-                    )
+    # we only want to schedule items that apply to OD
+    if not plan["action"]:
+        return
+
+    # if skip is in the keyword we do not want schedule
+    if plan["action"] == "SKIP":
+        if assign_snow_item(snow_item=snow_item, assign_to_queue=False):
+            webex_message += (
+                f"Status: **Found override keyword SKIP.** \n"
+                f"  - ServiceNow item has been assigned to P-AUTOCTOPUS. \n"
+                f"  - Deployment HAS NOT been scheduled in Octopus Deploy. Development team will manually trigger the deployment. \n"
+                f"_No further action needed._ \n"
+            )
+        else:
+            webex_message += "Status: ** - Failed to assign ServiceNow item to P-AUTOOCTOPUS.** \n"
 
-                    post_to_webex(message=webex_message)
-                    continue
+        post_to_webex(message=webex_message)
+        return
 
-def queued_deployments() -> list:
-    """Retrieves queued deployments from Octopus Deploy"""
+    # if manual is in the keyword notify webex
+    if plan["action"] == "MANUAL":
+        webex_message += (
+            "Status: **Found override keyword MANUAL** \n"
+            "   - Please assign this ServiceNow item to whoever will be on call the week of the deployment or Production Support. \n"
+        )
 
-    # retrieve queued deployments
-    results = requests.get(
-        url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['TasksEndpoint']}?take=999",
-        headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-        verify=False,
+        post_to_webex(message=webex_message)
+        return
+
+    # assign snow item to autooctopus
+    # TODO I think this needs to move later in the process to avoid the assign/unassign loop when there is an issue later in the process
+    if not assign_snow_item(snow_item=snow_item, assign_to_queue=False):
+        webex_message += "Status: **Failed to assign ServiceNow item to P-AUTOCTOPUS.** \n"
+        post_to_webex(message=webex_message)
+        return
+
+    # we need to verify that the release number is not null
+    if not release_number:
+        webex_message += (
+            "Status: **Unable to extract release from ServiceNow short description.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure title is in following format: \n"
+            "Deploy [_project name_] [_release number_] [_override_] \n"
+        )
+        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes()) # TODO not necessary if we don't assign by default on line 83
+        post_to_webex(message=webex_message)
+        return
+
+    if plan["name_text"]:
+        webex_message += f"Note: _Project **{plan['name_text']}** was not found, using project **{project_name}** with the same name._ \n"
+
+    if not project_id:
+        webex_message += (
+            "Status: **Unable to find project in Octopus Deploy.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please verify that you have spelled your project name correctly in the title \n"
+        )
+        catalog = catalog if catalog is not None else project_catalog()
+        suggestions = catalog.suggest(snow_item["short_description"])
+        if suggestions:
+            webex_message += "   - Did you mean: " + ", ".join(
+                f"_{project['Name']}_" for _, project, _ in suggestions
+            ) + " \n"
+        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes()) # TODO not necessary if we don't assign by default on line 83
+        post_to_webex(message=webex_message)
+        return
+
+    # find release in octopus deploy, releases were already looked up for the whole batch
+    release_details = find_release(
+        release_number=release_number, project_id=project_id
     )
 
-    # we only want to results if code is 200, otherwise return empty list
-    if results.status_code == 200:
-        results = results.json()
-        return results["Items"]
+    if not release_details:
+        webex_message += (
+            f"Status: **The release number {release_number} was not found in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure that the release in the ServiceNow item matches what release is being deployed. \n"
+        )
+        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+        post_to_webex(message=webex_message)
+        return
+
+    # if release is not scheduled
+    if not scheduled(
+        release_number=release_number,
+        project_name=project_name,
+        catalog=catalog,
+    ):
+        # Verify that environment is able to be promoted to prod
+        if not promotable(release_id=str(release_details["Id"])):
+            # IF ITS NOT PROMOTABLE post message
+            webex_message += (
+                f"Status: **The release number {release_number} is unable to be promoted to Production!** \n"
+                "_Possible Solutions:_ \n"
+                "   - Please ensure that the release has gone through the lifecycle in Octopus Deploy to reach Production and is in the correct channel. \n"
+            )
+            assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+            post_to_webex(message=webex_message)
+            return
+
+        # deployment resource for octopus deploy to create deployment
+        deployment_resource = {
+            "ReleaseId": release_details["Id"],
+            "ProjectId": release_details["ProjectId"],
+            "ChannelId": release_details["ChannelId"],
+            "EnvironmentId": scheduler_config["ProductionEnvironmentId"],
+            "QueueTime": to_central_time(
+                time=snow_item["planned_start_date"], add_delta=False
+            ),
+            "QueueTimeExpiry": to_central_time(
+                time=snow_item["planned_start_date"], add_delta=True
+            ),
+        }
+
+        # if the release is successful it will return true and we post to webex
+        if schedule_release(deployment_resource=deployment_resource):
+            add_queued_task(project_name=project_name, release_number=release_number)
+            webex_message += "Status: **Successfully assigned ServiceNow item and scheduled deployment in Octopus Deploy.** \n"
+            webex_message += "_No further action needed._ \n"
+        else:
+            # if it fails post to webex about the failure
+            webex_message += (
+                "Status: **FAILED to schedule deployment in Octopus Deploy.** \n"
+                "_Possible Solutions:_ \n"
+                "   - Verify that at minimum five minutes have been alloted to schedule the deployment. \n"
+                "   - Verify that date and time in the ServiceNow item are correct. \n"
+                "   - Verify that the Octopus Deploy server is up and running.  \n"
+            )
+            assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+        post_to_webex(message=webex_message)
     else:
-        log(results.text)
+        webex_message += (
+            "Status: **Release has already been scheduled in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Deployment has previously been scheduled, but verify that the date and time match what is on Change Task.  \n"
+        )
+
+        post_to_webex(message=webex_message)
+
+def queued_deployments() -> list:
+    """Retrieves queued deployments from Octopus Deploy"""
+
+    # retrieve queued production deployments, the server does the filtering and we follow
+    # the page links so nothing is left out however long the queue gets
+    try:
+        return list(
+            octopus_items(
+                scheduler_config["TasksEndpoint"],
+                params={
+                    "states": "Queued",
+                    "name": "Deploy",
+                    "environment": scheduler_config["ProductionEnvironmentId"],
+                    "take": 100,
+                },
+            )
+        )
+    except Exception as e:
+        error_string = str(e)
+        log(error_string)
         return []
-    
+
+def utc_instant(time_string: str) -> datetime:
+    """
+    Converts a time with a UTC offset to UTC so times from ServiceNow and Octopus Deploy compare as the same instant
+        Parameters:
+            time_string: YYYY-MM-DDTHH:MM:SS+HH:MM
+    """
+    try:
+        return datetime.fromisoformat(time_string).astimezone(utc)
+    except (TypeError, ValueError):
+        return None
+
 def filter_deployments(deployments: list) -> list:
     """
     Filters Octopus Deploy Deployments to specified critera
@@ -937,54 +2152,65 @@ def format_od_time(time_string) -> str:
         .isoformat()
     )
     
-def authorize_deployments(snow_items: list, deployments: list) -> None:
+def authorize_deployments(snow_items: list, deployments: list, catalog=None) -> None:
     """
     Verifies that each queued deployment in OD has a SNOW item that corresponds with the version number
         Parameters:
-            snow_items: List of items from SNOW
+            snow_items: List of items from SNOW, or any iterable of items such as iter_change_tasks
             deployments: Dict of OD queued deployments
+            catalog: project catalog for the run, loaded once if not passed in
     """
 
     # list comprehension to filter out nonessential task items that do not relate to deployments
     # we need this to be as specific as possible so that we do not cancel any queued tasks that are
-    # not production deployments with no change tickets
+    # not production deployments with no change tickets. The server already filters the tasks,
+    # this is kept in case a filter is ignored by an older Octopus Deploy server
     deployments = filter_deployments(deployments)
 
     # we only want to loop through if we have deployments
     if deployments:
+        catalog = catalog if catalog is not None else project_catalog()
+
         # placeholder for the webex message
         webex_message = ""
 
+        # read the project, release and time of each deployment once
+        queued = []
         for deployment in deployments:
-            # no deployment has yet been found so set initially to false
-            found = False
-
-            release_number = extract_release(deployment["Description"]).upper()
-            project_name = find_project_name(deployment["Description"]).upper()
-
-            # now that we have the release we need to check for a change task
-            if snow_items:
-                for snow_item in snow_items:
-                    # we need to convert the date and time of OD and SNOW to match either other
-                    deployment_time = format_od_time(
-                        time_string=deployment["QueueTime"]
-                    )
-                    snow_time = to_central_time(
-                        snow_item["planned_start_date"], add_delta=False
-                    )
-                    snow_release_number = extract_release(
-                        snow_item["short_description"]
-                    )
-                    snow_project_name = find_project_name(
-                        snow_item["short_description"]
-                    )
+            release_number = extract_release(deployment["Description"], catalog=catalog).upper()
+            project_name = find_project_name(deployment["Description"], catalog=catalog).upper()
+
+            # we need to convert the date and time of OD and SNOW to match either other
+            deployment_time = utc_instant(format_od_time(time_string=deployment["QueueTime"]))
+            queued.append((deployment, project_name, release_number, deployment_time))
+
+        # change tasks may be streamed from ServiceNow so they are read once, only the tasks that mention
+        # the project of a queued deployment are kept as they may have to be assigned back to the queue
+        project_names = {project_name for _, project_name, _, _ in queued}
+        matcher = ProjectMatcher(project_names)
+        keep_all = "" in project_names
+
+        # every change task is read once into a set keyed by project, release and start time,
+        # so each deployment is a single lookup instead of a pass over every change task
+        authorized = set()
+        related_items = []
+        for snow_item in snow_items or []:
+            snow_project_name, snow_release_number = resolve_title(
+                snow_item["short_description"], catalog=catalog
+            )
+            authorized.add(
+                (
+                    snow_project_name.upper(),
+                    snow_release_number.upper(),
+                    utc_instant(to_central_time(snow_item["planned_start_date"], add_delta=False)),
+                )
+            )
+            if keep_all or next(matcher.find_all(str(snow_item["short_description"]).upper()), None):
+                related_items.append(snow_item)
 
-                    # if a release number and project is found set it to true
-                    if project_name == snow_project_name.upper():
-                        if release_number == snow_release_number.upper():
-                            if deployment_time == snow_time:
-                                found = True
-                                break
+        for deployment, project_name, release_number, deployment_time in queued:
+            # a change task with the same project, release and time authorizes the deployment
+            found = (project_name, release_number, deployment_time) in authorized
 
             # if we go through the entire collection of service now items and do not find a release then it is
             # unauthorized deployment and needs to be canceled
@@ -1007,9 +2233,12 @@ def authorize_deployments(snow_items: list, deployments: list) -> None:
                 post_to_webex(message=webex_message)
 
                 # assign ticket back to queue if there is one because there is no valid change task when release numbers change
-                for snow_item in snow_items:
+                for snow_item in related_items:
                     if project_name in str(snow_item["short_description"]).upper():
-                        assign_snow_item(snow_item=snow_item, assign_to_queue=True)
+                        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+
+        # items sent back to the queue for cancelled deployments are updated together
+        change_task_writes().flush()
 
 def cancel_deployment(id: str) -> bool:
     """
@@ -1019,12 +2248,8 @@ def cancel_deployment(id: str) -> bool:
     """
     if id:
         try:
-            results = requests.post(
-                url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['TasksEndpoint']}/{id}/cancel",
-                headers={
-                    "X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"
-                },
-                verify=False,
+            results = octopus_client().post(
+                f"{scheduler_config['TasksEndpoint']}/{id}/cancel"
             )
         except Exception as e:
             error_string = str(e)
@@ -1057,16 +2282,525 @@ def export_to_file(data, filename):
     print(f"[SUCCESS] Data exported to {filename}")
 
 
+# ---- Async Engine ----
+# every blocking call runs on a worker thread through asyncio.to_thread so calls that do not depend on each
+# other are in flight at the same time, the per host limits of the clients still apply to every call
+async def find_releases_async(project_id: str, release_numbers: list) -> dict:
+    """Async counterpart of find_releases"""
+    return await asyncio.to_thread(find_releases, project_id=project_id, release_numbers=release_numbers)
+
+async def promotable_async(release_id: str) -> bool:
+    """Async counterpart of promotable"""
+    return await asyncio.to_thread(promotable, release_id=release_id)
+
+async def octopus_snapshot():
+    """
+    Downloads the projects and then the queued tasks from Octopus Deploy, the task index needs the projects
+    to read the project names of the tasks
+    """
+    catalog = await asyncio.to_thread(project_catalog, refresh=True)
+    await asyncio.to_thread(task_index, catalog=catalog, refresh=True)
+    return catalog
+
+async def prefetch_releases_async(plans: list, catalog=None) -> None:
+    """
+    Looks up the releases of every planned item for every project at the same time,
+    then checks if the releases that still have to be scheduled can be promoted, all at the same time
+        Parameters:
+            plans: planned ServiceNow items
+            catalog: project catalog for the run
+    """
+    groups = {}
+    for plan in plans:
+        if plan["project_id"] and plan["release_number"]:
+            groups.setdefault(plan["project_id"], set()).add(plan["release_number"])
+
+    found = await asyncio.gather(
+        *(
+            find_releases_async(project_id=project_id, release_numbers=list(release_numbers))
+            for project_id, release_numbers in groups.items()
+        )
+    )
+
+    # releases that are already scheduled are never checked by schedule_item so they are not checked here either
+    release_ids = set()
+    for plan in plans:
+        if not plan["project_id"] or not plan["release_number"]:
+            continue
+        release = found[list(groups).index(plan["project_id"])].get(plan["release_number"].upper())
+        if release and not scheduled(
+            release_number=plan["release_number"], project_name=plan["project_name"], catalog=catalog
+        ):
+            release_ids.add(str(release["Id"]))
+
+    await asyncio.gather(*(promotable_async(release_id=release_id) for release_id in release_ids))
+
+async def schedule_async(snow_items: list, catalog=None) -> None:
+    """
+    Async counterpart of schedule, items of different projects are scheduled at the same time and
+    items of the same project one after the other
+        Parameters:
+            snow_items: JSON response from ServiceNow
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    if not snow_items:
+        return
+
+    catalog = catalog if catalog is not None else await asyncio.to_thread(project_catalog)
+    limit = asyncio.Semaphore(int(scheduler_config.get("ScheduleWorkers", 4)))
+
+    async def schedule_group(plans: list) -> None:
+        async with limit:
+            await asyncio.to_thread(schedule_items, plans=plans, catalog=catalog)
+
+    batch_size = int(scheduler_config.get("ScheduleBatchSize", 100))
+    for i in range(0, len(snow_items), batch_size):
+        plans = [plan_item(snow_item=snow_item, catalog=catalog) for snow_item in snow_items[i : i + batch_size]]
+        await prefetch_releases_async(plans, catalog=catalog)
+        await asyncio.gather(*(schedule_group(group) for group in project_groups(plans)))
+
+        # items sent back to the queue are updated together once the batch is done
+        await asyncio.to_thread(change_task_writes().flush)
+
+# ---- Reconciler ----
+# reads ServiceNow and Octopus Deploy once, works out what both should look like as a plan of actions and
+# then applies only the actions that change something, items are only assigned once they are scheduled
+def take_snapshot() -> dict:
+    """
+    Reads everything the plan needs from ServiceNow and Octopus Deploy, nothing is written
+    Returns:
+        dict: change tasks, planned items, releases, promotion checks and queued deployments of the run
+    """
+    snow_items = get_change_tasks().get("result", [])
+    prefetch_parent_changes(snow_items)
+
+    catalog = project_catalog(refresh=True)
+    queued = {
+        (project_name, release_number)
+        for project_name, release_number, state in task_index(catalog=catalog, refresh=True)
+        if state == "Queued"
+    }
+    deployments = queued_deployments()
+
+    standard = {
+        snow_item["sys_id"]
+        for snow_item in snow_items
+        if is_a_standard_change(
+            snow_item["short_description"], parent_change_link(snow_item), parent_change_type(snow_item)
+        )
+    }
+
+    # tasks that are not assigned and tasks assigned to AUTOOCTOPUS that were not processed are looked at again
+    candidates = [
+        snow_item
+        for snow_item in snow_items
+        if not assigned_to_id(snow_item)
+        or (
+            assigned_to_automation(snow_item)
+            and "PROCESSED" not in snow_item["short_description"]
+            and snow_item["sys_id"] not in standard
+        )
+    ]
+    plans = [plan_item(snow_item=snow_item, catalog=catalog) for snow_item in candidates]
+
+    # releases are looked up for each project once, only releases that still have to be scheduled are checked for promotion
+    prefetch_releases(plans)
+    releases = {}
+    release_ids = set()
+    for plan in plans:
+        if not plan["project_id"] or not plan["release_number"]:
+            continue
+        release = find_release(release_number=plan["release_number"], project_id=plan["project_id"])
+        releases[(plan["project_id"], plan["release_number"])] = release
+        if release and (plan["project_name"], plan["release_number"]) not in queued:
+            release_ids.add(str(release["Id"]))
+
+    workers = int(scheduler_config.get("ScheduleWorkers", 4))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        promotions = dict(zip(release_ids, pool.map(promotable, release_ids)))
+
+    return {
+        "snow_items": snow_items,
+        "plans": plans,
+        "catalog": catalog,
+        "queued": queued,
+        "deployments": deployments,
+        "releases": releases,
+        "promotions": promotions,
+        "standard": standard,
+    }
+
+def item_message(snow_item: dict) -> str:
+    """
+    Builds the start of the webex message of a ServiceNow item
+        Parameters:
+            snow_item: item from ServiceNow
+    """
+    # we need to convert the UTC offset that OD uses to CST
+    start_time = convert_utc_offset(date_string=to_central_time(time=snow_item["planned_start_date"], add_delta=False))
+    end_time = convert_utc_offset(date_string=to_central_time(time=snow_item["planned_start_date"], add_delta=True))
+
+    return (
+        f'ServiceNow Item: _{snow_item["task_effective_number"]}_ \n'
+        f"Time: _{start_time} CST - {end_time} CST_ \n"
+        f'Description: _{snow_item["short_description"]}_ \n'
+    )
+
+def decide_item(plan: dict, snapshot: dict, scheduled_releases: set) -> dict:
+    """
+    Decides what should happen to a planned ServiceNow item, the same checks as schedule_item without any calls
+        Parameters:
+            plan: ServiceNow item planned by plan_item
+            snapshot: see take_snapshot
+            scheduled_releases: project name and release number of the releases scheduled by earlier items of the plan
+    Returns:
+        dict: the item, if it should be assigned (true), sent back to the queue (false) or left alone (None),
+              the deployment to schedule and the webex message with its text if the write fails
+    """
+    snow_item = plan["snow_item"]
+    decision = {
+        "snow_item": snow_item,
+        "assigned": None,
+        "deployment_resource": None,
+        "project_name": plan["project_name"],
+        "release_number": plan["release_number"],
+        "message": "",
+        "failed_message": "",
+    }
+
+    # items assigned to AUTOOCTOPUS that are not processed go back to the queue unless they are assigned again below
+    if assigned_to_id(snow_item):
+        decision["assigned"] = False
+
+    # we only want to schedule items that apply to OD
+    if not plan["action"]:
+        return decision
+
+    webex_message = item_message(snow_item)
+
+    if plan["action"] == "SKIP":
+        decision["assigned"] = True
+        decision["message"] = webex_message + (
+            f"Status: **Found override keyword SKIP.** \n"
+            f"  - ServiceNow item has been assigned to P-AUTOCTOPUS. \n"
+            f"  - Deployment HAS NOT been scheduled in Octopus Deploy. Development team will manually trigger the deployment. \n"
+            f"_No further action needed._ \n"
+        )
+        decision["failed_message"] = webex_message + "Status: ** - Failed to assign ServiceNow item to P-AUTOOCTOPUS.** \n"
+        return decision
+
+    if plan["action"] == "MANUAL":
+        decision["message"] = webex_message + (
+            "Status: **Found override keyword MANUAL** \n"
+            "   - Please assign this ServiceNow item to whoever will be on call the week of the deployment or Production Support. \n"
+        )
+        return decision
+
+    release_number = plan["release_number"]
+    project_name = plan["project_name"]
+
+    if not release_number:
+        decision["message"] = webex_message + (
+            "Status: **Unable to extract release from ServiceNow short description.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure title is in following format: \n"
+            "Deploy [_project name_] [_release number_] [_override_] \n"
+        )
+        return decision
+
+    if plan["name_text"]:
+        webex_message += f"Note: _Project **{plan['name_text']}** was not found, using project **{project_name}** with the same name._ \n"
+
+    if not plan["project_id"]:
+        webex_message += (
+            "Status: **Unable to find project in Octopus Deploy.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please verify that you have spelled your project name correctly in the title \n"
+        )
+        suggestions = snapshot["catalog"].suggest(snow_item["short_description"])
+        if suggestions:
+            webex_message += "   - Did you mean: " + ", ".join(
+                f"_{project['Name']}_" for _, project, _ in suggestions
+            ) + " \n"
+        decision["message"] = webex_message
+        return decision
+
+    release_details = snapshot["releases"].get((plan["project_id"], release_number))
+    if not release_details:
+        decision["message"] = webex_message + (
+            f"Status: **The release number {release_number} was not found in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure that the release in the ServiceNow item matches what release is being deployed. \n"
+        )
+        return decision
+
+    if (project_name, release_number) in snapshot["queued"] or (project_name, release_number) in scheduled_releases:
+        decision["assigned"] = True
+        decision["message"] = webex_message + (
+            "Status: **Release has already been scheduled in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Deployment has previously been scheduled, but verify that the date and time match what is on Change Task.  \n"
+        )
+        decision["failed_message"] = webex_message + "Status: **Failed to assign ServiceNow item to P-AUTOCTOPUS.** \n"
+        return decision
+
+    if not snapshot["promotions"].get(str(release_details["Id"])):
+        decision["message"] = webex_message + (
+            f"Status: **The release number {release_number} is unable to be promoted to Production!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure that the release has gone through the lifecycle in Octopus Deploy to reach Production and is in the correct channel. \n"
+        )
+        return decision
+
+    # the item is only assigned once the deployment is scheduled
+    decision["assigned"] = True
+    decision["deployment_resource"] = {
+        "ReleaseId": release_details["Id"],
+        "ProjectId": release_details["ProjectId"],
+        "ChannelId": release_details["ChannelId"],
+        "EnvironmentId": scheduler_config["ProductionEnvironmentId"],
+        "QueueTime": to_central_time(time=snow_item["planned_start_date"], add_delta=False),
+        "QueueTimeExpiry": to_central_time(time=snow_item["planned_start_date"], add_delta=True),
+    }
+    decision["message"] = webex_message + (
+        "Status: **Successfully assigned ServiceNow item and scheduled deployment in Octopus Deploy.** \n"
+        "_No further action needed._ \n"
+    )
+    decision["failed_message"] = webex_message + (
+        "Status: **FAILED to schedule deployment in Octopus Deploy.** \n"
+        "_Possible Solutions:_ \n"
+        "   - Verify that at minimum five minutes have been alloted to schedule the deployment. \n"
+        "   - Verify that date and time in the ServiceNow item are correct. \n"
+        "   - Verify that the Octopus Deploy server is up and running.  \n"
+    )
+    scheduled_releases.add((project_name, release_number))
+    return decision
+
+def snow_item_key(snow_item: dict, catalog) -> tuple:
+    """
+    Project name, release number and start time of a ServiceNow item, a queued deployment with the same key is authorized
+        Parameters:
+            snow_item: item from ServiceNow
+            catalog: project catalog for the run
+    """
+    project_name, release_number = resolve_title(snow_item["short_description"], catalog=catalog)
+    return (
+        project_name.upper(),
+        release_number.upper(),
+        utc_instant(to_central_time(snow_item["planned_start_date"], add_delta=False)),
+    )
+
+def plan_changes(snapshot: dict) -> list:
+    """
+    Works out the actions that bring ServiceNow and Octopus Deploy to where they should be, nothing is called.
+    Every action has an id and may depend on the outcome of an earlier action:
+        schedule: schedule deployment_resource in Octopus Deploy
+        cancel: cancel deployment in Octopus Deploy
+        assign: assign snow_item to AUTOOCTOPUS, after and unless name the action it depends on
+        requeue: assign snow_item back to the queue, after and unless name the action it depends on
+        notify: post message to webex, failed_message instead if outcome_of failed
+        Parameters:
+            snapshot: see take_snapshot
+    """
+    catalog = snapshot["catalog"]
+
+    scheduled_releases = set()
+    decisions = {}
+    for plan in snapshot["plans"]:
+        decisions[plan["snow_item"]["sys_id"]] = decide_item(
+            plan=plan, snapshot=snapshot, scheduled_releases=scheduled_releases
+        )
+
+    # tasks that end up assigned to AUTOOCTOPUS authorize the queued deployments, see authorize_deployments
+    assigned_items = [
+        snow_item
+        for snow_item in snapshot["snow_items"]
+        if snow_item["sys_id"] in decisions and decisions[snow_item["sys_id"]]["assigned"]
+    ] + [
+        snow_item
+        for snow_item in snapshot["snow_items"]
+        if snow_item["sys_id"] not in decisions and assigned_to_automation(snow_item)
+    ]
+    keys = {snow_item["sys_id"]: snow_item_key(snow_item, catalog=catalog) for snow_item in assigned_items}
+    authorized = set(keys.values())
+
+    cancels = []
+    live = {
+        key
+        for sys_id, key in keys.items()
+        if sys_id in decisions and decisions[sys_id]["deployment_resource"]
+    }
+    for deployment in filter_deployments(snapshot["deployments"]):
+        key = (
+            find_project_name(deployment["Description"], catalog=catalog).upper(),
+            extract_release(deployment["Description"], catalog=catalog).upper(),
+            utc_instant(format_od_time(time_string=deployment["QueueTime"])),
+        )
+        if key in authorized:
+            live.add(key)
+        else:
+            cancels.append((deployment, key[0]))
+
+    # a task of a cancelled deployment's project goes back to the queue so it is scheduled again, unless
+    # its own deployment is still queued or scheduled by this plan
+    for deployment, project_name in cancels:
+        for snow_item in assigned_items:
+            if project_name in str(snow_item["short_description"]).upper() and keys[snow_item["sys_id"]] not in live:
+                decision = decisions.setdefault(
+                    snow_item["sys_id"],
+                    {"snow_item": snow_item, "deployment_resource": None, "message": "", "failed_message": ""},
+                )
+                decision["assigned"] = False
+                decision["failed_message"] = ""
+
+    actions = []
+    notifications = []
+    for decision in decisions.values():
+        snow_item = decision["snow_item"]
+        schedule_id = None
+        if decision["deployment_resource"] and decision["assigned"]:
+            schedule_id = f"schedule-{snow_item['sys_id']}"
+            actions.append(
+                {
+                    "id": schedule_id,
+                    "action": "schedule",
+                    "deployment_resource": decision["deployment_resource"],
+                    "project_name": decision["project_name"],
+                    "release_number": decision["release_number"],
+                }
+            )
+
+        write_id = None
+        if decision["assigned"] is not None:
+            json_body = change_task_body(snow_item=snow_item, assign_to_queue=not decision["assigned"])
+            if pending_change(snow_item, json_body):
+                write_id = f"{'assign' if decision['assigned'] else 'requeue'}-{snow_item['sys_id']}"
+                actions.append(
+                    {
+                        "id": write_id,
+                        "action": "assign" if decision["assigned"] else "requeue",
+                        "snow_item": snow_item,
+                        "after": schedule_id,
+                    }
+                )
+            # an item that is assigned already goes back to the queue if its deployment could not be scheduled
+            if schedule_id and assigned_to_id(snow_item):
+                actions.append(
+                    {"id": f"requeue-{snow_item['sys_id']}", "action": "requeue", "snow_item": snow_item, "unless": schedule_id}
+                )
+
+        if decision["message"]:
+            notifications.append(
+                {
+                    "id": f"notify-{snow_item['sys_id']}",
+                    "action": "notify",
+                    "message": decision["message"],
+                    "failed_message": decision["failed_message"],
+                    "outcome_of": schedule_id or write_id,
+                }
+            )
+
+    for deployment, _ in cancels:
+        cancel_id = f"cancel-{deployment['Id']}"
+        actions.append({"id": cancel_id, "action": "cancel", "deployment": deployment})
+        notifications.append(
+            {
+                "id": f"notify-{deployment['Id']}",
+                "action": "notify",
+                "message": (
+                    f"Deployment **{deployment['Description']}** was cancelled because there was no Change Task matching the deployment info in Octopus Deploy. \n"
+                    "   - If a Change or Task has been pulled and then added back into the ServiceNow queue it will automatically be rescheduled within 2 run cycles. \n"
+                    "   - If the deployment time or release number on the Change Task has changed it will automatically be rescheduled. \n"
+                    "_No further action needed._ \n"
+                ),
+                "failed_message": (
+                    f"**{deployment['Description']}** does not have an associated Change Task. Attemped to cancel but encountered an error. \n"
+                    "_Possible solutions:_ \n"
+                    "   - Associate a Change Task with this release. \n"
+                    "   - Cancel deployment manually. \n"
+                ),
+                "outcome_of": cancel_id,
+            }
+        )
+
+    return actions + notifications
+
+def apply_octopus_action(action: dict) -> bool:
+    """
+    Schedules or cancels a deployment in Octopus Deploy
+        Parameters:
+            action: schedule or cancel action, see plan_changes
+    """
+    if action["action"] == "cancel":
+        return cancel_deployment(id=action["deployment"]["Id"])
+
+    if schedule_release(deployment_resource=action["deployment_resource"]):
+        add_queued_task(project_name=action["project_name"], release_number=action["release_number"])
+        return True
+    return False
+
+def apply_changes(actions: list) -> dict:
+    """
+    Applies a plan, Octopus Deploy first, then the ServiceNow updates through the write queue and then the webex messages
+        Parameters:
+            actions: see plan_changes
+    Returns:
+        dict: id of every applied action and true if it succeeded
+    """
+    outcomes = {}
+    workers = int(scheduler_config.get("ScheduleWorkers", 4))
+
+    # deployments do not depend on each other, they are scheduled and cancelled on a bounded pool of workers
+    octopus_actions = [action for action in actions if action["action"] in ("schedule", "cancel")]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for action, outcome in zip(octopus_actions, pool.map(apply_octopus_action, octopus_actions)):
+            outcomes[action["id"]] = outcome
+
+    writes = {}
+    for action in actions:
+        if action["action"] not in ("assign", "requeue"):
+            continue
+        if action.get("after") and not outcomes.get(action["after"]):
+            continue
+        if action.get("unless") and outcomes.get(action["unless"], True):
+            continue
+        assign_snow_item(
+            snow_item=action["snow_item"], assign_to_queue=action["action"] == "requeue", queue=change_task_writes()
+        )
+        writes[action["id"]] = action["snow_item"]["sys_id"]
+
+    results = change_task_writes().flush()
+    for action_id, sys_id in writes.items():
+        outcomes[action_id] = results.get(sys_id, False)
+
+    messages = {}
+    for action in actions:
+        if action["action"] != "notify":
+            continue
+        failed = action["outcome_of"] and not outcomes.get(action["outcome_of"], True)
+        messages[action["id"]] = action["failed_message"] if failed and action["failed_message"] else action["message"]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for action_id, outcome in zip(messages, pool.map(post_to_webex, messages.values())):
+            outcomes[action_id] = outcome
+
+    return outcomes
+
 # ---- Run Method (From main.py) ----
 def run():
     print("\n--------------------")
     print(f"PROCESS STARTED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}")
     print(f"ENVIRONMENT: {os.getenv('ASPNETCORE_ENVIRONMENT', 'Development').upper()}")
 
+    call_report().phase("GET TASKS")
     change_task_data = get_change_tasks()
+
+    # the parent changes of every task are read in as few requests as possible
+    prefetch_parent_changes(change_task_data.get("result", []))
+    # assigned_to comes back as the sys_id of the user since reference links are excluded
     unassign_tasks = [
         task for task in change_task_data.get("result", [])
-        if task.get("assigned_to", {}).get("display_value", "").lower() == "autooctopus"
+        if assigned_to_automation(task)
         and "PROCESSED" not in task.get("short_description", "").upper()
     ]
     print(f"UNASSIGN TASK COUNT: {len(unassign_tasks)}")
@@ -1074,28 +2808,118 @@ def run():
 
     unassigned_tasks = [
         task for task in change_task_data.get("result", [])
-        if task.get("assigned_to", {}).get("display_value", "").lower() != "autooctopus"
+        if not assigned_to_automation(task)
     ]
     print(f"UNASSIGNED TASK COUNT: {len(unassigned_tasks)}")
     print("--------------------")
 
+    # projects are downloaded from OD once and shared by scheduling and authorizing
+    call_report().phase("SCHEDULE")
+    catalog = project_catalog(refresh=True)
+
     if unassigned_tasks:
         print("[INFO] Scheduling change tasks...")
-        schedule(unassigned_tasks)
+        schedule(unassigned_tasks, catalog=catalog)
     print("--------------------")
 
+    call_report().phase("GET QUEUED DEPLOYMENTS")
     deployments = queued_deployments()
     print(f"QUEUED DEPLOYMENTS COUNT: {len(deployments)}")
     print("--------------------")
 
+    # tasks scheduled above were assigned in place so they are picked up without reading ServiceNow again
     assigned_tasks = [
         task for task in change_task_data.get("result", [])
-        if task.get("assigned_to", {}).get("display_value", "").lower() == "autooctopus"
+        if assigned_to_automation(task)
     ]
     print(f"ASSIGNED TASK COUNT: {len(assigned_tasks)}")
     print("--------------------")
 
-    authorize_deployments(snow_items=assigned_tasks, deployments=deployments)
+    call_report().phase("AUTHORIZE DEPLOYMENTS")
+    authorize_deployments(snow_items=assigned_tasks, deployments=deployments, catalog=catalog)
+    print("--------------------")
+
+    print(f"PROCESS FINISHED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}")
+    print("--------------------")
+
+async def run_async():
+    """Same as run on the async engine, ServiceNow and Octopus Deploy are read at the same time"""
+    print("\n--------------------")
+    print(f"PROCESS STARTED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}")
+    print(f"ENVIRONMENT: {os.getenv('ASPNETCORE_ENVIRONMENT', 'Development').upper()}")
+
+    call_report().phase("GET TASKS AND QUEUED DEPLOYMENTS")
+    change_task_data, catalog, deployments = await asyncio.gather(
+        asyncio.to_thread(get_change_tasks),
+        octopus_snapshot(),
+        asyncio.to_thread(queued_deployments),
+    )
+
+    # the parent changes of every task are read in as few requests as possible
+    await asyncio.to_thread(prefetch_parent_changes, change_task_data.get("result", []))
+    unassign_tasks = [
+        task for task in change_task_data.get("result", [])
+        if assigned_to_automation(task)
+        and "PROCESSED" not in task.get("short_description", "").upper()
+    ]
+    print(f"UNASSIGN TASK COUNT: {len(unassign_tasks)}")
+    print("--------------------")
+
+    unassigned_tasks = [
+        task for task in change_task_data.get("result", [])
+        if not assigned_to_automation(task)
+    ]
+    print(f"UNASSIGNED TASK COUNT: {len(unassigned_tasks)}")
+    print("--------------------")
+
+    if unassigned_tasks:
+        print("[INFO] Scheduling change tasks...")
+        call_report().phase("SCHEDULE")
+        await schedule_async(unassigned_tasks, catalog=catalog)
+    print("--------------------")
+
+    # the queue was read before scheduling, deployments scheduled this run are checked again next run
+    print(f"QUEUED DEPLOYMENTS COUNT: {len(deployments)}")
+    print("--------------------")
+
+    assigned_tasks = [
+        task for task in change_task_data.get("result", [])
+        if assigned_to_automation(task)
+    ]
+    print(f"ASSIGNED TASK COUNT: {len(assigned_tasks)}")
+    print("--------------------")
+
+    call_report().phase("AUTHORIZE DEPLOYMENTS")
+    await asyncio.to_thread(
+        authorize_deployments, snow_items=assigned_tasks, deployments=deployments, catalog=catalog
+    )
+    print("--------------------")
+
+    print(f"PROCESS FINISHED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}")
+    print("--------------------")
+
+def run_reconciler():
+    """Same as run on the reconciler, every change is planned from one read of both systems before any is made"""
+    print("\n--------------------")
+    print(f"PROCESS STARTED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}")
+    print(f"ENVIRONMENT: {os.getenv('ASPNETCORE_ENVIRONMENT', 'Development').upper()}")
+
+    call_report().phase("SNAPSHOT")
+    snapshot = take_snapshot()
+    print(f"CHANGE TASK COUNT: {len(snapshot['snow_items'])}")
+    print(f"QUEUED DEPLOYMENTS COUNT: {len(snapshot['deployments'])}")
+    print("--------------------")
+
+    call_report().phase("PLAN")
+    actions = plan_changes(snapshot)
+    counts = {}
+    for action in actions:
+        counts[action["action"]] = counts.get(action["action"], 0) + 1
+    print(f"PLAN {', '.join(f'{name}: {count}' for name, count in sorted(counts.items())) or 'nothing to do'}")
+    print("--------------------")
+
+    call_report().phase("APPLY")
+    apply_changes(actions)
     print("--------------------")
 
     print(f"PROCESS FINISHED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}")
@@ -1103,7 +2927,34 @@ def run():
 
 # ---- Main Method ----
 def main():
-    run()
+    parser = argparse.ArgumentParser(description="Deployment Scheduler")
+    parser.add_argument(
+        "--engine",
+        choices=["sync", "async", "reconcile"],
+        default=scheduler_config.get("SchedulerEngine", "sync"),
+        help="engine the run goes through, the async engine reads SNOW and OD at the same time and "
+        "the reconciler plans every change before it makes any",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="make every read but only log the writes, then report the calls, bytes and time of each phase",
+    )
+    args = parser.parse_args()
+
+    # nothing is changed in SNOW, OD or Webex
+    enable_dry_run(args.dry_run)
+
+    if args.engine == "async":
+        asyncio.run(run_async())
+    elif args.engine == "reconcile":
+        run_reconciler()
+    else:
+        run()
+
+    if args.dry_run:
+        print("DRY RUN REPORT")
+        print(call_report().summary())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,59 @@
+import json
+import os
+from cmadevops_deployment_scheduler.config.config import scheduler_config
+from cmadevops_deployment_scheduler.modules.logwrite import log
+from cmadevops_deployment_scheduler.modules.clients import dry_run_enabled
+
+
+def state_path(file_name: str) -> str:
+    """
+    Builds the path of a file in the local state directory that is kept between runs
+        Parameters:
+            file_name: name of the state file
+    """
+    directory = scheduler_config.get(
+        "StateDirectory", os.getenv("SCHEDULER_STATE_DIRECTORY", ".scheduler_state")
+    )
+    return os.path.join(directory, file_name)
+
+
+def load_state(path: str) -> dict:
+    """
+    Loads state saved by a previous run, returns an empty dict if there is none
+        Parameters:
+            path: path of the state file
+    """
+    try:
+        with open(path, "r") as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        # a broken state file is treated as missing so the caller does a full sync
+        log(f"Unable to read state file {path}: {e}\n")
+        return {}
+
+
+def save_state(path: str, state: dict) -> bool:
+    """
+    Saves state for the next run
+        Parameters:
+            path: path of the state file
+            state: json serializable state
+    """
+    # a dry run leaves the state of the last real run alone, so the next real run does not skip what it has to do
+    if dry_run_enabled():
+        log(f"DRY RUN state file {path} not saved\n")
+        return False
+
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        # write to a temp file first so a failed run never leaves half a file behind
+        with open(f"{path}.tmp", "w") as state_file:
+            json.dump(state, state_file, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+        return True
+    except Exception as e:
+        log(f"Unable to save state file {path}: {e}\n")
+        return False
@@ -1,9 +1,13 @@
 from cmadevops_deployment_scheduler.modules.octopus_deploy import *
 from cmadevops_deployment_scheduler.modules.service_now import *
 from cmadevops_deployment_scheduler.modules.scheduler import *
+from cmadevops_deployment_scheduler.modules.run_fingerprint import run_fingerprint, can_skip_run, save_run_fingerprint
+from cmadevops_deployment_scheduler.modules.clients import call_report, enable_dry_run
 from cmadevops_deployment_scheduler.modules.logwrite import log
 
 
+import argparse
+import asyncio
 import os
 
 # TODO: Add more detailed logging to scheduler for debugging. We need to be able to see what it is doing as it goes through the process. 
@@ -17,53 +21,75 @@ def run():
         f"PROCESS STARTED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
     )
     log(f"ENVIRONMENT: {os.getenv('ASPNETCORE_ENVIRONMENT').upper()}\n")
+
+    # most runs have nothing to do, a couple of cheap probes tell us if anything changed since the last run
+    call_report().phase("FINGERPRINT")
+    fingerprint = run_fingerprint()
+    if can_skip_run(fingerprint):
+        log(
+            f"NOTHING CHANGED, PROCESS SKIPPED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+        )
+        log("-------------------- \n")
+        return
+
+    # get the active change tasks of the group from SNOW once, every phase works from this snapshot
+    # and assigning a task updates it in place so the later phases see it without asking SNOW again
+    call_report().phase("GET TASKS")
+    snapshot = change_task_snapshot(refresh=True)
+    log(
+        f"GET TASKS {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
+
     # sometimes change tasks get put in our queue already assigned to the AUTOOCTOPUS account
     # this will unassign it for automation to pick it up if the title does not contain PROCESSED
     # UNASSIGN is an experimental feature, while it works we were having some issues with it. More testing is needed before it can be put into production.
-    unassign(snow_items=change_tasks(assigned_to=True))
+    call_report().phase("UNASSIGN")
+    unassign(snow_items=snapshot.assigned())
     log(
         f"UNASSIGN {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
     )
     log("-------------------- \n")
 
-    # get tasks that are NOT ASSIGNED to AUTOOCTOPUS from SNOW
-    unassigned_tasks = change_tasks(assigned_to=False)
-    log(
-        f"GET TASKS {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
-    )
-    log("-------------------- \n")
+    # tasks that are NOT ASSIGNED to AUTOOCTOPUS, including the ones unassign just sent back to the queue
+    unassigned_tasks = snapshot.unassigned()
+
+    # projects are downloaded from OD once and shared by scheduling and authorizing
+    call_report().phase("SCHEDULE")
+    catalog = project_catalog(refresh=True)
 
     # schedule change tasks
-    if len(unassigned_tasks) > 0:
-        schedule(snow_items=unassigned_tasks)
+    schedule(snow_items=unassigned_tasks, catalog=catalog)
     log(
         f"SCHEDULE {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
     )
     log("-------------------- \n")
 
     # get queued deployments from OD
+    call_report().phase("GET QUEUED DEPLOYMENTS")
     deployments = queued_deployments()
     log(
         f"GET QUEUED DEPLOYMENTS {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
     )
     log("-------------------- \n")
 
-    # get tasks that ARE ASSIGNED to AUTOOCTOPUS from SNOW
+    # tasks that ARE ASSIGNED to AUTOOCTOPUS, including the ones scheduled this run
     # the purpose of this is we only want to authorize deployments with tasks that are already assigned
     # the deployment will get cancelled on the next run due it not finding a task since it has been assigned to AUTOOCTOPUS
-    assigned_tasks = change_tasks(assigned_to=True)
-    log(
-        f"GET ASSIGNED TASKS {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
-    )
-    log("-------------------- \n")
+    assigned_tasks = snapshot.assigned()
 
     # authorize current queued deployments  10/28/23 commented out due to errors on go-live of OD migration
-    authorize_deployments(snow_items=assigned_tasks, deployments=deployments)
+    call_report().phase("AUTHORIZE DEPLOYMENTS")
+    authorize_deployments(snow_items=assigned_tasks, deployments=deployments, catalog=catalog)
     log(
         f"AUTHORIZE DEPLOYMENTS {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
     )
     log("-------------------- \n")
 
+    # the next run is skipped if nothing changes until then
+    call_report().phase("SAVE FINGERPRINT")
+    save_run_fingerprint(fingerprint, snow_items=snapshot.snow_items, deployments=deployments)
+
     log(
         f"PROCESS FINISHED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
     )
@@ -71,7 +97,41 @@ def run():
 
 
 def main():
-    run()
+    parser = argparse.ArgumentParser(description="Deployment Scheduler")
+    parser.add_argument(
+        "--engine",
+        choices=["sync", "async", "reconcile"],
+        default=scheduler_config.get("SchedulerEngine", "sync"),
+        help="engine the run goes through, the async engine reads SNOW and OD at the same time and "
+        "the reconciler plans every change before it makes any",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="make every read but only log the writes, then report the calls, bytes and time of each phase",
+    )
+    args = parser.parse_args()
+
+    # nothing is changed in SNOW, OD or Webex and no state is saved for the next run
+    enable_dry_run(args.dry_run)
+
+    # the other engines are imported here so the synchronous engine does not depend on them
+    if args.engine == "async":
+        from cmadevops_deployment_scheduler.modules.async_engine import run_async
+
+        asyncio.run(run_async())
+    elif args.engine == "reconcile":
+        from cmadevops_deployment_scheduler.modules.reconciler import run_reconciler
+
+        run_reconciler()
+    else:
+        run()
+
+    # releases found by any of the engines are saved for the next run in one write
+    save_release_index()
+
+    if args.dry_run:
+        log(f"DRY RUN REPORT\n{call_report().summary()}")
 
 
 if __name__ == "__main__":
@@ -125,7 +125,8 @@ def get_project_by_id(projects, project_id):
 
 def get_latest_release(project_id):
     print(f"Fetching latest release for project ID: {project_id}")
-    url = f"{BASE_URL}/api/projects/{project_id}/releases"
+    # releases come back newest first so we only need the first one
+    url = f"{BASE_URL}/api/projects/{project_id}/releases?take=1"
     response = requests.get(url, headers=HEADERS, verify=False)
     releases = response.json().get("Items", [])
     if not releases:
@@ -0,0 +1,261 @@
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+
+
+class ProjectMatcher:
+    """
+    Aho-Corasick automaton over project names, finds every project name in a description in a single pass
+        Parameters:
+            names: upper case project names
+    """
+
+    def __init__(self, names):
+        # node 0 is the root, every node has its children, a failure link and the names that end on it
+        self.children = [{}]
+        self.failure = [0]
+        self.endings = [[]]
+
+        for name in names:
+            if not name:
+                continue
+
+            node = 0
+            for character in name:
+                child = self.children[node].get(character)
+                if child is None:
+                    child = len(self.children)
+                    self.children[node][character] = child
+                    self.children.append({})
+                    self.failure.append(0)
+                    self.endings.append([])
+                node = child
+            self.endings[node].append(name)
+
+        # breadth first so the failure link of a parent is always known before its children
+        queue = list(self.children[0].values())
+        for node in queue:
+            for character, child in self.children[node].items():
+                fallback = self.failure[node]
+                while fallback and character not in self.children[fallback]:
+                    fallback = self.failure[fallback]
+                target = self.children[fallback].get(character, 0)
+                self.failure[child] = target if target != child else 0
+                self.endings[child] = self.endings[child] + self.endings[self.failure[child]]
+                queue.append(child)
+
+    def find_all(self, text: str):
+        """
+        Yields start, end and name of every project name found in the text
+            Parameters:
+                text: upper case text to search
+        """
+        node = 0
+        for position, character in enumerate(text):
+            while node and character not in self.children[node]:
+                node = self.failure[node]
+            node = self.children[node].get(character, 0)
+            for name in self.endings[node]:
+                yield position + 1 - len(name), position + 1, name
+
+
+def _word_character(character: str) -> bool:
+    return character.isalnum() or character == "_"
+
+
+def _trigrams(word: str) -> set:
+    # pad the word so the start and end of the word count as well
+    word = f" {word} "
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+def _upper(text: str) -> str:
+    # some characters grow when upper cased, keep those as they are so positions line up with the original text
+    upper = text.upper()
+    if len(upper) != len(text):
+        upper = "".join(c.upper() if len(c.upper()) == 1 else c for c in text)
+    return upper
+
+
+class ProjectCatalog:
+    """
+    Run-scoped index of Octopus Deploy projects
+        Parameters:
+            od_projects: list of projects from Octopus Deploy
+    """
+
+    def __init__(self, od_projects: list):
+        # keep the original order, some lookups still return the first project that matches
+        self.projects = list(od_projects or [])
+
+        # all keys are upper case to avoid cAsE problems
+        self.by_name = {}
+        self.by_slug = {}
+        self.by_id = {}
+        for project in self.projects:
+            self.by_name.setdefault(str(project["Name"]).upper(), project)
+            if project.get("Slug"):
+                self.by_slug.setdefault(str(project["Slug"]).upper(), project)
+            self.by_id.setdefault(str(project["Id"]).upper(), project)
+
+        # built on first use, a catalog never changes once it is loaded
+        self._matcher = None
+        self._trigram_index = None
+        self._joined_names = None
+
+    def __len__(self) -> int:
+        return len(self.projects)
+
+    def __iter__(self):
+        return iter(self.projects)
+
+    def get(self, key: str) -> dict:
+        """
+        Finds a project by name, slug or id
+            Parameters:
+                key: project name, slug or id from Octopus Deploy
+        """
+        if not key:
+            return {}
+
+        key = str(key).upper()
+        return self.by_name.get(key) or self.by_slug.get(key) or self.by_id.get(key) or {}
+
+    def match(self, text: str) -> tuple:
+        """
+        Finds the longest project name in the text that is not part of a bigger word
+            Parameters:
+                text: short description from ServiceNow or Octopus Deploy
+        Returns:
+            tuple: project, start and end of the name in the text, or None if no project was found
+        """
+        if not text:
+            return None
+
+        if self._matcher is None:
+            self._matcher = ProjectMatcher(self.by_name.keys())
+
+        upper = _upper(str(text))
+        best = None
+        for start, end, name in self._matcher.find_all(upper):
+            # the name must not be glued to the words around it
+            if start > 0 and _word_character(upper[start - 1]) and _word_character(name[0]):
+                continue
+            if end < len(upper) and _word_character(upper[end]) and _word_character(name[-1]):
+                continue
+
+            # longest name wins, if two are the same length the first one in the text wins
+            if best is None or (end - start, -start) > (best[1] - best[0], -best[0]):
+                best = (start, end, name)
+
+        if best is None:
+            return None
+
+        return self.by_name[best[2]], best[0], best[1]
+
+    def match_joined(self, text: str) -> tuple:
+        """
+        Finds the longest project name in the text written with other separators or in another case,
+        such as Billing-API or BillingAPI for Billing API. The words of the text must join up to exactly
+        the name, a release number is never joined to a word and nothing is guessed
+            Parameters:
+                text: short description from ServiceNow or Octopus Deploy
+        Returns:
+            tuple: project, start and end of the name in the text, or None if no project was found
+        """
+        if not text:
+            return None
+
+        if self._joined_names is None:
+            self._joined_names = {}
+            for key, project in self.by_name.items():
+                joined = "".join(re.findall(r"[^\W_]+", key))
+                if joined:
+                    self._joined_names.setdefault(joined, project)
+            self._longest_joined = max((len(joined) for joined in self._joined_names), default=0)
+
+        # a dotted number such as 2.1 is one word so no part of a release number ends up in a name
+        words = [(m.group(), m.start(), m.end()) for m in re.finditer(r"\d+(?:\.\d+)+|[^\W_]+", _upper(str(text)))]
+        best = None
+        for i in range(len(words)):
+            joined = ""
+            for word, _, end in words[i:]:
+                joined += word
+                if "." in word or len(joined) > self._longest_joined:
+                    break
+                if joined in self._joined_names and (best is None or end - words[i][1] > best[2] - best[1]):
+                    best = (self._joined_names[joined], words[i][1], end)
+
+        return best
+
+    def suggest(self, text: str, limit: int = 3) -> list:
+        """
+        Finds the projects with names closest to the words in the text, used when a project name is misspelled
+            Parameters:
+                text: short description from ServiceNow
+                limit: max number of suggestions
+        Returns:
+            list: score between 0 and 1, project and the words in the text that look like the project name,
+                  best match first
+        """
+        if not text:
+            return []
+
+        if self._trigram_index is None:
+            self._build_trigram_index()
+
+        # words keep their position so we can hand back the original text of the best match. A dotted release
+        # number is read as one word and left out, numbers on their own stay as names such as ETL 10 have them
+        words = [
+            (m.group(), m.start(), m.end())
+            for m in re.finditer(r"\d+(?:\.\d+)+|[^\W_]+|_+", _upper(str(text)))
+            if "." not in m.group()
+        ]
+        grams = set()
+        for word, _, _ in words:
+            grams |= _trigrams(word)
+
+        # count the trigrams each name shares with the text, only names sharing something are candidates
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigram_index.get(gram, ()))
+
+        candidates = sorted(
+            shared, key=lambda name: shared[name] / self._name_trigrams[name], reverse=True
+        )[:10]
+
+        # compare each candidate with every run of text words that is as long as the name
+        suggestions = []
+        for name in candidates:
+            name_words = name.split(" ")
+            best = (0.0, "")
+            for i in range(len(words) - len(name_words) + 1):
+                window = words[i : i + len(name_words)]
+                score = SequenceMatcher(
+                    None, name, " ".join(w for w, _, _ in window)
+                ).ratio()
+                if score > best[0]:
+                    best = (score, str(text)[window[0][1] : window[-1][2]])
+            if best[0]:
+                suggestions.append((round(best[0], 3), self._normalized[name], best[1]))
+
+        suggestions.sort(key=lambda suggestion: suggestion[0], reverse=True)
+        return suggestions[:limit]
+
+    def _build_trigram_index(self):
+        # names are compared on their words only so punctuation does not count against them
+        self._normalized = {}
+        self._name_trigrams = {}
+        self._trigram_index = {}
+        for key, project in self.by_name.items():
+            name = " ".join(re.findall(r"[^\W_]+|_+", key))
+            if not name or name in self._normalized:
+                continue
+
+            self._normalized[name] = project
+            grams = set()
+            for word in name.split(" "):
+                grams |= _trigrams(word)
+            self._name_trigrams[name] = len(grams)
+            for gram in grams:
+                self._trigram_index.setdefault(gram, []).append(name)
@@ -1,13 +1,39 @@
 import pytz
-import requests
 from cmadevops_deployment_scheduler.config.config import scheduler_config
 from datetime import datetime, timedelta
 from pytz import utc, timezone
-from cmadevops_deployment_scheduler.modules.service_now import assign_snow_item
+from cmadevops_deployment_scheduler.modules.service_now import assign_snow_item, change_task_writes
 from cmadevops_deployment_scheduler.modules.webex import post_to_webex
 from cmadevops_deployment_scheduler.modules.logwrite import log
+from cmadevops_deployment_scheduler.modules.octopus_catalog import ProjectCatalog, ProjectMatcher
+from cmadevops_deployment_scheduler.modules.local_state import state_path, load_state, save_state
+from cmadevops_deployment_scheduler.modules.clients import octopus_client
 import re
 import os
+import threading
+import urllib.parse
+
+# project catalog shared by every helper for the lifetime of the run
+_project_catalog = None
+
+# releases found during the run keyed by project id and upper case release number
+_release_cache = {}
+
+# releases of each project kept on disk between runs, loaded on first use and saved once at the end of the run
+_release_index = None
+_release_index_synced = set()
+_release_index_changed = False
+
+# Octopus Deploy tasks of the run keyed by project name, release number and task state, loaded on first use
+_task_index = None
+
+# promotion check of each release, a release is checked once per run no matter how many items point at it
+_progression_cache = {}
+
+# items are scheduled on several threads, the lazily loaded state above is only built and changed under these locks.
+# The task index has its own lock so the tasks can be downloaded while releases are synced
+_state_lock = threading.RLock()
+_task_index_lock = threading.RLock()
 
 
 def format_od_time(time_string) -> str:
@@ -26,44 +52,76 @@ def format_od_time(time_string) -> str:
     )
 
 
-def scheduled(release_number: str, project_name=str) -> bool:
+def task_index(catalog: ProjectCatalog = None, refresh: bool = False) -> dict:
     """
-    Verifies if a release is scheduled in Octopus Deploy
+    Counts the queued Octopus Deploy deployment tasks by project name, release number and state,
+    the tasks are downloaded and parsed once per run
         Parameters:
-            release_number: Release number from Octopus Deploy
+            catalog: project catalog for the run, loaded once if not passed in
+            refresh: if set to true the tasks are downloaded again
     """
+    global _task_index
 
-    # retrieve current server tasks
-    if release_number:
+    with _task_index_lock:
+        if _task_index is not None and not refresh:
+            return _task_index
+
+        # retrieve the queued deployment tasks, the server filters them so only candidates are downloaded
         try:
-            results = requests.get(
-                url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['TasksEndpoint']}",
-                headers={
-                    "X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"
-                },
-                verify=False,
+            tasks = list(
+                octopus_items(
+                    scheduler_config["TasksEndpoint"],
+                    params={"states": "Queued", "name": "Deploy", "take": 100},
+                )
             )
         except Exception as e:
+            # the index is not kept so the next call tries again
             error_string = str(e)
             log(error_string)
-            return False
+            return {}
 
-        # we only want to results if code is 200, otherwise return false
-        if results.status_code == 200:
-            results = results.json()
+        catalog = catalog if catalog is not None else project_catalog()
 
-            # find release number in the description if it's found and the state is queued then
-            # this release is already scheduled so return true
-            for r in results["Items"]:
-                if (
-                    release_number == extract_release(r["Description"])
-                    and r["State"] == "Queued"
-                    and "Release Approval" not in r["Description"]
-                    and project_name == find_project_name(r["Description"])
-                ):
-                    return True
-        else:
-            log(results.text)
+        index = {}
+        for r in tasks:
+            if "Release Approval" in r["Description"]:
+                continue
+
+            key = (
+                find_project_name(r["Description"], catalog=catalog),
+                extract_release(r["Description"], catalog=catalog),
+                r["State"],
+            )
+            index[key] = index.get(key, 0) + 1
+
+        _task_index = index
+        return _task_index
+
+
+def add_queued_task(project_name: str, release_number: str) -> None:
+    """
+    Adds a deployment scheduled during the run to the task index so later items see it as scheduled
+        Parameters:
+            project_name: project name from Octopus Deploy
+            release_number: release number from Octopus Deploy
+    """
+    with _task_index_lock:
+        if _task_index is not None:
+            key = (project_name, release_number, "Queued")
+            _task_index[key] = _task_index.get(key, 0) + 1
+
+
+def scheduled(release_number: str, project_name=str, catalog: ProjectCatalog = None) -> bool:
+    """
+    Verifies if a release is scheduled in Octopus Deploy
+        Parameters:
+            release_number: Release number from Octopus Deploy
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+
+    # if the release has a queued task then this release is already scheduled so return true
+    if release_number:
+        return (project_name, release_number, "Queued") in task_index(catalog=catalog)
     return False
 
 
@@ -73,13 +131,13 @@ def promotable(release_id: str) -> bool:
         Parameters:
             release_id: ID of release
     """
+    if release_id in _progression_cache:
+        return _progression_cache[release_id]
 
     # get the release progression
     try:
-        results = requests.get(
-            url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['ReleaseEndpoint']}/{release_id}/progression",
-            headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-            verify=False,
+        results = octopus_client().get(
+            f"{scheduler_config['ReleaseEndpoint']}/{release_id}/progression"
         )
     except:
         return False
@@ -100,7 +158,9 @@ def promotable(release_id: str) -> bool:
                 and r["Progress"] == "Current"
                 or r["Progress"] == "Complete"
             ):
+                _progression_cache[release_id] = True
                 return True
+        _progression_cache[release_id] = False
         return False
     else:
         log(results.text)
@@ -127,71 +187,63 @@ def to_central_time(time=str, add_delta=bool) -> str:
     cst_time = timezone("US/Central")
     return utc_time.astimezone(cst_time).isoformat()
 
-# TODO Seems inefficient to query all projects in OD just to remove the project name
-def remove_project_name(short_description=str) -> str:
+def remove_project_name(short_description=str, catalog: ProjectCatalog = None) -> str:
     """Removes project name from short description
 
     Args:
         short_description (_type_, optional): SNOW short description. Defaults to str.
+        catalog (ProjectCatalog, optional): project catalog for the run. Loaded once if not passed in.
 
     Returns:
         str: returns short description with project name removed
     """
     try:
-        od_projects = projects()
+        od_projects = catalog if catalog is not None else project_catalog()
     except:
         return ""
 
-    for project in od_projects:
-        if (
-            re.search(
-                r"\b{}\b".format(str(project["Name"])), short_description, re.IGNORECASE
-            )
-            is not None
-        ):
-            short_description = short_description.replace(project["Name"], "")
-            break
+    # the catalog finds the longest project name in one pass instead of running a regex per project
+    found = od_projects.match(short_description)
+    if found:
+        short_description = re.sub(
+            re.escape(str(found[0]["Name"])), "", short_description, flags=re.IGNORECASE
+        )
     return short_description
 
 
-def find_project_name(short_description=str) -> str:
+def find_project_name(short_description=str, catalog: ProjectCatalog = None) -> str:
     """Returns project name from short description
 
     Args:
         short_description (_type_, optional): SNOW short description. Defaults to str.
+        catalog (ProjectCatalog, optional): project catalog for the run. Loaded once if not passed in.
 
     Returns:
         str: returns project name
     """
     project_name = ""
     try:
-        od_projects = projects()
+        od_projects = catalog if catalog is not None else project_catalog()
     except:
         return project_name
 
-    for project in od_projects:
-        if (
-            re.search(
-                r"\b{}\b".format(str(project["Name"])), short_description, re.IGNORECASE
-            )
-            is not None
-        ):
-            project_name = project["Name"]
-            break
+    found = od_projects.match(short_description)
+    if found:
+        project_name = found[0]["Name"]
 
     return project_name
 
 
-def extract_release(short_description: str) -> str:
+def extract_release(short_description: str, catalog: ProjectCatalog = None) -> str:
     """
     Extracts release from description in ServiceNow
         Parameters:
             short_description: short description of Change Task in ServiceNow
-
+            catalog: project catalog for the run, loaded once if not passed in
     """
     # to avoid extracting project names as version numbers due to some projects having numbers in their names
     # we find the project name in the description and remove it as we just want the version number
-    short_description = remove_project_name(short_description=short_description)
+    short_description = remove_project_name(short_description=short_description, catalog=catalog)
 
     # use regex to find version number in the short description
     release_number = ""
@@ -206,18 +258,17 @@ def extract_release(short_description: str) -> str:
     return release_number
 
 
-def find_project_id(short_description: str) -> str:
+def find_project_id(short_description: str, catalog: ProjectCatalog = None) -> str:
     """
     Finds project id in OctopusDeploy from the ServiceNow description
     Parameters:
         short_description: short description of Change Task in ServiceNow
+        catalog: project catalog for the run, loaded once if not passed in
     """
 
-    # TODO improvement: convert project name in short_description to slug, pass slug to projects() function
-
     # get list of projects from OD return empty string if there is an error
     try:
-        od_projects = projects()
+        od_projects = catalog if catalog is not None else project_catalog()
     except:
         return ""
 
@@ -230,7 +281,12 @@ def find_project_id(short_description: str) -> str:
 
     # we want to make sure that the paramters were passed in
     if short_description:
-        # look for the project name in the ServiceNow short description
+        # the longest project name that stands on its own wins
+        found = od_projects.match(short_description)
+        if found:
+            return found[0]["Id"]
+
+        # otherwise look for the project name anywhere in the ServiceNow short description
         for project in od_projects:
             if str(project["Name"]).upper() in short_description:
                 return project["Id"]
@@ -242,24 +298,379 @@ def find_project_id(short_description: str) -> str:
 
 def projects() -> list:
     """Gets a list of all projects from Octopus Deploy"""
+    # page through the projects so we do not silently stop at the page size once there are more projects
     try:
-        results = requests.get(
-            url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['ProjectsEndpoint']}?take=999",
-            headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-            verify=False,
+        return list(
+            octopus_items(scheduler_config["ProjectsEndpoint"], params={"take": 999})
         )
-    except:
+    except Exception as e:
+        log(str(e))
         return []
 
-    # we only want results if the status code is 200
-    if results.status_code == 200:
+
+def octopus_items(endpoint: str, params: dict = None):
+    """
+    Yields every item of an Octopus Deploy collection, following the next page links
+        Parameters:
+            endpoint: Octopus Deploy API endpoint
+            params: query string parameters for the first page
+    """
+    url = endpoint
+
+    while url:
+        results = octopus_client().get(url, params=params)
+
+        if results.status_code != 200:
+            log(results.text)
+            raise Exception(f"Octopus Deploy returned {results.status_code} for {url}")
+
         results = results.json()
-        return results["Items"]
+        for item in results["Items"]:
+            yield item
+
+        # the next page link already has the query string in it
+        url = results.get("Links", {}).get("Page.Next")
+        params = None
+
+
+def compact_project(project: dict) -> dict:
+    """
+    Keeps only the project fields the scheduler needs
+        Parameters:
+            project: project from Octopus Deploy
+    """
+    return {
+        "Id": project["Id"],
+        "Name": project["Name"],
+        "Slug": project.get("Slug", ""),
+        "LastModifiedOn": project.get("LastModifiedOn", ""),
+    }
+
 
-    # return empty list if it is other than 200
+def changed_projects(since: str) -> dict:
+    """
+    Finds projects that were created, modified or deleted since the last sync using the events feed
+        Parameters:
+            since: ISO timestamp of the last sync
+    Returns:
+        dict: project id and the latest event category for that project
+    """
+    changes = {}
+
+    # go back a few minutes in case the clocks are not exactly in step, reading an event twice does no harm
+    overlap = timedelta(seconds=int(scheduler_config.get("ProjectSyncOverlapSeconds", 300)))
+    since = (datetime.fromisoformat(since) - overlap).isoformat()
+
+    # events come back newest first so the first event for a project is the latest one
+    for event in octopus_items(
+        scheduler_config.get("EventsEndpoint", "/api/events"),
+        params={
+            "documentTypes": "Projects",
+            "eventCategories": "Created,Modified,Deleted",
+            "from": since,
+        },
+    ):
+        for document_id in event.get("RelatedDocumentIds", []):
+            if document_id.startswith("Projects-") and document_id not in changes:
+                changes[document_id] = event["Category"]
+
+    return changes
+
+
+def get_project(project_id: str) -> dict:
+    """
+    Gets a single project from Octopus Deploy, returns an empty dict if it does not exist
+        Parameters:
+            project_id: id of project in Octopus Deploy
+    """
+    results = octopus_client().get(f"{scheduler_config['ProjectsEndpoint']}/{project_id}")
+
+    if results.status_code == 200:
+        return results.json()
+    elif results.status_code == 404:
+        return {}
     else:
         log(results.text)
-        return []
+        raise Exception(f"Octopus Deploy returned {results.status_code} for {project_id}")
+
+
+def sync_projects() -> list:
+    """
+    Gets projects from the snapshot saved by the previous run and only downloads the projects that changed.
+    Every ProjectCatalogFullSyncRuns runs, or when there is no snapshot, all projects are downloaded again.
+    """
+    path = state_path(scheduler_config.get("ProjectCatalogFile", "project_catalog.json"))
+    snapshot = load_state(path)
+    full_sync_runs = int(scheduler_config.get("ProjectCatalogFullSyncRuns", 24))
+
+    # the sync start time becomes the next watermark so events that happen while we sync are picked up next run
+    synced_on = datetime.now(utc).isoformat()
+    od_projects = None
+
+    if snapshot.get("Projects") and snapshot.get("RunsSinceFullSync", 0) < full_sync_runs:
+        try:
+            od_projects = {p["Id"]: p for p in snapshot["Projects"]}
+            for project_id, category in changed_projects(since=snapshot["LastSyncedOn"]).items():
+                changed = {} if category == "Deleted" else get_project(project_id)
+                if changed:
+                    od_projects[project_id] = compact_project(changed)
+                else:
+                    od_projects.pop(project_id, None)
+
+            od_projects = list(od_projects.values())
+            runs_since_full_sync = snapshot["RunsSinceFullSync"] + 1
+        except Exception as e:
+            # if the events feed is not available we fall back to a full sync
+            log(f"Incremental project sync failed, running full sync: {e}\n")
+            od_projects = None
+
+    if od_projects is None:
+        od_projects = [compact_project(p) for p in projects()]
+        runs_since_full_sync = 0
+
+        # do not overwrite a good snapshot with the result of a failed download
+        if not od_projects:
+            return list(snapshot.get("Projects", []))
+
+    save_state(
+        path,
+        {
+            "LastSyncedOn": synced_on,
+            "RunsSinceFullSync": runs_since_full_sync,
+            "Projects": od_projects,
+        },
+    )
+    return od_projects
+
+
+def project_catalog(refresh: bool = False) -> ProjectCatalog:
+    """
+    Gets the project catalog for the run, projects are only synced with Octopus Deploy once
+        Parameters:
+            refresh: if set to true the projects are synced again
+    """
+    global _project_catalog
+
+    with _state_lock:
+        # an empty catalog means the sync failed so we try again next time it is asked for
+        if refresh or not _project_catalog:
+            _project_catalog = ProjectCatalog(sync_projects())
+
+        return _project_catalog
+
+
+def closest_project(short_description: str, catalog: ProjectCatalog = None) -> tuple:
+    """
+    Finds the project a project name in the ServiceNow description refers to when it is written with other
+    separators or in another case, such as Billing-API for Billing API. Misspelled names and names with other
+    numbers are never resolved, the item would be scheduled and authorized for a project it does not name,
+    they are only suggested in the webex message, see ProjectCatalog.suggest
+    Parameters:
+        short_description: short description of Change Task in ServiceNow
+        catalog: project catalog for the run, loaded once if not passed in
+    Returns:
+        tuple: project and the name as it is written in the description,
+               otherwise an empty dict and an empty string
+    """
+    try:
+        od_projects = catalog if catalog is not None else project_catalog()
+    except:
+        return {}, ""
+
+    found = od_projects.match_joined(short_description)
+    if not found:
+        return {}, ""
+
+    project, start, end = found
+    return project, str(short_description)[start:end]
+
+
+def resolve_title(short_description: str, catalog: ProjectCatalog = None) -> tuple:
+    """
+    Finds the project name and release number in a ServiceNow short description,
+    a project name written with other separators is resolved to its project, see closest_project
+    Parameters:
+        short_description: short description of Change Task in ServiceNow
+        catalog: project catalog for the run, loaded once if not passed in
+    Returns:
+        tuple: project name, release number
+    """
+    project_name = find_project_name(short_description, catalog=catalog)
+    if not project_name:
+        project, name_text = closest_project(short_description, catalog=catalog)
+        if project:
+            # the name may have numbers in it so it is taken out before extracting the release
+            return project["Name"], extract_release(
+                short_description.replace(name_text, ""), catalog=catalog
+            )
+
+    return project_name, extract_release(short_description, catalog=catalog)
+
+
+def release_index_path() -> str:
+    return state_path(scheduler_config.get("ReleaseIndexFile", "release_index.json"))
+
+
+def compact_release(release: dict) -> dict:
+    """
+    Keeps only the release fields the release index needs
+        Parameters:
+            release: release from Octopus Deploy
+    """
+    return {
+        "Id": release["Id"],
+        "Version": release["Version"],
+        "ChannelId": release["ChannelId"],
+    }
+
+
+def changed_releases(since: str) -> set:
+    """
+    Finds releases that were modified or deleted since the last sync using the events feed
+        Parameters:
+            since: ISO timestamp of the last sync
+    Returns:
+        set: ids of the releases
+    """
+    changes = set()
+
+    # go back a few minutes in case the clocks are not exactly in step, reading an event twice does no harm
+    overlap = timedelta(seconds=int(scheduler_config.get("ProjectSyncOverlapSeconds", 300)))
+    since = (datetime.fromisoformat(since) - overlap).isoformat()
+
+    for event in octopus_items(
+        scheduler_config.get("EventsEndpoint", "/api/events"),
+        params={
+            "documentTypes": "Releases",
+            "eventCategories": "Modified,Deleted",
+            "from": since,
+        },
+    ):
+        changes.update(
+            document_id for document_id in event.get("RelatedDocumentIds", []) if document_id.startswith("Releases-")
+        )
+
+    return changes
+
+
+def load_release_index() -> dict:
+    """
+    Loads the release index saved by the last run. Releases that were modified or deleted since then, such as a
+    release moved to another channel, are dropped so they are looked up again. If the events can not be read
+    the index starts over and every project is read again.
+    """
+    index = load_state(release_index_path())
+
+    # the load time becomes the next watermark so events that happen during the run are picked up next run
+    synced_on = datetime.now(utc).isoformat()
+
+    if index.get("LastSyncedOn") and "Projects" in index:
+        try:
+            changed = changed_releases(index["LastSyncedOn"])
+        except Exception as e:
+            log(f"Unable to read release events, starting the release index over: {e}\n")
+            index = {}
+        else:
+            for releases in index["Projects"].values():
+                for version in [version for version, release in releases.items() if release["Id"] in changed]:
+                    del releases[version]
+    else:
+        index = {}
+
+    index.setdefault("Projects", {})
+    index["LastSyncedOn"] = synced_on
+    return index
+
+
+def sync_releases(project_id: str) -> dict:
+    """
+    Brings the release index of a project up to date, reading releases newest first until a known release is found.
+    The first time a project is seen all of its releases are read.
+        Parameters:
+            project_id: id of project in Octopus Deploy
+    Returns:
+        dict: upper case release number and release details
+    """
+    global _release_index, _release_index_changed
+
+    with _state_lock:
+        if _release_index is None:
+            _release_index = load_release_index()
+            _release_index_changed = True
+
+        releases = _release_index["Projects"].setdefault(project_id, {})
+        if project_id in _release_index_synced:
+            return releases
+
+        known_ids = {r["Id"] for r in releases.values()}
+
+    # releases come back newest first, for a project we know a small first page usually holds every release
+    # created since the last run. A project seen for the first time is read in full
+    page_size = int(scheduler_config.get("ReleaseIndexPageSize", 5)) if known_ids else 100
+
+    # the releases are downloaded outside of the lock so the releases of other projects can be synced at the same time
+    new_releases = {}
+    try:
+        for r in octopus_items(
+            f"{scheduler_config['ProjectsEndpoint']}/{project_id}/releases",
+            params={"take": page_size},
+        ):
+            if r["Id"] in known_ids:
+                break
+            new_releases.setdefault(r["Version"].upper(), compact_release(r))
+    except Exception as e:
+        # whatever is already in the index is still good, the next run will try again
+        log(str(e))
+        return releases
+
+    with _state_lock:
+        _release_index_synced.add(project_id)
+        if new_releases:
+            releases.update(new_releases)
+            _release_index_changed = True
+
+    return releases
+
+
+def index_release(project_id: str, release: dict) -> None:
+    """
+    Adds a release that was found in Octopus Deploy but not in the release index to the index
+        Parameters:
+            project_id: id of project in Octopus Deploy
+            release: release from Octopus Deploy
+    """
+    global _release_index_changed
+
+    with _state_lock:
+        if _release_index is None:
+            return
+
+        _release_index["Projects"].setdefault(project_id, {})[release["Version"].upper()] = compact_release(release)
+        _release_index_changed = True
+
+
+def save_release_index() -> None:
+    """Saves the release index for the next run, the releases found during the run are written once at the end"""
+    global _release_index_changed
+
+    with _state_lock:
+        if _release_index is not None and _release_index_changed:
+            _release_index_changed = not save_state(release_index_path(), _release_index)
+
+
+def indexed_release(release_number: str, project_id: str) -> dict:
+    """
+    Finds release in the local release index, the index is synced with Octopus Deploy once per run for each project
+    Parameters:
+        release_number: release number in Octopus Deploy
+        project_id: id of project in Octopus Deploy
+    """
+    release = sync_releases(project_id).get(release_number.upper())
+    if not release:
+        return {}
+
+    # the index does not keep the project id for every release so it is added back here
+    return dict(release, ProjectId=project_id)
 
 
 def find_release(release_number: str, project_id: str) -> dict:
@@ -270,38 +681,86 @@ def find_release(release_number: str, project_id: str) -> dict:
         project_id: id of project in Octopus Deploy
     """
     # TODO can't seem to pass slug as project id for releases (https://octopusdeploy.healthspring.inside/api/projects/Projects-644/releases)
-    # TODO do we really need 999 releases?  Defaults to last 30 and returns most recent first
-    # TODO we can request specific release based on version number (https://octopusdeploy.healthspring.inside/api/projects/Projects-644/releases/2023.4.0.246)
     if release_number and project_id:
+        # the same release is often asked for more than once in a run
+        key = (project_id, release_number.upper())
+        if key in _release_cache:
+            return _release_cache[key]
+
+        # releases we have seen on a previous run are kept on disk, only new releases are downloaded
+        release = indexed_release(release_number=release_number, project_id=project_id)
+        if release:
+            _release_cache[key] = release
+            return release
+
         try:
-            # retrieve 999 releases we may need to extend the number in the future, but for now should be plenty
-            results = requests.get(
-                url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['ProjectsEndpoint']}/{project_id}/releases?take=999",
-                headers={
-                    "X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"
-                },
-                verify=False,
+            # request the release directly by its version number
+            results = octopus_client().get(
+                f"{scheduler_config['ProjectsEndpoint']}/{project_id}/releases/{urllib.parse.quote(release_number, safe='')}"
             )
         except Exception as e:
             error_string = str(e)
             log(error_string)
             return {}
 
-        # if status code is 200 then content was returned
+        release = {}
         if results.status_code == 200:
-            results = results.json()
+            release = results.json()
 
-            # results we want are in the Items list
-            for r in results["Items"]:
-                # Version should equal the release number passed in
-                if r["Version"].upper() == release_number.upper():
-                    return r
-            return {}
+        # the version lookup is an exact match, so if it was not found we look through the releases
+        # newest first and stop as soon as we find it. This is not needed when the release index
+        # was synced this run as it already has every release of the project
+        if (
+            not release or release.get("Version", "").upper() != release_number.upper()
+        ) and project_id not in _release_index_synced:
+            release = {}
+            try:
+                for r in octopus_items(
+                    f"{scheduler_config['ProjectsEndpoint']}/{project_id}/releases",
+                    params={"take": 30},
+                ):
+                    # Version should equal the release number passed in
+                    if r["Version"].upper() == release_number.upper():
+                        release = r
+                        break
+            except Exception as e:
+                error_string = str(e)
+                log(error_string)
+                return {}
+        elif release.get("Version", "").upper() != release_number.upper():
+            release = {}
+
+        # the next run finds the release in the index instead of asking Octopus Deploy for it again
+        if release:
+            index_release(project_id=project_id, release=release)
+
+        _release_cache[key] = release
+        return release
     else:
         return {}
 
 
-def schedule_release(deployment_resource: dict) -> bool:
+def find_releases(project_id: str, release_numbers: list) -> dict:
+    """
+    Finds several releases of the same project in Octopus Deploy, the release index of the project is synced once for all of them
+    Parameters:
+        project_id: id of project in Octopus Deploy
+        release_numbers: release numbers in Octopus Deploy
+    Returns:
+        dict: upper case release number and release details, empty if the release was not found
+    """
+    if not project_id:
+        return {}
+
+    sync_releases(project_id)
+    return {
+        release_number.upper(): find_release(release_number=release_number, project_id=project_id)
+        for release_number in release_numbers
+        if release_number
+    }
+
+
+def schedule_release(deployment_resource: dict) -> dict:
     """
     Schedules release in Octopus Deploy
         Parameters:
@@ -313,46 +772,94 @@ def schedule_release(deployment_resource: dict) -> bool:
                 "QueueTime": "YYYY-MM-DDTHH:MM:SS",
                 "QueueTimeExpiry":"YYYY-MM-DDTHH:MM:SS"
             }
+    Returns:
+        dict: the deployment Octopus Deploy created, empty if it failed
     """
 
     # verify that the deployment resource is not null
     if deployment_resource:
-        results = requests.post(
-            url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['DeploymentsEndpoint']}",
-            headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-            json=deployment_resource,
-            verify=False,
+        results = octopus_client().post(
+            scheduler_config["DeploymentsEndpoint"], json=deployment_resource
         )
 
         # if the result status code is not 201 then something failed
         if results.status_code == 201:
-            return True
+            return results.json()
         else:
             log(results.status_code)
             results = results.json()
             # log(results["Errors"].text)
-            return False
+            return {}
     else:
-        return False
+        return {}
 
 
 def queued_deployments() -> list:
     """Retrieves queued deployments from Octopus Deploy"""
 
-    # retrieve queued deployments
-    results = requests.get(
-        url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['TasksEndpoint']}?take=999",
-        headers={"X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"},
-        verify=False,
-    )
+    # retrieve queued production deployments, the server does the filtering and we follow
+    # the page links so nothing is left out however long the queue gets
+    try:
+        return list(
+            octopus_items(
+                scheduler_config["TasksEndpoint"],
+                params={
+                    "states": "Queued",
+                    "name": "Deploy",
+                    "environment": scheduler_config["ProductionEnvironmentId"],
+                    "take": 100,
+                },
+            )
+        )
+    except Exception as e:
+        error_string = str(e)
+        log(error_string)
+        return []
 
-    # we only want to results if code is 200, otherwise return empty list
-    if results.status_code == 200:
-        results = results.json()
-        return results["Items"]
-    else:
+
+def queued_task_stats() -> dict:
+    """
+    Gets the number of queued deployments in Octopus Deploy and the newest one, only a single task is downloaded
+    Returns:
+        dict: count, id and queue time of the newest queued deployment, None if Octopus Deploy could not be reached
+    """
+    try:
+        results = octopus_client().get(
+            scheduler_config["TasksEndpoint"],
+            params={
+                "states": "Queued",
+                "name": "Deploy",
+                "environment": scheduler_config["ProductionEnvironmentId"],
+                "take": 1,
+            },
+        )
+    except Exception as e:
+        log(str(e))
+        return None
+
+    if results.status_code != 200:
         log(results.text)
-        return []
+        return None
+
+    results = results.json()
+    newest = (results.get("Items") or [{}])[0]
+    return {
+        "Count": results.get("TotalResults", 0),
+        "NewestId": newest.get("Id", ""),
+        "NewestQueueTime": newest.get("QueueTime", ""),
+    }
+
+
+def utc_instant(time_string: str) -> datetime:
+    """
+    Converts a time with a UTC offset to UTC so times from ServiceNow and Octopus Deploy compare as the same instant
+        Parameters:
+            time_string: YYYY-MM-DDTHH:MM:SS+HH:MM
+    """
+    try:
+        return datetime.fromisoformat(time_string).astimezone(utc)
+    except (TypeError, ValueError):
+        return None
 
 
 def filter_deployments(deployments: list) -> list:
@@ -371,54 +878,65 @@ def filter_deployments(deployments: list) -> list:
     ]
 
 
-def authorize_deployments(snow_items: list, deployments: list) -> None:
+def authorize_deployments(snow_items: list, deployments: list, catalog: ProjectCatalog = None) -> None:
     """
     Verifies that each queued deployment in OD has a SNOW item that corresponds with the version number
         Parameters:
-            snow_items: List of items from SNOW
+            snow_items: List of items from SNOW, or any iterable of items such as iter_change_tasks
             deployments: Dict of OD queued deployments
+            catalog: project catalog for the run, loaded once if not passed in
     """
 
     # list comprehension to filter out nonessential task items that do not relate to deployments
     # we need this to be as specific as possible so that we do not cancel any queued tasks that are
-    # not production deployments with no change tickets
+    # not production deployments with no change tickets. The server already filters the tasks,
+    # this is kept in case a filter is ignored by an older Octopus Deploy server
     deployments = filter_deployments(deployments)
 
     # we only want to loop through if we have deployments
     if deployments:
+        catalog = catalog if catalog is not None else project_catalog()
+
         # placeholder for the webex message
         webex_message = ""
 
+        # read the project, release and time of each deployment once
+        queued = []
         for deployment in deployments:
-            # no deployment has yet been found so set initially to false
-            found = False
-
-            release_number = extract_release(deployment["Description"]).upper()
-            project_name = find_project_name(deployment["Description"]).upper()
-
-            # now that we have the release we need to check for a change task
-            if snow_items:
-                for snow_item in snow_items:
-                    # we need to convert the date and time of OD and SNOW to match either other
-                    deployment_time = format_od_time(
-                        time_string=deployment["QueueTime"]
-                    )
-                    snow_time = to_central_time(
-                        snow_item["planned_start_date"], add_delta=False
-                    )
-                    snow_release_number = extract_release(
-                        snow_item["short_description"]
-                    )
-                    snow_project_name = find_project_name(
-                        snow_item["short_description"]
-                    )
+            release_number = extract_release(deployment["Description"], catalog=catalog).upper()
+            project_name = find_project_name(deployment["Description"], catalog=catalog).upper()
+
+            # we need to convert the date and time of OD and SNOW to match either other
+            deployment_time = utc_instant(format_od_time(time_string=deployment["QueueTime"]))
+            queued.append((deployment, project_name, release_number, deployment_time))
+
+        # change tasks may be streamed from ServiceNow so they are read once, only the tasks that mention
+        # the project of a queued deployment are kept as they may have to be assigned back to the queue
+        project_names = {project_name for _, project_name, _, _ in queued}
+        matcher = ProjectMatcher(project_names)
+        keep_all = "" in project_names
+
+        # every change task is read once into a set keyed by project, release and start time,
+        # so each deployment is a single lookup instead of a pass over every change task
+        authorized = set()
+        related_items = []
+        for snow_item in snow_items or []:
+            snow_project_name, snow_release_number = resolve_title(
+                snow_item["short_description"], catalog=catalog
+            )
+            authorized.add(
+                (
+                    snow_project_name.upper(),
+                    snow_release_number.upper(),
+                    utc_instant(to_central_time(snow_item["planned_start_date"], add_delta=False)),
+                )
+            )
+            if keep_all or next(matcher.find_all(str(snow_item["short_description"]).upper()), None):
+                related_items.append(snow_item)
 
-                    # if a release number and project is found set it to true
-                    if project_name == snow_project_name.upper():
-                        if release_number == snow_release_number.upper():
-                            if deployment_time == snow_time:
-                                found = True
-                                break
+        for deployment, project_name, release_number, deployment_time in queued:
+            # a change task with the same project, release and time authorizes the deployment
+            found = (project_name, release_number, deployment_time) in authorized
 
             # if we go through the entire collection of service now items and do not find a release then it is
             # unauthorized deployment and needs to be canceled
@@ -441,9 +959,12 @@ def authorize_deployments(snow_items: list, deployments: list) -> None:
                 post_to_webex(message=webex_message)
 
                 # assign ticket back to queue if there is one because there is no valid change task when release numbers change
-                for snow_item in snow_items:
+                for snow_item in related_items:
                     if project_name in str(snow_item["short_description"]).upper():
-                        assign_snow_item(snow_item=snow_item, assign_to_queue=True)
+                        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+
+        # items sent back to the queue for cancelled deployments are updated together
+        change_task_writes().flush()
 
 
 def cancel_deployment(id: str) -> bool:
@@ -454,12 +975,8 @@ def cancel_deployment(id: str) -> bool:
     """
     if id:
         try:
-            results = requests.post(
-                url=f"{scheduler_config['OctopusDeployBaseUrl']}{scheduler_config['TasksEndpoint']}/{id}/cancel",
-                headers={
-                    "X-Octopus-ApiKey": f"{scheduler_config['OctopusDeployApiKey']}"
-                },
-                verify=False,
+            results = octopus_client().post(
+                f"{scheduler_config['TasksEndpoint']}/{id}/cancel"
             )
         except Exception as e:
             error_string = str(e)
@@ -0,0 +1,545 @@
+from cmadevops_deployment_scheduler.modules.octopus_deploy import *
+from cmadevops_deployment_scheduler.modules.service_now import *
+from cmadevops_deployment_scheduler.modules.scheduler import *
+from cmadevops_deployment_scheduler.modules.webex import post_to_webex
+from cmadevops_deployment_scheduler.modules.run_fingerprint import run_fingerprint, can_skip_run, save_run_fingerprint
+from cmadevops_deployment_scheduler.modules.clients import call_report
+from cmadevops_deployment_scheduler.modules.task_store import task_store, changed_items
+from cmadevops_deployment_scheduler.modules.logwrite import log
+from cmadevops_deployment_scheduler.config.config import scheduler_config
+from concurrent.futures import ThreadPoolExecutor
+
+import os
+
+# The reconciler reads ServiceNow and Octopus Deploy once, works out what both should look like as a plan of
+# actions and then applies only the actions that change something. Items are no longer assigned before they are
+# checked and sent back to the queue when a check fails, they are only assigned once they are scheduled.
+
+
+def take_snapshot() -> dict:
+    """
+    Reads everything the plan needs from ServiceNow and Octopus Deploy, nothing is written
+    Returns:
+        dict: change tasks, planned items, releases, promotion checks and queued deployments of the run
+    """
+    snow_items = change_task_snapshot(refresh=True).snow_items
+    prefetch_parent_changes(snow_items)
+
+    catalog = project_catalog(refresh=True)
+    queued = {
+        (project_name, release_number)
+        for project_name, release_number, state in task_index(catalog=catalog, refresh=True)
+        if state == "Queued"
+    }
+    deployments = queued_deployments()
+
+    standard = {
+        snow_item["sys_id"]
+        for snow_item in snow_items
+        if is_a_standard_change(
+            snow_item["short_description"], parent_change_link(snow_item), parent_change_type(snow_item)
+        )
+    }
+
+    # tasks that are not assigned and tasks assigned to AUTOOCTOPUS that were not processed are looked at again,
+    # the same tasks unassign sends back to the queue for schedule to pick up. Tasks in the queue that failed
+    # last time and have not changed since are left out, see TaskStore.skippable
+    candidates = [
+        snow_item
+        for snow_item in snow_items
+        if not assigned_to_id(snow_item)
+        or (
+            assigned_to_automation(snow_item)
+            and "PROCESSED" not in snow_item["short_description"]
+            and snow_item["sys_id"] not in standard
+        )
+    ]
+    plans = [plan_item(snow_item=snow_item, catalog=catalog) for snow_item in changed_items(candidates)]
+
+    # releases are looked up for each project once, only releases that still have to be scheduled are checked for promotion
+    prefetch_releases(plans)
+    releases = {}
+    release_ids = set()
+    for plan in plans:
+        if not plan["project_id"] or not plan["release_number"]:
+            continue
+        release = find_release(release_number=plan["release_number"], project_id=plan["project_id"])
+        releases[(plan["project_id"], plan["release_number"])] = release
+        if release and (plan["project_name"], plan["release_number"]) not in queued:
+            release_ids.add(str(release["Id"]))
+
+    workers = int(scheduler_config.get("ScheduleWorkers", 4))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        promotions = dict(zip(release_ids, pool.map(promotable, release_ids)))
+
+    return {
+        "snow_items": snow_items,
+        "plans": plans,
+        "catalog": catalog,
+        "queued": queued,
+        "deployments": deployments,
+        "releases": releases,
+        "promotions": promotions,
+        "standard": standard,
+    }
+
+
+def item_message(snow_item: dict) -> str:
+    """
+    Builds the start of the webex message of a ServiceNow item
+        Parameters:
+            snow_item: item from ServiceNow
+    """
+    # we need to convert the UTC offset that OD uses to CST
+    start_time = convert_utc_offset(date_string=to_central_time(time=snow_item["planned_start_date"], add_delta=False))
+    end_time = convert_utc_offset(date_string=to_central_time(time=snow_item["planned_start_date"], add_delta=True))
+
+    return (
+        f'ServiceNow Item: _{snow_item["task_effective_number"]}_ \n'
+        f"Time: _{start_time} CST - {end_time} CST_ \n"
+        f'Description: _{snow_item["short_description"]}_ \n'
+    )
+
+
+def decide_item(plan: dict, snapshot: dict, scheduled_releases: set) -> dict:
+    """
+    Decides what should happen to a planned ServiceNow item, the same checks as schedule_item without any calls
+        Parameters:
+            plan: ServiceNow item planned by plan_item
+            snapshot: see take_snapshot
+            scheduled_releases: project name and release number of the releases scheduled by earlier items of the plan
+    Returns:
+        dict: the item, if it should be assigned (true), sent back to the queue (false) or left alone (None),
+              the deployment to schedule, the webex message with its text if the write fails and
+              the outcome to save in the task store with the outcome if the write fails
+    """
+    snow_item = plan["snow_item"]
+    decision = {
+        "snow_item": snow_item,
+        "plan": plan,
+        "assigned": None,
+        "deployment_resource": None,
+        "project_name": plan["project_name"],
+        "release_number": plan["release_number"],
+        "message": "",
+        "failed_message": "",
+        "outcome": "",
+        "failed_outcome": "",
+    }
+
+    # items assigned to AUTOOCTOPUS that are not processed go back to the queue unless they are assigned again below
+    if assigned_to_id(snow_item):
+        decision["assigned"] = False
+
+    # we only want to schedule items that apply to OD
+    if not plan["action"]:
+        return decision
+
+    webex_message = item_message(snow_item)
+
+    if plan["action"] == "SKIP":
+        decision["assigned"] = True
+        decision["message"] = webex_message + (
+            f"Status: **Found override keyword SKIP.** \n"
+            f"  - ServiceNow item has been assigned to P-AUTOCTOPUS. \n"
+            f"  - Deployment HAS NOT been scheduled in Octopus Deploy. Development team will manually trigger the deployment. \n"
+            f"_No further action needed._ \n"
+        )
+        decision["failed_message"] = webex_message + "Status: ** - Failed to assign ServiceNow item to P-AUTOOCTOPUS.** \n"
+        decision["outcome"], decision["failed_outcome"] = "SKIP", "ASSIGN_FAILED"
+        return decision
+
+    if plan["action"] == "MANUAL":
+        decision["message"] = webex_message + (
+            "Status: **Found override keyword MANUAL** \n"
+            "   - Please assign this ServiceNow item to whoever will be on call the week of the deployment or Production Support. \n"
+        )
+        decision["outcome"] = "MANUAL"
+        return decision
+
+    release_number = plan["release_number"]
+    project_name = plan["project_name"]
+
+    if not release_number:
+        decision["message"] = webex_message + (
+            "Status: **Unable to extract release from ServiceNow short description.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure title is in following format: \n"
+            "Deploy [_project name_] [_release number_] [_override_] \n"
+        )
+        decision["outcome"] = "NO_RELEASE"
+        return decision
+
+    if plan["name_text"]:
+        webex_message += f"Note: _Project **{plan['name_text']}** was not found, using project **{project_name}** with the same name._ \n"
+
+    if not plan["project_id"]:
+        webex_message += (
+            "Status: **Unable to find project in Octopus Deploy.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please verify that you have spelled your project name correctly in the title \n"
+        )
+        suggestions = snapshot["catalog"].suggest(snow_item["short_description"])
+        if suggestions:
+            webex_message += "   - Did you mean: " + ", ".join(
+                f"_{project['Name']}_" for _, project, _ in suggestions
+            ) + " \n"
+        decision["message"] = webex_message
+        decision["outcome"] = "NO_PROJECT"
+        return decision
+
+    release_details = snapshot["releases"].get((plan["project_id"], release_number))
+    if not release_details:
+        decision["message"] = webex_message + (
+            f"Status: **The release number {release_number} was not found in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure that the release in the ServiceNow item matches what release is being deployed. \n"
+        )
+        decision["outcome"] = "RELEASE_NOT_FOUND"
+        return decision
+
+    if (project_name, release_number) in snapshot["queued"] or (project_name, release_number) in scheduled_releases:
+        decision["assigned"] = True
+        decision["message"] = webex_message + (
+            "Status: **Release has already been scheduled in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Deployment has previously been scheduled, but verify that the date and time match what is on Change Task.  \n"
+        )
+        decision["failed_message"] = webex_message + "Status: **Failed to assign ServiceNow item to P-AUTOCTOPUS.** \n"
+        decision["outcome"], decision["failed_outcome"] = "ALREADY_SCHEDULED", "ASSIGN_FAILED"
+        return decision
+
+    if not snapshot["promotions"].get(str(release_details["Id"])):
+        decision["message"] = webex_message + (
+            f"Status: **The release number {release_number} is unable to be promoted to Production!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure that the release has gone through the lifecycle in Octopus Deploy to reach Production and is in the correct channel. \n"
+        )
+        decision["outcome"] = "NOT_PROMOTABLE"
+        return decision
+
+    # the item is only assigned once the deployment is scheduled
+    decision["assigned"] = True
+    decision["deployment_resource"] = {
+        "ReleaseId": release_details["Id"],
+        "ProjectId": release_details["ProjectId"],
+        "ChannelId": release_details["ChannelId"],
+        "EnvironmentId": scheduler_config["ProductionEnvironmentId"],
+        "QueueTime": to_central_time(time=snow_item["planned_start_date"], add_delta=False),
+        "QueueTimeExpiry": to_central_time(time=snow_item["planned_start_date"], add_delta=True),
+    }
+    decision["message"] = webex_message + (
+        "Status: **Successfully assigned ServiceNow item and scheduled deployment in Octopus Deploy.** \n"
+        "_No further action needed._ \n"
+    )
+    decision["failed_message"] = webex_message + (
+        "Status: **FAILED to schedule deployment in Octopus Deploy.** \n"
+        "_Possible Solutions:_ \n"
+        "   - Verify that at minimum five minutes have been alloted to schedule the deployment. \n"
+        "   - Verify that date and time in the ServiceNow item are correct. \n"
+        "   - Verify that the Octopus Deploy server is up and running.  \n"
+    )
+    decision["outcome"], decision["failed_outcome"] = "SCHEDULED", "SCHEDULE_FAILED"
+    scheduled_releases.add((project_name, release_number))
+    return decision
+
+
+def snow_item_key(snow_item: dict, catalog: ProjectCatalog) -> tuple:
+    """
+    Project name, release number and start time of a ServiceNow item, a queued deployment with the same key is authorized
+        Parameters:
+            snow_item: item from ServiceNow
+            catalog: project catalog for the run
+    """
+    project_name, release_number = resolve_title(snow_item["short_description"], catalog=catalog)
+    return (
+        project_name.upper(),
+        release_number.upper(),
+        utc_instant(to_central_time(snow_item["planned_start_date"], add_delta=False)),
+    )
+
+
+def plan_changes(snapshot: dict) -> list:
+    """
+    Works out the actions that bring ServiceNow and Octopus Deploy to where they should be, nothing is called.
+    Every action has an id and may depend on the outcome of an earlier action:
+        schedule: schedule deployment_resource in Octopus Deploy
+        cancel: cancel deployment in Octopus Deploy
+        assign: assign snow_item to AUTOOCTOPUS, after and unless name the action it depends on
+        requeue: assign snow_item back to the queue, after and unless name the action it depends on
+        record: save outcome of the planned item in the task store, failed_outcome instead if outcome_of failed,
+                with the Id of the deployment scheduled by deployment_of
+        notify: post message to webex, failed_message instead if outcome_of failed
+        Parameters:
+            snapshot: see take_snapshot
+    """
+    catalog = snapshot["catalog"]
+
+    scheduled_releases = set()
+    decisions = {}
+    for plan in snapshot["plans"]:
+        decisions[plan["snow_item"]["sys_id"]] = decide_item(
+            plan=plan, snapshot=snapshot, scheduled_releases=scheduled_releases
+        )
+
+    # tasks that end up assigned to AUTOOCTOPUS authorize the queued deployments, see authorize_deployments
+    assigned_items = [
+        snow_item
+        for snow_item in snapshot["snow_items"]
+        if snow_item["sys_id"] in decisions and decisions[snow_item["sys_id"]]["assigned"]
+    ] + [
+        snow_item
+        for snow_item in snapshot["snow_items"]
+        if snow_item["sys_id"] not in decisions and assigned_to_automation(snow_item)
+    ]
+    keys = {snow_item["sys_id"]: snow_item_key(snow_item, catalog=catalog) for snow_item in assigned_items}
+    authorized = set(keys.values())
+
+    cancels = []
+    live = {
+        key
+        for sys_id, key in keys.items()
+        if sys_id in decisions and decisions[sys_id]["deployment_resource"]
+    }
+    for deployment in filter_deployments(snapshot["deployments"]):
+        key = (
+            find_project_name(deployment["Description"], catalog=catalog).upper(),
+            extract_release(deployment["Description"], catalog=catalog).upper(),
+            utc_instant(format_od_time(time_string=deployment["QueueTime"])),
+        )
+        if key in authorized:
+            live.add(key)
+        else:
+            cancels.append((deployment, key[0]))
+
+    # a task of a cancelled deployment's project goes back to the queue so it is scheduled again, unless
+    # its own deployment is still queued or scheduled by this plan
+    for deployment, project_name in cancels:
+        for snow_item in assigned_items:
+            if project_name in str(snow_item["short_description"]).upper() and keys[snow_item["sys_id"]] not in live:
+                decision = decisions.setdefault(
+                    snow_item["sys_id"],
+                    {"snow_item": snow_item, "deployment_resource": None, "message": "", "failed_message": "", "outcome": ""},
+                )
+                decision["assigned"] = False
+                decision["failed_message"] = ""
+
+    actions = []
+    records = []
+    notifications = []
+    for decision in decisions.values():
+        snow_item = decision["snow_item"]
+        schedule_id = None
+        if decision["deployment_resource"] and decision["assigned"]:
+            schedule_id = f"schedule-{snow_item['sys_id']}"
+            actions.append(
+                {
+                    "id": schedule_id,
+                    "action": "schedule",
+                    "deployment_resource": decision["deployment_resource"],
+                    "project_name": decision["project_name"],
+                    "release_number": decision["release_number"],
+                }
+            )
+
+        write_id = None
+        if decision["assigned"] is not None:
+            json_body = change_task_body(snow_item=snow_item, assign_to_queue=not decision["assigned"])
+            if pending_change(snow_item, json_body):
+                write_id = f"{'assign' if decision['assigned'] else 'requeue'}-{snow_item['sys_id']}"
+                actions.append(
+                    {
+                        "id": write_id,
+                        "action": "assign" if decision["assigned"] else "requeue",
+                        "snow_item": snow_item,
+                        "after": schedule_id,
+                    }
+                )
+            # an item that is assigned already goes back to the queue if its deployment could not be scheduled
+            if schedule_id and assigned_to_id(snow_item):
+                actions.append(
+                    {"id": f"requeue-{snow_item['sys_id']}", "action": "requeue", "snow_item": snow_item, "unless": schedule_id}
+                )
+
+        if decision["outcome"]:
+            records.append(
+                {
+                    "id": f"record-{snow_item['sys_id']}",
+                    "action": "record",
+                    "plan": decision["plan"],
+                    "outcome": decision["outcome"],
+                    "failed_outcome": decision["failed_outcome"],
+                    "outcome_of": schedule_id or write_id,
+                    "deployment_of": schedule_id,
+                }
+            )
+
+        if decision["message"]:
+            notifications.append(
+                {
+                    "id": f"notify-{snow_item['sys_id']}",
+                    "action": "notify",
+                    "message": decision["message"],
+                    "failed_message": decision["failed_message"],
+                    "outcome_of": schedule_id or write_id,
+                }
+            )
+
+    for deployment, _ in cancels:
+        cancel_id = f"cancel-{deployment['Id']}"
+        actions.append({"id": cancel_id, "action": "cancel", "deployment": deployment})
+        notifications.append(
+            {
+                "id": f"notify-{deployment['Id']}",
+                "action": "notify",
+                "message": (
+                    f"Deployment **{deployment['Description']}** was cancelled because there was no Change Task matching the deployment info in Octopus Deploy. \n"
+                    "   - If a Change or Task has been pulled and then added back into the ServiceNow queue it will automatically be rescheduled within 2 run cycles. \n"
+                    "   - If the deployment time or release number on the Change Task has changed it will automatically be rescheduled. \n"
+                    "_No further action needed._ \n"
+                ),
+                "failed_message": (
+                    f"**{deployment['Description']}** does not have an associated Change Task. Attemped to cancel but encountered an error. \n"
+                    "_Possible solutions:_ \n"
+                    "   - Associate a Change Task with this release. \n"
+                    "   - Cancel deployment manually. \n"
+                ),
+                "outcome_of": cancel_id,
+            }
+        )
+
+    return actions + records + notifications
+
+
+def apply_octopus_action(action: dict):
+    """
+    Schedules or cancels a deployment in Octopus Deploy
+        Parameters:
+            action: schedule or cancel action, see plan_changes
+    Returns:
+        true if the deployment was cancelled, the deployment if it was scheduled, false or empty if it failed
+    """
+    if action["action"] == "cancel":
+        return cancel_deployment(id=action["deployment"]["Id"])
+
+    deployment = schedule_release(deployment_resource=action["deployment_resource"])
+    if deployment:
+        add_queued_task(project_name=action["project_name"], release_number=action["release_number"])
+    return deployment
+
+
+def apply_changes(actions: list) -> dict:
+    """
+    Applies a plan, Octopus Deploy first, then the ServiceNow updates through the write queue,
+    the task store and then the webex messages
+        Parameters:
+            actions: see plan_changes
+    Returns:
+        dict: id of every applied action and its outcome, true if it succeeded
+    """
+    outcomes = {}
+    workers = int(scheduler_config.get("ScheduleWorkers", 4))
+
+    # deployments do not depend on each other, they are scheduled and cancelled on a bounded pool of workers
+    octopus_actions = [action for action in actions if action["action"] in ("schedule", "cancel")]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for action, outcome in zip(octopus_actions, pool.map(apply_octopus_action, octopus_actions)):
+            outcomes[action["id"]] = outcome
+
+    writes = {}
+    for action in actions:
+        if action["action"] not in ("assign", "requeue"):
+            continue
+        if action.get("after") and not outcomes.get(action["after"]):
+            continue
+        if action.get("unless") and outcomes.get(action["unless"], True):
+            continue
+        assign_snow_item(
+            snow_item=action["snow_item"], assign_to_queue=action["action"] == "requeue", queue=change_task_writes()
+        )
+        writes[action["id"]] = action["snow_item"]["sys_id"]
+
+    results = change_task_writes().flush()
+    for action_id, sys_id in writes.items():
+        outcomes[action_id] = results.get(sys_id, False)
+
+    for action in actions:
+        if action["action"] != "record":
+            continue
+        failed = action["outcome_of"] and not outcomes.get(action["outcome_of"], True)
+        deployment = outcomes.get(action["deployment_of"]) or {}
+        task_store().record(
+            action["plan"],
+            action["failed_outcome"] if failed and action["failed_outcome"] else action["outcome"],
+            deployment_id=deployment.get("Id", ""),
+        )
+        outcomes[action["id"]] = True
+
+    messages = {}
+    for action in actions:
+        if action["action"] != "notify":
+            continue
+        failed = action["outcome_of"] and not outcomes.get(action["outcome_of"], True)
+        messages[action["id"]] = action["failed_message"] if failed and action["failed_message"] else action["message"]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for action_id, outcome in zip(messages, pool.map(post_to_webex, messages.values())):
+            outcomes[action_id] = outcome
+
+    return outcomes
+
+
+def reconcile() -> dict:
+    """
+    Reads both systems, plans the changes and applies them
+    Returns:
+        dict: snapshot of the run, see take_snapshot
+    """
+    call_report().phase("SNAPSHOT")
+    snapshot = take_snapshot()
+
+    call_report().phase("PLAN")
+    actions = plan_changes(snapshot)
+
+    counts = {}
+    for action in actions:
+        counts[action["action"]] = counts.get(action["action"], 0) + 1
+    log(f"PLAN {', '.join(f'{name}: {count}' for name, count in sorted(counts.items())) or 'nothing to do'}\n")
+
+    call_report().phase("APPLY")
+    apply_changes(actions)
+    return snapshot
+
+
+def run_reconciler():
+    """Entry point for Deployment Scheduler on the reconciler, see main.run"""
+    log("--------------------\n")
+    log(
+        f"PROCESS STARTED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log(f"ENVIRONMENT: {os.getenv('ASPNETCORE_ENVIRONMENT').upper()}\n")
+
+    # most runs have nothing to do, a couple of cheap probes tell us if anything changed since the last run
+    call_report().phase("FINGERPRINT")
+    fingerprint = run_fingerprint()
+    if can_skip_run(fingerprint):
+        log(
+            f"NOTHING CHANGED, PROCESS SKIPPED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+        )
+        log("-------------------- \n")
+        return
+
+    snapshot = reconcile()
+    log(
+        f"RECONCILE {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
+
+    # the next run is skipped if nothing changes until then
+    call_report().phase("SAVE FINGERPRINT")
+    save_run_fingerprint(fingerprint, snow_items=snapshot["snow_items"], deployments=snapshot["deployments"])
+
+    log(
+        f"PROCESS FINISHED {datetime.now().astimezone(pytz.timezone('US/Central')).strftime('%Y-%m-%d %H:%M CST')}\n"
+    )
+    log("-------------------- \n")
@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+from pytz import utc
+from cmadevops_deployment_scheduler.config.config import scheduler_config
+from cmadevops_deployment_scheduler.modules.logwrite import log
+from cmadevops_deployment_scheduler.modules.local_state import state_path, load_state, save_state
+from cmadevops_deployment_scheduler.modules.service_now import change_task_stats, SNOW_TIME_FORMAT
+from cmadevops_deployment_scheduler.modules.octopus_deploy import queued_task_stats, format_od_time, utc_instant
+
+
+def fingerprint_path() -> str:
+    """Path of the fingerprint saved by the last run"""
+    return state_path(scheduler_config.get("RunFingerprintFile", "run_fingerprint.json"))
+
+
+def run_fingerprint() -> dict:
+    """
+    Gets what ServiceNow and Octopus Deploy look like right now from a couple of cheap probes,
+    the number and last update of the change tasks and the number and newest of the queued deployments
+    Returns:
+        dict: fingerprint to compare with the one saved by the last run, None if a probe failed
+    """
+    change_tasks = change_task_stats()
+    queued_tasks = queued_task_stats()
+
+    # a failed probe tells us nothing so the run is never skipped because of it
+    if change_tasks is None or queued_tasks is None:
+        return None
+
+    return {"ChangeTasks": change_tasks, "QueuedTasks": queued_tasks}
+
+
+def next_window(snow_items: list, deployments: list) -> str:
+    """
+    Finds the start of the next change task or queued deployment
+        Parameters:
+            snow_items: change tasks from ServiceNow
+            deployments: queued deployments from Octopus Deploy
+    Returns:
+        str: ISO timestamp in UTC, empty if nothing is coming up
+    """
+    now = datetime.now(utc)
+    starts = []
+
+    for snow_item in snow_items:
+        try:
+            starts.append(utc.localize(datetime.strptime(snow_item["planned_start_date"], SNOW_TIME_FORMAT)))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    for deployment in deployments:
+        try:
+            starts.append(utc_instant(format_od_time(time_string=deployment["QueueTime"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    upcoming = [start for start in starts if start and start > now]
+    return min(upcoming).isoformat() if upcoming else ""
+
+
+def can_skip_run(fingerprint: dict) -> bool:
+    """
+    Checks if the run can be skipped because nothing changed since the last run and no deployment window
+    is coming up within FastPathWindowMinutes. After FastPathMaxSkippedRuns skipped runs in a row the run
+    is never skipped so the incremental syncs still run every now and then.
+        Parameters:
+            fingerprint: fingerprint of this run, see run_fingerprint
+    """
+    path = fingerprint_path()
+    state = load_state(path)
+
+    if not fingerprint or state.get("Fingerprint") != fingerprint:
+        return False
+
+    if state.get("SkippedRuns", 0) >= int(scheduler_config.get("FastPathMaxSkippedRuns", 6)):
+        return False
+
+    window = state.get("NextWindow")
+    margin = timedelta(minutes=int(scheduler_config.get("FastPathWindowMinutes", 90)))
+    if window and (utc_instant(window) or datetime.now(utc)) <= datetime.now(utc) + margin:
+        return False
+
+    state["SkippedRuns"] = state.get("SkippedRuns", 0) + 1
+    save_state(path, state)
+    return True
+
+
+def save_run_fingerprint(fingerprint: dict, snow_items: list, deployments: list) -> None:
+    """
+    Saves the fingerprint of a finished run for the next run to compare with. It is only kept when the
+    probes still return the same fingerprint at the end of the run, if the run or anyone else changed
+    something while it was going the next run has to look at it.
+        Parameters:
+            fingerprint: fingerprint taken at the start of the run
+            snow_items: change tasks of the run
+            deployments: queued deployments of the run
+    """
+    if fingerprint and run_fingerprint() == fingerprint:
+        state = {
+            "Fingerprint": fingerprint,
+            "NextWindow": next_window(snow_items=snow_items, deployments=deployments),
+            "SkippedRuns": 0,
+        }
+    else:
+        log("Changes were made during the run, the next run will not be skipped\n")
+        state = {}
+
+    save_state(fingerprint_path(), state)
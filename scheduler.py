@@ -1,8 +1,11 @@
 from cmadevops_deployment_scheduler.modules.octopus_deploy import *
 from cmadevops_deployment_scheduler.modules.service_now import *
 from cmadevops_deployment_scheduler.modules.webex import *
+from cmadevops_deployment_scheduler.modules.task_store import task_store, changed_items
 from cmadevops_deployment_scheduler.config.config import scheduler_config
 from datetime import datetime
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 
 def convert_utc_offset(date_string: str):
@@ -16,172 +19,329 @@ def convert_utc_offset(date_string: str):
     )
 
 
-def schedule(snow_items=list) -> bool:
+def plan_item(snow_item: dict, catalog: ProjectCatalog = None) -> dict:
+    """
+    Reads the action, release and project from a ServiceNow item before anything is assigned or scheduled
+        Parameters:
+            snow_item: item from ServiceNow
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    catalog = catalog if catalog is not None else project_catalog()
+
+    plan = {
+        "snow_item": snow_item,
+        "action": "",
+        "release_number": "",
+        "project_id": "",
+        "project_name": "",
+        "name_text": "",
+    }
+
+    # we only want to schedule items that apply to OD
+    if not action_item(snow_item["short_description"]):
+        return plan
+
+    # convert description to all upper case to avoid any cAsE problems
+    description_upper = str(snow_item["short_description"]).upper()
+    if "SKIP" in description_upper:
+        plan["action"] = "SKIP"
+        return plan
+    if "MANUAL" in description_upper:
+        plan["action"] = "MANUAL"
+        return plan
+
+    plan["action"] = "DEPLOY"
+
+    # extract the version number from the description
+    plan["release_number"] = extract_release(snow_item["short_description"], catalog=catalog)
+    if not plan["release_number"]:
+        return plan
+
+    # get the project name and project id
+    plan["project_id"] = find_project_id(
+        short_description=snow_item["short_description"], catalog=catalog
+    )
+    plan["project_name"] = find_project_name(snow_item["short_description"], catalog=catalog)
+
+    # a project name written with other separators, such as Billing-API, is resolved to its project so the
+    # item does not go back to the queue and get evaluated again every run. A misspelled name is not resolved
+    # and the item is never scheduled for a project it does not name, the webex message suggests the project
+    if not plan["project_id"]:
+        project, name_text = closest_project(
+            short_description=snow_item["short_description"], catalog=catalog
+        )
+        if project:
+            plan["project_id"] = project["Id"]
+            plan["project_name"] = project["Name"]
+            plan["name_text"] = name_text
+            plan["release_number"] = extract_release(
+                snow_item["short_description"].replace(name_text, ""), catalog=catalog
+            )
+
+    return plan
+
+
+def prefetch_releases(plans: list) -> None:
+    """
+    Looks up the releases of every planned item grouped by project,
+    so each project's releases are read once no matter how many items target it
+        Parameters:
+            plans: planned ServiceNow items
+    """
+    groups = {}
+    for plan in plans:
+        if plan["project_id"] and plan["release_number"]:
+            groups.setdefault(plan["project_id"], set()).add(plan["release_number"])
+
+    for project_id, release_numbers in groups.items():
+        find_releases(project_id=project_id, release_numbers=list(release_numbers))
+
+
+def schedule(snow_items=list, catalog: ProjectCatalog = None) -> bool:
     """
     Assigns and schedules ServiceNow items in Octopus Deploy
         Parameters:
-            snow_items: JSON response from ServiceNow
+            snow_items: JSON response from ServiceNow, or any iterable of items such as iter_change_tasks
+            catalog: project catalog for the run, loaded once if not passed in
     """
     if snow_items:
-        for snow_item in snow_items:
-            # This string gets added to throughout the schedule function and posts to webex
-            webex_message = ""
-
-            # we need to convert the UTC offset that OD uses to CST
-            # TODO - why are we not pulling the planned_end_time instead of just adding 30 minutes to start time?
-            start_time = convert_utc_offset(
-                date_string=to_central_time(
-                    time=snow_item["planned_start_date"], add_delta=False
-                )
+        # every project lookup for every item shares the same project list
+        catalog = catalog if catalog is not None else project_catalog()
+
+        # items that failed last time and have not changed since are left out before anything is called,
+        # items are taken in batches so only one batch is held in memory however many items there are
+        snow_items = changed_items(snow_items)
+        batch_size = int(scheduler_config.get("ScheduleBatchSize", 100))
+        while True:
+            batch = list(islice(snow_items, batch_size))
+            if not batch:
+                break
+
+            # parse every item first so releases and progressions are looked up once per project
+            plans = [plan_item(snow_item=snow_item, catalog=catalog) for snow_item in batch]
+            prefetch_releases(plans)
+
+            # items are scheduled on a bounded pool of workers, the clients limit the calls in flight to each service.
+            # Items of the same project stay in one group and run in order so a release is never scheduled twice
+            workers = int(scheduler_config.get("ScheduleWorkers", 4))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(schedule_items, plans=group, catalog=catalog) for group in project_groups(plans)
+                ]
+                for future in futures:
+                    future.result()
+
+            # items sent back to the queue are updated together once the batch is done
+            change_task_writes().flush()
+
+
+def project_groups(plans: list) -> list:
+    """
+    Groups planned items by the project they deploy, keeping the order of the items in each group
+        Parameters:
+            plans: ServiceNow items planned by plan_item
+    """
+    groups = {}
+    for plan in plans:
+        # items without a project do not depend on any other item
+        key = plan["project_id"] or ("sys_id", plan["snow_item"].get("sys_id", id(plan)))
+        groups.setdefault(key, []).append(plan)
+    return list(groups.values())
+
+
+def schedule_items(plans: list, catalog: ProjectCatalog = None) -> None:
+    """
+    Schedules planned items one after the other, see schedule_item
+        Parameters:
+            plans: ServiceNow items planned by plan_item
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    for plan in plans:
+        schedule_item(plan=plan, catalog=catalog)
+
+
+def schedule_item(plan: dict, catalog: ProjectCatalog = None) -> None:
+    """
+    Assigns and schedules a planned ServiceNow item in Octopus Deploy
+        Parameters:
+            plan: ServiceNow item planned by plan_item
+            catalog: project catalog for the run, loaded once if not passed in
+    """
+    snow_item = plan["snow_item"]
+    release_number = plan["release_number"]
+    project_id = plan["project_id"]
+    project_name = plan["project_name"]
+
+    # This string gets added to throughout the schedule function and posts to webex
+    webex_message = ""
+
+    # we need to convert the UTC offset that OD uses to CST
+    # TODO - why are we not pulling the planned_end_time instead of just adding 30 minutes to start time?
+    start_time = convert_utc_offset(
+        date_string=to_central_time(
+            time=snow_item["planned_start_date"], add_delta=False
+        )
+    )
+    end_time = convert_utc_offset(
+        date_string=to_central_time(
+            time=snow_item["planned_start_date"], add_delta=True
+        )
+    )
+
+    # set the snow item number, time, and description for the webex message
+    webex_message = (
+        f'ServiceNow Item: _{snow_item["task_effective_number"]}_ \n'
+        f"Time: _{start_time} CST - {end_time} CST_ \n"
+        f'Description: _{snow_item["short_description"]}_ \n'
+    )
+
+    # we only want to schedule items that apply to OD
+    if not plan["action"]:
+        return
+
+    # if skip is in the keyword we do not want schedule
+    if plan["action"] == "SKIP":
+        if assign_snow_item(snow_item=snow_item, assign_to_queue=False):
+            task_store().record(plan, "SKIP")
+            webex_message += (
+                f"Status: **Found override keyword SKIP.** \n"
+                f"  - ServiceNow item has been assigned to P-AUTOCTOPUS. \n"
+                f"  - Deployment HAS NOT been scheduled in Octopus Deploy. Development team will manually trigger the deployment. \n"
+                f"_No further action needed._ \n"
             )
-            end_time = convert_utc_offset(
-                date_string=to_central_time(
-                    time=snow_item["planned_start_date"], add_delta=True
-                )
+        else:
+            task_store().record(plan, "ASSIGN_FAILED")
+            webex_message += "Status: ** - Failed to assign ServiceNow item to P-AUTOOCTOPUS.** \n"
+
+        post_to_webex(message=webex_message)
+        return
+
+    # if manual is in the keyword notify webex
+    if plan["action"] == "MANUAL":
+        webex_message += (
+            "Status: **Found override keyword MANUAL** \n"
+            "   - Please assign this ServiceNow item to whoever will be on call the week of the deployment or Production Support. \n"
+        )
+        task_store().record(plan, "MANUAL")
+
+        post_to_webex(message=webex_message)
+        return
+
+    # assign snow item to autooctopus
+    # TODO I think this needs to move later in the process to avoid the assign/unassign loop when there is an issue later in the process
+    if not assign_snow_item(snow_item=snow_item, assign_to_queue=False):
+        webex_message += "Status: **Failed to assign ServiceNow item to P-AUTOCTOPUS.** \n"
+        task_store().record(plan, "ASSIGN_FAILED")
+        post_to_webex(message=webex_message)
+        return
+
+    # we need to verify that the release number is not null
+    if not release_number:
+        webex_message += (
+            "Status: **Unable to extract release from ServiceNow short description.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure title is in following format: \n"
+            "Deploy [_project name_] [_release number_] [_override_] \n"
+        )
+        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes()) # TODO not necessary if we don't assign by default on line 83
+        task_store().record(plan, "NO_RELEASE")
+        post_to_webex(message=webex_message)
+        return
+
+    if plan["name_text"]:
+        webex_message += f"Note: _Project **{plan['name_text']}** was not found, using project **{project_name}** with the same name._ \n"
+
+    if not project_id:
+        webex_message += (
+            "Status: **Unable to find project in Octopus Deploy.** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please verify that you have spelled your project name correctly in the title \n"
+        )
+        catalog = catalog if catalog is not None else project_catalog()
+        suggestions = catalog.suggest(snow_item["short_description"])
+        if suggestions:
+            webex_message += "   - Did you mean: " + ", ".join(
+                f"_{project['Name']}_" for _, project, _ in suggestions
+            ) + " \n"
+        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes()) # TODO not necessary if we don't assign by default on line 83
+        task_store().record(plan, "NO_PROJECT")
+        post_to_webex(message=webex_message)
+        return
+
+    # find release in octopus deploy, releases were already looked up for the whole batch
+    release_details = find_release(
+        release_number=release_number, project_id=project_id
+    )
+
+    if not release_details:
+        webex_message += (
+            f"Status: **The release number {release_number} was not found in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Please ensure that the release in the ServiceNow item matches what release is being deployed. \n"
+        )
+        assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+        task_store().record(plan, "RELEASE_NOT_FOUND")
+        post_to_webex(message=webex_message)
+        return
+
+    # if release is not scheduled
+    if not scheduled(
+        release_number=release_number,
+        project_name=project_name,
+        catalog=catalog,
+    ):
+        # Verify that environment is able to be promoted to prod
+        if not promotable(release_id=str(release_details["Id"])):
+            # IF ITS NOT PROMOTABLE post message
+            webex_message += (
+                f"Status: **The release number {release_number} is unable to be promoted to Production!** \n"
+                "_Possible Solutions:_ \n"
+                "   - Please ensure that the release has gone through the lifecycle in Octopus Deploy to reach Production and is in the correct channel. \n"
             )
+            assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+            task_store().record(plan, "NOT_PROMOTABLE")
+            post_to_webex(message=webex_message)
+            return
+
+        # deployment resource for octopus deploy to create deployment
+        deployment_resource = {
+            "ReleaseId": release_details["Id"],
+            "ProjectId": release_details["ProjectId"],
+            "ChannelId": release_details["ChannelId"],
+            "EnvironmentId": scheduler_config["ProductionEnvironmentId"],
+            "QueueTime": to_central_time(
+                time=snow_item["planned_start_date"], add_delta=False
+            ),
+            "QueueTimeExpiry": to_central_time(
+                time=snow_item["planned_start_date"], add_delta=True
+            ),
+        }
 
-            # set the snow item number, time, and description for the webex message
-            webex_message = (
-                f'ServiceNow Item: _{snow_item["task_effective_number"]}_ \n'
-                f"Time: _{start_time} CST - {end_time} CST_ \n"
-                f'Description: _{snow_item["short_description"]}_ \n'
+        # if the release is successful it will return the deployment and we post to webex
+        deployment = schedule_release(deployment_resource=deployment_resource)
+        if deployment:
+            add_queued_task(project_name=project_name, release_number=release_number)
+            task_store().record(plan, "SCHEDULED", deployment_id=deployment.get("Id", ""))
+            webex_message += "Status: **Successfully assigned ServiceNow item and scheduled deployment in Octopus Deploy.** \n"
+            webex_message += "_No further action needed._ \n"
+        else:
+            # if it fails post to webex about the failure
+            webex_message += (
+                "Status: **FAILED to schedule deployment in Octopus Deploy.** \n"
+                "_Possible Solutions:_ \n"
+                "   - Verify that at minimum five minutes have been alloted to schedule the deployment. \n"
+                "   - Verify that date and time in the ServiceNow item are correct. \n"
+                "   - Verify that the Octopus Deploy server is up and running.  \n"
             )
+            assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+            task_store().record(plan, "SCHEDULE_FAILED")
+        post_to_webex(message=webex_message)
+    else:
+        webex_message += (
+            "Status: **Release has already been scheduled in Octopus Deploy!** \n"
+            "_Possible Solutions:_ \n"
+            "   - Deployment has previously been scheduled, but verify that the date and time match what is on Change Task.  \n"
+        )
+        task_store().record(plan, "ALREADY_SCHEDULED")
 
-            # we only want to schedule items that apply to OD
-            # TODO this could be simplified, perhaps return the action verb from action_item?
-            if action_item(snow_item["short_description"]):
-                # if skip is in the keyword we do not want schedule
-                # convert description to all upper case to avoid any cAsE problems
-                description_upper = str(snow_item["short_description"]).upper()
-
-                if "SKIP" in description_upper:
-                    if assign_snow_item(snow_item=snow_item, assign_to_queue=False):
-                        webex_message += (
-                            f"Status: **Found override keyword SKIP.** \n"
-                            f"  - ServiceNow item has been assigned to P-AUTOCTOPUS. \n"
-                            f"  - Deployment HAS NOT been scheduled in Octopus Deploy. Development team will manually trigger the deployment. \n"
-                            f"_No further action needed._ \n"
-                        )
-                    else:
-                        webex_message += "Status: ** - Failed to assign ServiceNow item to P-AUTOOCTOPUS.** \n"
-
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # if manual is in the keyword notify webex
-                if "MANUAL" in description_upper:
-                    webex_message += (
-                        "Status: **Found override keyword MANUAL** \n"
-                        "   - Please assign this ServiceNow item to whoever will be on call the week of the deployment or Production Support. \n"
-                    )
-
-                    post_to_webex(message=webex_message)
-                    continue
-                
-                # assign snow item to autooctopus
-                # TODO I think this needs to move later in the process to avoid the assign/unassign loop when there is an issue later in the process
-                if not assign_snow_item(snow_item=snow_item, assign_to_queue=False):
-                    webex_message += "Status: **Failed to assign ServiceNow item to P-AUTOCTOPUS.** \n"
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # extract the version number from the description
-                release_number = extract_release(snow_item["short_description"])
-
-                # we need to verify that the release number is not null
-                if not release_number:
-                    webex_message += (
-                        "Status: **Unable to extract release from ServiceNow short description.** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Please ensure title is in following format: \n"
-                        "Deploy [_project name_] [_release number_] [_override_] \n"
-                    )
-                    assign_snow_item(snow_item=snow_item, assign_to_queue=True) # TODO not necessary if we don't assign by default on line 83
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # get the project name and project id
-                project_id = find_project_id(
-                    short_description=snow_item["short_description"]
-                )
-
-                if not project_id:
-                    webex_message += (
-                        "Status: **Unable to find project in Octopus Deploy.** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Please verify that you have spelled your project name correctly in the title \n"
-                    )
-                    assign_snow_item(snow_item=snow_item, assign_to_queue=True) # TODO not necessary if we don't assign by default on line 83
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # find release in octopus deploy
-                release_details = find_release(
-                    release_number=release_number, project_id=project_id
-                )
-
-                if not release_details:
-                    webex_message += (
-                        f"Status: **The release number {release_number} was not found in Octopus Deploy!** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Please ensure that the release in the ServiceNow item matches what release is being deployed. \n"
-                    )
-                    assign_snow_item(snow_item=snow_item, assign_to_queue=True)
-                    post_to_webex(message=webex_message)
-                    continue
-
-                # if release is not scheduled
-                if not scheduled(
-                    release_number=release_number,
-                    project_name=find_project_name(snow_item["short_description"]),
-                ):
-                    # Verify that environment is able to be promoted to prod
-                    if not promotable(release_id=str(release_details["Id"])):
-                        # IF ITS NOT PROMOTABLE post message
-                        webex_message += (
-                            f"Status: **The release number {release_number} is unable to be promoted to Production!** \n"
-                            "_Possible Solutions:_ \n"
-                            "   - Please ensure that the release has gone through the lifecycle in Octopus Deploy to reach Production and is in the correct channel. \n"
-                        )
-                        assign_snow_item(snow_item=snow_item, assign_to_queue=True)
-                        post_to_webex(message=webex_message)
-                        continue
-
-                    # deployment resource for octopus deploy to create deployment
-                    deployment_resource = {
-                        "ReleaseId": release_details["Id"],
-                        "ProjectId": release_details["ProjectId"],
-                        "ChannelId": release_details["ChannelId"],
-                        "EnvironmentId": scheduler_config["ProductionEnvironmentId"],
-                        "QueueTime": to_central_time(
-                            time=snow_item["planned_start_date"], add_delta=False
-                        ),
-                        "QueueTimeExpiry": to_central_time(
-                            time=snow_item["planned_start_date"], add_delta=True
-                        ),
-                    }
-
-                    # if the release is successful it will return true and we post to webex
-                    if schedule_release(deployment_resource=deployment_resource):
-                        webex_message += "Status: **Successfully assigned ServiceNow item and scheduled deployment in Octopus Deploy.** \n"
-                        webex_message += "_No further action needed._ \n"
-                    else:
-                        # if it fails post to webex about the failure
-                        webex_message += (
-                            "Status: **FAILED to schedule deployment in Octopus Deploy.** \n"
-                            "_Possible Solutions:_ \n"
-                            "   - Verify that at minimum five minutes have been alloted to schedule the deployment. \n"
-                            "   - Verify that date and time in the ServiceNow item are correct. \n"
-                            "   - Verify that the Octopus Deploy server is up and running.  \n"
-                        )
-                        assign_snow_item(snow_item=snow_item, assign_to_queue=True)
-                    post_to_webex(message=webex_message)
-                else:
-                    webex_message += (
-                        "Status: **Release has already been scheduled in Octopus Deploy!** \n"
-                        "_Possible Solutions:_ \n"
-                        "   - Deployment has previously been scheduled, but verify that the date and time match what is on Change Task.  \n"
-                    )
-
-                    post_to_webex(message=webex_message)
-                    continue
+        post_to_webex(message=webex_message)
@@ -1,9 +1,54 @@
+import base64
 import json
+import threading
 import urllib.parse
+import uuid
+from datetime import datetime, timedelta
+from pytz import utc
 from cmadevops_deployment_scheduler.config.config import scheduler_config
-import requests
 import re
 from cmadevops_deployment_scheduler.modules.logwrite import log
+from cmadevops_deployment_scheduler.modules.clients import service_now_client
+from cmadevops_deployment_scheduler.modules.local_state import state_path, load_state, save_state
+
+
+# the only change task fields the scheduler reads, everything else is left on the server
+CHANGE_TASK_FIELDS = [
+    "sys_id",
+    "number",
+    "task_effective_number",
+    "short_description",
+    "planned_start_date",
+    "planned_end_date",
+    "assigned_to",
+    "change_request",
+    # dot-walked so a standard change can be spotted without reading the parent change
+    "change_request.type",
+    # saved with every outcome in the task store
+    "sys_updated_on",
+]
+
+# the incremental sync also reads whether the change task is still open and still with our group
+CHANGE_TASK_SYNC_FIELDS = CHANGE_TASK_FIELDS + ["active", "assignment_group"]
+
+# format of date and time fields in the ServiceNow Table API
+SNOW_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# keywords that defines an action item, the change task query only returns tasks with one of them
+ACTION_KEYWORDS = ["DEPLOY", "RELEASE", "MANUAL", "SKIP"]
+
+# the parent change is only read to find out if it is a standard change
+PARENT_CHANGE_FIELDS = ["sys_id", "type"]
+
+# parent changes read during the run keyed by sys_id, many change tasks share the same parent
+_parent_changes = {}
+
+# change task updates waiting to be sent through the batch API, created on first use
+_change_task_writes = None
+_change_task_writes_lock = threading.Lock()
+
+# active change tasks of the run, read once and kept up to date as the run assigns them
+_change_task_snapshot = None
 
 
 def unassign(snow_items: list) -> None:
@@ -19,9 +64,14 @@ def unassign(snow_items: list) -> None:
     if snow_items:
         for snow_item in snow_items:
             if ("PROCESSED" not in snow_item["short_description"]) and (
-                is_a_standard_change(snow_item["short_description"], snow_item["change_request"]["link"]) == False
+                is_a_standard_change(
+                    snow_item["short_description"], parent_change_link(snow_item), parent_change_type(snow_item)
+                ) == False
             ):
-                assign_snow_item(snow_item=snow_item, assign_to_queue=True)
+                assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+
+        # send the updates before the unassigned tasks are read so they are picked up this run
+        change_task_writes().flush()
 
 
 def action_item(snow_item: str) -> bool:
@@ -39,11 +89,8 @@ def action_item(snow_item: str) -> bool:
         if "IGNORE" in snow_item:
             return False
 
-        # keywords that defines an action item
-        keywords = ["DEPLOY", "RELEASE", "MANUAL", "SKIP"]
-
         # find keyword
-        for k in keywords:
+        for k in ACTION_KEYWORDS:
             if k in snow_item:
                 return True
 
@@ -51,51 +98,164 @@ def action_item(snow_item: str) -> bool:
     return False
 
 
-def retrieve_snow_items(endpoint: str, query_string: str) -> list:
+def fields_query(fields: list) -> str:
     """
-    Gets SNOW items from specified endpoint
+    Builds the query string that limits a ServiceNow response to the fields passed in,
+    reference fields come back as a plain sys_id instead of a link
+        Parameters:
+            fields: names of the fields to return
+    """
+    return f"&sysparm_fields={urllib.parse.quote(','.join(fields))}&sysparm_exclude_reference_link=true"
+
+
+def parent_change_id(snow_item: dict) -> str:
+    """
+    Gets the sys_id of the parent change of a change task
+        Parameters:
+            snow_item: change task from ServiceNow, change_request is either a reference link or a plain sys_id
+    """
+    change_request = snow_item.get("change_request") or ""
+    if isinstance(change_request, dict):
+        change_request = change_request.get("value") or link_sys_id(change_request.get("link", ""))
+    return change_request
+
+
+def link_sys_id(link: str) -> str:
+    # the sys_id is the last part of the path of a record link
+    return urllib.parse.urlparse(str(link)).path.rstrip("/").split("/")[-1]
+
+
+def parent_change_type(snow_item: dict) -> str:
+    """
+    Gets the type of the parent change dot-walked from a change task, None if it was not read with the task
+        Parameters:
+            snow_item: change task from ServiceNow
+    """
+    change_type = snow_item.get("change_request.type")
+    if isinstance(change_type, dict):
+        change_type = change_type.get("value")
+    return change_type
+
+
+
+def parent_change_link(snow_item: dict) -> str:
+    """
+    Builds the link to the parent change of a change task
+        Parameters:
+            snow_item: change task from ServiceNow, change_request is either a reference link or a plain sys_id
+    """
+    change_request = snow_item.get("change_request") or ""
+    if isinstance(change_request, dict):
+        if change_request.get("link"):
+            return change_request["link"]
+        change_request = change_request.get("value", "")
+
+    if not change_request:
+        return ""
+
+    return f"{scheduler_config['BaseUrl']}{scheduler_config.get('ChangeRequestEndpoint', '/api/now/table/change_request')}/{change_request}"
+
+
+def iter_snow_pages(
+    endpoint: str, query_string: str, fields: list = None, page_size: int = None, raise_errors: bool = False
+):
+    """
+    Yields pages of SNOW items from specified endpoint. Pages are read in sys_id order starting after
+    the last item of the previous page, so items that are updated while we go through them are not skipped
         Parameters:
             endpoint: ServiceNow API endpoint
-            query_string: query to return records from ServiceNOw
+            query_string: url encoded query to return records from ServiceNOw
+            fields: fields to return, must include sys_id, all fields are returned if not passed in
+            page_size: max number of items per page, SnowPageSize from config if not passed in
+            raise_errors: raise errors instead of logging them, so a failed read can be told apart from an empty one
+    """
+    page_size = page_size or int(scheduler_config.get("SnowPageSize", 200))
+    last_sys_id = ""
+
+    while True:
+        page_query = f"sys_id>{last_sys_id}^ORDERBYsys_id" if last_sys_id else "ORDERBYsys_id"
+        if query_string:
+            page_query = f"^{page_query}"
+
+        try:
+            results = service_now_client().get(
+                f"{endpoint}{query_string}{urllib.parse.quote(page_query)}"
+                f"{fields_query(fields) if fields else ''}&sysparm_limit={page_size}"
+            )
+        except Exception as e:
+            if raise_errors:
+                raise
+            error_string = str(e)
+            log(error_string)
+            return
+
+        if results.status_code != 200:
+            if raise_errors:
+                raise Exception(f"ServiceNow returned {results.status_code} for {endpoint}")
+            log(results.text)
+            return
+
+        items = results.json()["result"]
+        if items:
+            yield items
+
+        # X-Total-Count is the number of items left from this page on, when they all fit on this page we are done
+        remaining = int(results.headers.get("X-Total-Count", len(items) + 1))
+        if len(items) < page_size or len(items) >= remaining:
+            return
+
+        last_sys_id = items[-1]["sys_id"]
+
+
+def iter_snow_items(endpoint: str, query_string: str, fields: list = None, page_size: int = None):
     """
+    Yields SNOW items from specified endpoint, see iter_snow_pages
+        Parameters:
+            endpoint: ServiceNow API endpoint
+            query_string: url encoded query to return records from ServiceNOw
+            fields: fields to return, must include sys_id, all fields are returned if not passed in
+            page_size: max number of items per page, SnowPageSize from config if not passed in
+    """
+    for items in iter_snow_pages(endpoint=endpoint, query_string=query_string, fields=fields, page_size=page_size):
+        for item in items:
+            yield item
 
-    try:
-        results = requests.get(
-            url=f"{scheduler_config['BaseUrl']}{endpoint}{query_string}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
-        )
-    except Exception as e:
-        error_string = str(e)
-        log(error_string)
-        return []
 
-    if results.status_code == 200:
-        results = results.json()
-        return results["result"]
-    else:
-        log(results.text)
-        return []
+def retrieve_snow_items(endpoint: str, query_string: str, fields: list = None) -> list:
+    """
+    Gets SNOW items from specified endpoint
+        Parameters:
+            endpoint: ServiceNow API endpoint
+            query_string: query to return records from ServiceNOw
+            fields: fields to return, all fields are returned if not passed in
+    """
+    return list(iter_snow_items(endpoint=endpoint, query_string=query_string, fields=fields))
 
 
-def query_builder(assigned_to: bool) -> str:
+def query_builder(assigned_to: bool = None) -> str:
     """
     Builds query string for querying all unassigned or assigned Change Tasks in ServiceNow
         Parameters:
-            assigned_to: Builds querystring for tasks that are assigned to automation account or query for unassigned tasks
+            assigned_to: Builds querystring for tasks that are assigned to automation account or query for unassigned tasks,
+                         if not passed in the query is for both
     """
 
     query = []
-    query.append(
-        f"assigned_to={scheduler_config['AutomationUserId']}"
-    ) if assigned_to else query.append("assigned_toISEMPTY")
+    if assigned_to is None:
+        query.append(f"assigned_toISEMPTY^ORassigned_to={scheduler_config['AutomationUserId']}")
+    else:
+        query.append(
+            f"assigned_to={scheduler_config['AutomationUserId']}"
+        ) if assigned_to else query.append("assigned_toISEMPTY")
     query.append("active=true")
     query.append(f"assignment_group={scheduler_config['ChsDevOpsSoftwareSolutionsId']}")
     query.append("planned_start_dateISNOTEMPTY")
     query.append("planned_end_dateISNOTEMPTY")
 
+    # tasks the scheduler does not act on are left on the server, action_item still checks every task it gets
+    query.append("short_descriptionNOT LIKEIGNORE")
+    query.append("^OR".join(f"short_descriptionLIKE{keyword}" for keyword in ACTION_KEYWORDS))
+
     # convert the query list to a string
     query_to_string = ""
     for q in query:
@@ -105,40 +265,258 @@ def query_builder(assigned_to: bool) -> str:
     return urllib.parse.quote(query_to_string.rstrip(query_to_string[-1]))
 
 
+def updated_query_builder(updated_since: str, sys_ids: list = None) -> str:
+    """
+    Builds query string for querying Change Tasks of the group that were updated since a point in time, whatever
+    their state or assignee is, so tasks that were closed or assigned to someone else are seen as well
+        Parameters:
+            updated_since: sys_updated_on of the last sync
+            sys_ids: if passed in, queries these change tasks instead if they were moved to another group,
+                     the group query can not see them any more
+    """
+    # go back a few minutes in case the clocks are not exactly in step, reading a task twice does no harm
+    overlap = timedelta(seconds=int(scheduler_config.get("SnowSyncOverlapSeconds", 300)))
+    updated_since = (datetime.strptime(updated_since, SNOW_TIME_FORMAT) - overlap).strftime(SNOW_TIME_FORMAT)
+
+    if sys_ids is not None:
+        return urllib.parse.quote(
+            f"sys_idIN{','.join(sys_ids)}^assignment_group!={scheduler_config['ChsDevOpsSoftwareSolutionsId']}"
+            f"^sys_updated_on>={updated_since}"
+        )
+
+    return urllib.parse.quote(
+        f"assignment_group={scheduler_config['ChsDevOpsSoftwareSolutionsId']}^sys_updated_on>={updated_since}"
+    )
+
+
+def iter_change_tasks(assigned_to: bool = None, raise_errors: bool = False):
+    """
+    Yields unassigned or assigned change tasks in ServiceNow assigned to the group identifier in config,
+    tasks are read a page at a time as they are needed
+        Parameters:
+            assigned_to: Query for tasks that are assigned to automation account or query for unassigned tasks,
+                         if not passed in both are returned
+            raise_errors: raise errors instead of logging them, see iter_snow_pages
+    """
+    for tasks in iter_snow_pages(
+        endpoint=scheduler_config["QueryChangeTaskEndpoint"],
+        query_string=query_builder(assigned_to=assigned_to),
+        fields=CHANGE_TASK_FIELDS,
+        raise_errors=raise_errors,
+    ):
+        # the parent changes of the whole page are read in one request
+        prefetch_parent_changes(tasks)
+
+        for task in tasks:
+            # skip change tasks that have the ignore keywoard
+            if "IGNORE" not in str(task["short_description"]).upper():
+                yield task
+
+
 def change_tasks(assigned_to: bool) -> list:
     """
     Gets all unassigned or assigned change tasks in ServiceNow assigned to the group identifier in config
         Parameters:
             assigned_to: Query for tasks that are assigned to automation account or query for unassigned tasks
     """
+    return list(iter_change_tasks(assigned_to=assigned_to))
 
-    # get all unassigned change tasks
-    change_tasks = retrieve_snow_items(
-        endpoint=scheduler_config["QueryChangeTaskEndpoint"],
-        query_string=query_builder(assigned_to=assigned_to),
+
+def assigned_to_id(snow_item: dict) -> str:
+    """
+    Gets the sys_id of the user a change task is assigned to, empty if it is not assigned
+        Parameters:
+            snow_item: change task from ServiceNow, assigned_to is either a reference link or a plain sys_id
+    """
+    assigned_to = snow_item.get("assigned_to") or ""
+    if isinstance(assigned_to, dict):
+        assigned_to = assigned_to.get("value", "")
+    return assigned_to
+
+
+def assignment_group_id(snow_item: dict) -> str:
+    """
+    Gets the sys_id of the group a change task is assigned to
+        Parameters:
+            snow_item: change task from ServiceNow, assignment_group is either a reference link or a plain sys_id
+    """
+    assignment_group = snow_item.get("assignment_group") or ""
+    if isinstance(assignment_group, dict):
+        assignment_group = assignment_group.get("value", "")
+    return assignment_group
+
+
+def assigned_to_automation(snow_item: dict) -> bool:
+    """
+    Checks if a change task is assigned to the automation account
+        Parameters:
+            snow_item: change task from ServiceNow
+    """
+    return assigned_to_id(snow_item) == scheduler_config["AutomationUserId"]
+
+
+def change_task_stats() -> dict:
+    """
+    Gets the number of change tasks the scheduler works on and when the last of them was updated from the
+    ServiceNow aggregate API, no change tasks are downloaded
+    Returns:
+        dict: count and newest sys_updated_on, None if ServiceNow could not be reached
+    """
+    try:
+        results = service_now_client().get(
+            f"{scheduler_config.get('StatsChangeTaskEndpoint', '/api/now/stats/change_task')}"
+            f"?sysparm_query={query_builder()}&sysparm_count=true&sysparm_max_fields=sys_updated_on"
+        )
+    except Exception as e:
+        log(str(e))
+        return None
+
+    if results.status_code != 200:
+        log(results.text)
+        return None
+
+    stats = results.json()["result"]["stats"]
+    return {
+        "Count": int(stats.get("count", 0)),
+        "UpdatedOn": (stats.get("max") or {}).get("sys_updated_on", ""),
+    }
+
+
+def open_change_task(snow_item: dict) -> bool:
+    """
+    Checks if a change task read by the incremental sync is one the scheduler works on,
+    these are the same filters query_builder and iter_change_tasks use
+        Parameters:
+            snow_item: change task from ServiceNow read with CHANGE_TASK_SYNC_FIELDS
+    """
+    return (
+        str(snow_item.get("active")).lower() == "true"
+        and assignment_group_id(snow_item) == scheduler_config["ChsDevOpsSoftwareSolutionsId"]
+        and assigned_to_id(snow_item) in ("", scheduler_config["AutomationUserId"])
+        and bool(snow_item.get("planned_start_date"))
+        and bool(snow_item.get("planned_end_date"))
+        and action_item(snow_item["short_description"])
+    )
+
+
+def sync_change_tasks() -> list:
+    """
+    Gets change tasks from the snapshot saved by the previous run and only reads the change tasks that were
+    updated since then. Every ChangeTaskFullSyncRuns runs, or when there is no snapshot, all change tasks are
+    read again, that is also when tasks that were deleted are dropped.
+    """
+    path = state_path(scheduler_config.get("ChangeTaskFile", "change_tasks.json"))
+    snapshot = load_state(path)
+    full_sync_runs = int(scheduler_config.get("ChangeTaskFullSyncRuns", 24))
+
+    # the sync start time becomes the next watermark so tasks updated while we sync are picked up next run,
+    # sys_updated_on is read and queried in UTC
+    synced_on = datetime.now(utc).strftime(SNOW_TIME_FORMAT)
+    snow_items = None
+
+    if "Tasks" in snapshot and snapshot.get("RunsSinceFullSync", 0) < full_sync_runs:
+        try:
+            snow_items = dict(snapshot["Tasks"])
+
+            # the tasks of the group that changed, then the open tasks we hold that were moved to another group.
+            # sys_ids are 32 characters, keep the query string well under the url length limits
+            open_ids = list(snow_items)
+            page_size = min(int(scheduler_config.get("SnowPageSize", 200)), 100)
+            queries = [updated_query_builder(updated_since=snapshot["LastSyncedOn"])] + [
+                updated_query_builder(updated_since=snapshot["LastSyncedOn"], sys_ids=open_ids[i : i + page_size])
+                for i in range(0, len(open_ids), page_size)
+            ]
+            for query_string in queries:
+                for tasks in iter_snow_pages(
+                    endpoint=scheduler_config["QueryChangeTaskEndpoint"],
+                    query_string=query_string,
+                    fields=CHANGE_TASK_SYNC_FIELDS,
+                    raise_errors=True,
+                ):
+                    prefetch_parent_changes(tasks)
+
+                    # a task that is no longer open, is now assigned to someone else or moved to another group
+                    # leaves the snapshot
+                    for task in tasks:
+                        if open_change_task(task):
+                            snow_items[task["sys_id"]] = task
+                        else:
+                            snow_items.pop(task["sys_id"], None)
+
+            runs_since_full_sync = snapshot["RunsSinceFullSync"] + 1
+        except Exception as e:
+            log(f"Incremental change task sync failed, running full sync: {e}\n")
+            snow_items = None
+
+    if snow_items is None:
+        try:
+            snow_items = {task["sys_id"]: task for task in iter_change_tasks(raise_errors=True)}
+        except Exception as e:
+            # do not overwrite a good snapshot with the result of a failed read
+            log(f"Unable to read change tasks: {e}\n")
+            return list(snapshot.get("Tasks", {}).values())
+        runs_since_full_sync = 0
+
+    save_state(
+        path,
+        {
+            "LastSyncedOn": synced_on,
+            "RunsSinceFullSync": runs_since_full_sync,
+            "Tasks": snow_items,
+        },
     )
+    return list(snow_items.values())
+
+
+class ChangeTaskSnapshot:
+    """
+    Active change tasks of the assignment group that are either unassigned or assigned to the automation account.
+    They are read from ServiceNow once and split into assigned and unassigned tasks in memory, assign_snow_item
+    updates the tasks in place once ServiceNow saved the update so each phase of the run sees what the phases before it did
+        Parameters:
+            snow_items: change tasks to start with, synced with ServiceNow if not passed in, see sync_change_tasks
+    """
+
+    def __init__(self, snow_items: list = None):
+        self.snow_items = sync_change_tasks() if snow_items is None else list(snow_items)
+
+    def __len__(self) -> int:
+        return len(self.snow_items)
 
-    # return all unassigned change tasks that do not have the ignore keywoard
-    mod_changed_tasks = []
-    [
-        mod_changed_tasks.append(task)
-        for task in change_tasks
-        if "IGNORE" not in str(task["short_description"]).upper()
-    ]
+    def assigned(self) -> list:
+        """Change tasks assigned to the automation account"""
+        return [snow_item for snow_item in self.snow_items if assigned_to_automation(snow_item)]
 
-    return mod_changed_tasks
+    def unassigned(self) -> list:
+        """Change tasks that are not assigned to anyone"""
+        return [snow_item for snow_item in self.snow_items if not assigned_to_id(snow_item)]
 
 
-def set_processed(short_description: str, assign_to_queue: bool, parent_link: str) -> str:
+def change_task_snapshot(refresh: bool = False) -> ChangeTaskSnapshot:
+    """
+    Gets the change task snapshot for the run, change tasks are only read from ServiceNow once
+        Parameters:
+            refresh: if set to true the change tasks are read again
+    """
+    global _change_task_snapshot
+
+    if refresh or _change_task_snapshot is None:
+        _change_task_snapshot = ChangeTaskSnapshot()
+
+    return _change_task_snapshot
+
+
+def set_processed(short_description: str, assign_to_queue: bool, parent_link: str, change_type: str = None) -> str:
     """Injects PROCESSED to the end of the short desciption in ServiceNow"
 
     Keyword arguments:
     short_description -- short description in ServiceNow
     assign_to_queue: bool
+    change_type -- type of the parent change if it was read with the change task
     Return: str
     """
 
-    if is_a_standard_change(short_description, parent_link) == False:
+    if is_a_standard_change(short_description, parent_link, change_type) == False:
         if assign_to_queue:
             # if its assigned to the queue we need to remove the PROCESSED from the title
             return short_description.replace(
@@ -150,14 +528,13 @@ def set_processed(short_description: str, assign_to_queue: bool, parent_link: st
             return f"{short_description.replace('PROCESSED','').rstrip()} PROCESSED"
 
 
-def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
+def change_task_body(snow_item: dict, assign_to_queue: bool) -> dict:
     """
-    Assigns ServiceNow item to service account
+    Builds the fields to update when a ServiceNow item is assigned to the service account or back to the queue
         Parameters:
             snow_item: response from ServiceNow
-            assign_to_queue: if true it assigns the snow item back to the queue
+            assign_to_queue: if true the fields assign the snow item back to the queue
     """
-    # we need to update the change task body
     json_body = {
         "change_task_type": "Planning"
         if assign_to_queue
@@ -169,28 +546,74 @@ def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
         "short_description": set_processed(
             short_description=snow_item["short_description"],
             assign_to_queue=assign_to_queue,
-            parent_link=snow_item["change_request"]["link"],
+            parent_link=parent_change_link(snow_item),
+            change_type=parent_change_type(snow_item),
         ),
     }
-    endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
 
     # You cannot update descriptions in task from standard changes
     # So we need to figure out if it is a standard change
-    if is_a_standard_change(snow_item["short_description"], snow_item["change_request"]["link"]):
+    if is_a_standard_change(
+        snow_item["short_description"], parent_change_link(snow_item), parent_change_type(snow_item)
+    ):
         json_body.pop("short_description")
 
+    return json_body
+
+
+def pending_change(snow_item: dict, json_body: dict) -> bool:
+    """
+    Checks if an update would change the assignee or title of a ServiceNow item, see change_task_body
+        Parameters:
+            snow_item: response from ServiceNow
+            json_body: fields to update
+    """
+    return json_body["assigned_to"] != assigned_to_id(snow_item) or json_body.get(
+        "short_description", snow_item["short_description"]
+    ) != snow_item["short_description"]
+
+
+def assign_snow_item(snow_item: dict, assign_to_queue: bool, queue=None) -> bool:
+    """
+    Assigns ServiceNow item to service account
+        Parameters:
+            snow_item: response from ServiceNow
+            assign_to_queue: if true it assigns the snow item back to the queue
+            queue: ChangeTaskWriteQueue to send the update with later, only for callers that do not
+                   check the result as it is always true until the queue is flushed
+    """
+    # we need to update the change task body
+    json_body = change_task_body(snow_item=snow_item, assign_to_queue=assign_to_queue)
+
+    # keep the task we hold in step with ServiceNow so the rest of the run does not have to read it again,
+    # a queued update is only applied once the flush saved it so a failed write does not count as assigned
+    if queue is not None:
+        queue.add(sys_id=snow_item["sys_id"], json_body=json_body, on_saved=lambda: snow_item.update(json_body))
+        return True
+
+    if not update_change_task(sys_id=snow_item["sys_id"], json_body=json_body):
+        return False
+
+    snow_item.update(json_body)
+    return True
+
+
+def update_change_task(sys_id: str, json_body: dict) -> bool:
+    """
+    Updates a change task in ServiceNow
+        Parameters:
+            sys_id: sys_id of the change task
+            json_body: fields to update
+    """
+    endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
+
     # update SNOW item
     try:
-        results = requests.put(
-            url=f"{scheduler_config['BaseUrl']}{endpoint}/{snow_item['sys_id']}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
-            data=json.dumps(json_body),
+        results = service_now_client().put(
+            f"{endpoint}/{sys_id}", data=json.dumps(json_body)
         )
     except Exception as e:
-        log(e.message)
+        log(str(e))
         return False
 
     # if the status code is not 200 then it failed
@@ -199,39 +622,194 @@ def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
         return False
     else:
         return True
+
+
+class ChangeTaskWriteQueue:
+    """
+    Collects change task updates and sends them through the ServiceNow batch API,
+    SnowBatchSize updates per request. Updates the batch did not save are sent again on their own
+        Parameters:
+            batch_size: max number of updates per batch request, SnowBatchSize from config if not passed in
+    """
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or int(scheduler_config.get("SnowBatchSize", 25))
+        self.updates = {}
+        self.callbacks = {}
+
+        # items are scheduled on several threads that all add to the same queue
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.updates)
+
+    def add(self, sys_id: str, json_body: dict, on_saved=None) -> None:
+        """
+        Queues an update of a change task
+            Parameters:
+                sys_id: sys_id of the change task
+                json_body: fields to update
+                on_saved: called once the flush has saved the update, not called if it failed
+        """
+        # a later update of the same change task wins, the same as sending them one after the other
+        with self.lock:
+            self.updates.setdefault(sys_id, {}).update(json_body)
+            if on_saved is not None:
+                self.callbacks.setdefault(sys_id, []).append(on_saved)
+
+    def flush(self) -> dict:
+        """
+        Sends every queued update
+            Returns:
+                dict: sys_id of each change task and true if the update was saved
+        """
+        with self.lock:
+            updates, self.updates = self.updates, {}
+            callbacks, self.callbacks = self.callbacks, {}
+        items = list(updates.items())
+
+        results = {}
+        for i in range(0, len(items), self.batch_size):
+            results.update(self.send_batch(items[i : i + self.batch_size]))
+
+        for sys_id, saved in results.items():
+            if not saved:
+                results[sys_id] = update_change_task(sys_id=sys_id, json_body=updates[sys_id])
+
+        for sys_id, saved in results.items():
+            if saved:
+                for on_saved in callbacks.get(sys_id, []):
+                    on_saved()
+
+        return results
+
+    def send_batch(self, chunk: list) -> dict:
+        """
+        Sends one batch request, every update in it is a PUT on the change task
+            Parameters:
+                chunk: list of sys_id and fields to update
+        """
+        endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
+        rest_requests = [
+            {
+                "id": str(n),
+                "method": "PUT",
+                "url": f"{endpoint}/{sys_id}",
+                "headers": [
+                    {"name": "Content-Type", "value": "application/json"},
+                    {"name": "Accept", "value": "application/json"},
+                ],
+                # the batch API wants every body base64 encoded
+                "body": base64.b64encode(json.dumps(json_body).encode()).decode(),
+            }
+            for n, (sys_id, json_body) in enumerate(chunk)
+        ]
+
+        results = {sys_id: False for sys_id, _ in chunk}
+        try:
+            response = service_now_client().post(
+                scheduler_config.get("BatchEndpoint", "/api/now/v1/batch"),
+                data=json.dumps({"batch_request_id": str(uuid.uuid4()), "rest_requests": rest_requests}),
+            )
+        except Exception as e:
+            log(str(e))
+            return results
+
+        if response.status_code != 200:
+            log(response.text)
+            return results
+
+        # map each result back to its change task, requests that were not serviced stay false
+        for serviced in response.json().get("serviced_requests", []):
+            sys_id = chunk[int(serviced["id"])][0]
+            if serviced.get("status_code") == 200:
+                results[sys_id] = True
+            else:
+                log(f"Batch update of change task {sys_id} returned {serviced.get('status_code')}")
+
+        return results
+
+
+def change_task_writes() -> ChangeTaskWriteQueue:
+    """Gets the change task write queue for the run"""
+    global _change_task_writes
+
+    with _change_task_writes_lock:
+        if _change_task_writes is None:
+            _change_task_writes = ChangeTaskWriteQueue()
+    return _change_task_writes
     
-def is_a_standard_change(short_description: str, parent_link: str) -> bool:
+def is_a_standard_change(short_description: str, parent_link: str, change_type: str = None) -> bool:
     """Verifies if a project is a standard change
         by checking the short description for SSIS and that the parent change is a type=standard
     Args:
         short_description (str): Short description from ServiceNow
-        parent_link (srt): comes from change_request.link in CTASK json
+        parent_link (srt): link to the parent change, see parent_change_link()
+        change_type (str): type of the parent change if it was read with the change task,
+            the parent change is only read when this is not passed in
 
     Returns:
         bool: true or false
     """
-    found = False
-    chg_record = retrieve_parent_change(parent_link)
-    if re.search(r"(ssis)", short_description, re.IGNORECASE):
-        if chg_record["type"] == "standard":
-            found = True
+    # only SSIS tasks can be standard changes, so the parent change is not needed for anything else
+    if not re.search(r"(ssis)", short_description, re.IGNORECASE):
+        return False
+
+    if change_type is None:
+        change_type = retrieve_parent_change(parent_link)["type"]
+
+    return change_type == "standard"
+
+def prefetch_parent_changes(snow_items: list) -> None:
+    """
+    Reads the parent changes of a batch of change tasks with one sys_idIN query per page
+    and keeps them for retrieve_parent_change
+        Parameters:
+            snow_items: change tasks from ServiceNow
+    """
+    missing = list(
+        dict.fromkeys(
+            sys_id
+            for sys_id in (
+                parent_change_id(snow_item)
+                for snow_item in snow_items
+                # only SSIS tasks without a dot-walked change type need their parent change
+                if parent_change_type(snow_item) is None
+                and re.search(r"(ssis)", str(snow_item["short_description"]), re.IGNORECASE)
+            )
+            if sys_id and sys_id not in _parent_changes
+        )
+    )
+
+    # sys_ids are 32 characters, keep the query string well under the url length limits
+    page_size = min(int(scheduler_config.get("SnowPageSize", 200)), 100)
+    for i in range(0, len(missing), page_size):
+        for change in iter_snow_items(
+            endpoint=f"{scheduler_config.get('ChangeRequestEndpoint', '/api/now/table/change_request')}?sysparm_query=",
+            query_string=urllib.parse.quote(f"sys_idIN{','.join(missing[i : i + page_size])}"),
+            fields=PARENT_CHANGE_FIELDS,
+            page_size=page_size,
+        ):
+            _parent_changes[change["sys_id"]] = change
 
-    return found
 
 def retrieve_parent_change(parent_link: str) -> list:
     """
-    Gets parent change from link in CTASK 
+    Gets parent change from link in CTASK, each parent change is only read once per run
         Parameters:
-            parent_link: change_request.link in CTASK json
+            parent_link: link to the parent change, see parent_change_link()
     """
+    sys_id = link_sys_id(parent_link)
+    if sys_id in _parent_changes:
+        return _parent_changes[sys_id]
 
     try:
-        change = requests.get(
-            url=f"{parent_link}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
+        change = service_now_client().get(
+            f"{parent_link}",
+            params={
+                "sysparm_fields": ",".join(PARENT_CHANGE_FIELDS),
+                "sysparm_exclude_reference_link": "true",
+            },
         )
     except Exception as e:
         error_string = str(e)
@@ -240,6 +818,7 @@ def retrieve_parent_change(parent_link: str) -> list:
 
     if change.status_code == 200:
         change = change.json()
+        _parent_changes[sys_id] = change["result"]
         return change["result"]
     else:
         log(change.text)
@@ -1,9 +1,13 @@
+import base64
 import json
 import urllib.parse
+import uuid
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import os
 import logging
+import threading
 
 # Setup logging for GitHub Actions
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
@@ -48,6 +52,99 @@ scheduler_config = {
 print("Scheduler Config", scheduler_config)
 
 
+class ServiceClient:
+    """
+    HTTP client for a single service, every call goes through one pooled session so
+    connections are kept alive and reused instead of doing a new TCP and TLS handshake per call
+        Parameters:
+            base_url: base url of the service, endpoints are added to it
+            headers: headers sent with every request
+            auth: username and password sent with every request
+            verify: verify the TLS certificate of the service
+            pool_size: max number of connections kept open to the service
+    """
+
+    def __init__(self, base_url: str, headers: dict = None, auth: tuple = None, verify: bool = True, pool_size: int = 10):
+        self.base_url = str(base_url or "").rstrip("/")
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        self.session.auth = auth
+        self.session.verify = verify
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, endpoint: str) -> str:
+        # links handed back by the service are already full urls
+        if endpoint.startswith("http://") or endpoint.startswith("https://"):
+            return endpoint
+        return f"{self.base_url}{endpoint}"
+
+    def request(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        return self.session.request(method, self.url(endpoint), **kwargs)
+
+    def get(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("POST", endpoint, **kwargs)
+
+    def put(self, endpoint: str, **kwargs) -> requests.Response:
+        return self.request("PUT", endpoint, **kwargs)
+
+
+# the only change task fields the scheduler reads, everything else is left on the server
+CHANGE_TASK_FIELDS = [
+    "sys_id",
+    "number",
+    "task_effective_number",
+    "short_description",
+    "planned_start_date",
+    "planned_end_date",
+    "assigned_to",
+    "change_request",
+    # dot-walked so a standard change can be spotted without reading the parent change
+    "change_request.type",
+]
+
+# keywords that defines an action item, the change task query only returns tasks with one of them
+ACTION_KEYWORDS = ["DEPLOY", "RELEASE", "MANUAL", "SKIP"]
+
+# the parent change is only read to find out if it is a standard change
+PARENT_CHANGE_FIELDS = ["sys_id", "type"]
+
+# parent changes read during the run keyed by sys_id, many change tasks share the same parent
+_parent_changes = {}
+
+# change task updates waiting to be sent through the batch API, created on first use
+_change_task_writes = None
+
+# active change tasks of the run, read once and kept up to date as the run assigns them
+_change_task_snapshot = None
+
+
+# ServiceNow client shared by every helper for the lifetime of the run, created on first use
+_service_now_client = None
+
+
+def service_now_client() -> ServiceClient:
+    """Gets the ServiceNow client for the run, authenticated with the automation account from config"""
+    global _service_now_client
+
+    if _service_now_client is None:
+        _service_now_client = ServiceClient(
+            base_url=scheduler_config["BaseUrl"],
+            headers={"Accept": "application/json", "Content-Type": "application/json"},
+            auth=(
+                scheduler_config["ApiAuthentication"]["Username"],
+                scheduler_config["ApiAuthentication"]["Password"],
+            ),
+        )
+    return _service_now_client
+
+
 def unassign(snow_items: list) -> None:
     print("unassign function called")
     """Unassigns a task that has been assigned to the automation account
@@ -63,9 +160,14 @@ def unassign(snow_items: list) -> None:
         if snow_items:
             for snow_item in snow_items:
                 if ("PROCESSED" not in snow_item["short_description"]) and (
-                    is_a_standard_change(snow_item["short_description"], snow_item["change_request"]["link"]) == False
+                    is_a_standard_change(
+                    snow_item["short_description"], parent_change_link(snow_item), parent_change_type(snow_item)
+                ) == False
                 ):
-                    assign_snow_item(snow_item=snow_item, assign_to_queue=True)
+                    assign_snow_item(snow_item=snow_item, assign_to_queue=True, queue=change_task_writes())
+
+            # send the updates before the unassigned tasks are read so they are picked up this run
+            change_task_writes().flush()
         print("snow_list", snow_items)
     except Exception as e:
         log(f"Exception in unassign: {e}")
@@ -87,11 +189,8 @@ def action_item(snow_item: str) -> bool:
         if "IGNORE" in snow_item:
             return False
 
-        # keywords that defines an action item
-        keywords = ["DEPLOY", "RELEASE", "MANUAL", "SKIP"]
-
         # find keyword
-        for k in keywords:
+        for k in ACTION_KEYWORDS:
             if k in snow_item:
                 return True
 
@@ -99,53 +198,159 @@ def action_item(snow_item: str) -> bool:
     return False
 
 
-def retrieve_snow_items(endpoint: str, query_string: str) -> list:
+def fields_query(fields: list) -> str:
     """
-    Gets SNOW items from specified endpoint
+    Builds the query string that limits a ServiceNow response to the fields passed in,
+    reference fields come back as a plain sys_id instead of a link
+        Parameters:
+            fields: names of the fields to return
+    """
+    return f"&sysparm_fields={urllib.parse.quote(','.join(fields))}&sysparm_exclude_reference_link=true"
+
+
+def parent_change_id(snow_item: dict) -> str:
+    """
+    Gets the sys_id of the parent change of a change task
+        Parameters:
+            snow_item: change task from ServiceNow, change_request is either a reference link or a plain sys_id
+    """
+    change_request = snow_item.get("change_request") or ""
+    if isinstance(change_request, dict):
+        change_request = change_request.get("value") or link_sys_id(change_request.get("link", ""))
+    return change_request
+
+
+def link_sys_id(link: str) -> str:
+    # the sys_id is the last part of the path of a record link
+    return urllib.parse.urlparse(str(link)).path.rstrip("/").split("/")[-1]
+
+
+def parent_change_type(snow_item: dict) -> str:
+    """
+    Gets the type of the parent change dot-walked from a change task, None if it was not read with the task
+        Parameters:
+            snow_item: change task from ServiceNow
+    """
+    change_type = snow_item.get("change_request.type")
+    if isinstance(change_type, dict):
+        change_type = change_type.get("value")
+    return change_type
+
+
+
+def parent_change_link(snow_item: dict) -> str:
+    """
+    Builds the link to the parent change of a change task
+        Parameters:
+            snow_item: change task from ServiceNow, change_request is either a reference link or a plain sys_id
+    """
+    change_request = snow_item.get("change_request") or ""
+    if isinstance(change_request, dict):
+        if change_request.get("link"):
+            return change_request["link"]
+        change_request = change_request.get("value", "")
+
+    if not change_request:
+        return ""
+
+    return f"{scheduler_config['BaseUrl']}{scheduler_config.get('ChangeRequestEndpoint', '/api/now/table/change_request')}/{change_request}"
+
+
+def iter_snow_pages(endpoint: str, query_string: str, fields: list = None, page_size: int = None):
+    """
+    Yields pages of SNOW items from specified endpoint. Pages are read in sys_id order starting after
+    the last item of the previous page, so items that are updated while we go through them are not skipped
         Parameters:
             endpoint: ServiceNow API endpoint
-            query_string: query to return records from ServiceNOw
+            query_string: url encoded query to return records from ServiceNOw
+            fields: fields to return, must include sys_id, all fields are returned if not passed in
+            page_size: max number of items per page, SnowPageSize from config if not passed in
     """
+    page_size = page_size or int(scheduler_config.get("SnowPageSize", 200))
+    last_sys_id = ""
 
-    try:
-        results = requests.get(
-            url=f"{scheduler_config['BaseUrl']}{endpoint}{query_string}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
-        )
-    except Exception as e:
-        error_string = str(e)
-        log(error_string)
-        return []
+    while True:
+        page_query = f"sys_id>{last_sys_id}^ORDERBYsys_id" if last_sys_id else "ORDERBYsys_id"
+        if query_string:
+            page_query = f"^{page_query}"
 
-    if results.status_code == 200:
-        results = results.json()
-        print("results", results)
-        return results["result"]
-    else:
-        log(results.text)
-        return []
-    
+        try:
+            results = service_now_client().get(
+                f"{endpoint}{query_string}{urllib.parse.quote(page_query)}"
+                f"{fields_query(fields) if fields else ''}&sysparm_limit={page_size}"
+            )
+        except Exception as e:
+            error_string = str(e)
+            log(error_string)
+            return
+
+        if results.status_code != 200:
+            log(results.text)
+            return
+
+        items = results.json()["result"]
+        if items:
+            yield items
 
+        # X-Total-Count is the number of items left from this page on, when they all fit on this page we are done
+        remaining = int(results.headers.get("X-Total-Count", len(items) + 1))
+        if len(items) < page_size or len(items) >= remaining:
+            return
 
-def query_builder(assigned_to: bool) -> str:
+        last_sys_id = items[-1]["sys_id"]
+
+
+def iter_snow_items(endpoint: str, query_string: str, fields: list = None, page_size: int = None):
+    """
+    Yields SNOW items from specified endpoint, see iter_snow_pages
+        Parameters:
+            endpoint: ServiceNow API endpoint
+            query_string: url encoded query to return records from ServiceNOw
+            fields: fields to return, must include sys_id, all fields are returned if not passed in
+            page_size: max number of items per page, SnowPageSize from config if not passed in
+    """
+    for items in iter_snow_pages(endpoint=endpoint, query_string=query_string, fields=fields, page_size=page_size):
+        for item in items:
+            yield item
+
+
+def retrieve_snow_items(endpoint: str, query_string: str, fields: list = None) -> list:
+    """
+    Gets SNOW items from specified endpoint
+        Parameters:
+            endpoint: ServiceNow API endpoint
+            query_string: query to return records from ServiceNOw
+            fields: fields to return, all fields are returned if not passed in
+    """
+    results = list(iter_snow_items(endpoint=endpoint, query_string=query_string, fields=fields))
+    print("results", results)
+    return results
+
+
+def query_builder(assigned_to: bool = None) -> str:
     """
     Builds query string for querying all unassigned or assigned Change Tasks in ServiceNow
         Parameters:
-            assigned_to: Builds querystring for tasks that are assigned to automation account or query for unassigned tasks
+            assigned_to: Builds querystring for tasks that are assigned to automation account or query for unassigned tasks,
+                         if not passed in the query is for both
     """
 
     query = []
-    query.append(
-        f"assigned_to={scheduler_config['AutomationUserId']}"
-    ) if assigned_to else query.append("assigned_toISEMPTY")
+    if assigned_to is None:
+        query.append(f"assigned_toISEMPTY^ORassigned_to={scheduler_config['AutomationUserId']}")
+    else:
+        query.append(
+            f"assigned_to={scheduler_config['AutomationUserId']}"
+        ) if assigned_to else query.append("assigned_toISEMPTY")
     query.append("active=true")
     query.append(f"assignment_group={scheduler_config['ChsDevOpsSoftwareSolutionsId']}")
     query.append("planned_start_dateISNOTEMPTY")
     query.append("planned_end_dateISNOTEMPTY")
 
+    # tasks the scheduler does not act on are left on the server, action_item still checks every task it gets
+    query.append("short_descriptionNOT LIKEIGNORE")
+    query.append("^OR".join(f"short_descriptionLIKE{keyword}" for keyword in ACTION_KEYWORDS))
+
     # convert the query list to a string
     query_to_string = ""
     for q in query:
@@ -157,17 +362,19 @@ def query_builder(assigned_to: bool) -> str:
     return urllib.parse.quote(query_to_string.rstrip(query_to_string[-1]))
 
 
-def change_tasks(assigned_to: bool) -> list:
+def change_tasks(assigned_to: bool = None) -> list:
     """
     Gets all unassigned or assigned change tasks in ServiceNow assigned to the group identifier in config
         Parameters:
-            assigned_to: Query for tasks that are assigned to automation account or query for unassigned tasks
+            assigned_to: Query for tasks that are assigned to automation account or query for unassigned tasks,
+                         if not passed in both are returned
     """
 
     # get all unassigned change tasks
     change_tasks = retrieve_snow_items(
         endpoint=scheduler_config["QueryChangeTaskEndpoint"],
         query_string=query_builder(assigned_to=assigned_to),
+        fields=CHANGE_TASK_FIELDS,
     )
 
     # return all unassigned change tasks that do not have the ignore keywoard
@@ -178,19 +385,82 @@ def change_tasks(assigned_to: bool) -> list:
         if "IGNORE" not in str(task["short_description"]).upper()
     ]
 
+    # the parent changes of every task are read in as few requests as possible
+    prefetch_parent_changes(mod_changed_tasks)
+
     return mod_changed_tasks
 
 
-def set_processed(short_description: str, assign_to_queue: bool, parent_link: str) -> str:
+def assigned_to_id(snow_item: dict) -> str:
+    """
+    Gets the sys_id of the user a change task is assigned to, empty if it is not assigned
+        Parameters:
+            snow_item: change task from ServiceNow, assigned_to is either a reference link or a plain sys_id
+    """
+    assigned_to = snow_item.get("assigned_to") or ""
+    if isinstance(assigned_to, dict):
+        assigned_to = assigned_to.get("value", "")
+    return assigned_to
+
+
+def assigned_to_automation(snow_item: dict) -> bool:
+    """
+    Checks if a change task is assigned to the automation account
+        Parameters:
+            snow_item: change task from ServiceNow
+    """
+    return assigned_to_id(snow_item) == scheduler_config["AutomationUserId"]
+
+
+class ChangeTaskSnapshot:
+    """
+    Active change tasks of the assignment group that are either unassigned or assigned to the automation account.
+    They are read from ServiceNow once and split into assigned and unassigned tasks in memory, assign_snow_item
+    updates the tasks in place so each phase of the run sees what the phases before it did
+        Parameters:
+            snow_items: change tasks to start with, read from ServiceNow if not passed in
+    """
+
+    def __init__(self, snow_items: list = None):
+        self.snow_items = change_tasks() if snow_items is None else list(snow_items)
+
+    def __len__(self) -> int:
+        return len(self.snow_items)
+
+    def assigned(self) -> list:
+        """Change tasks assigned to the automation account"""
+        return [snow_item for snow_item in self.snow_items if assigned_to_automation(snow_item)]
+
+    def unassigned(self) -> list:
+        """Change tasks that are not assigned to anyone"""
+        return [snow_item for snow_item in self.snow_items if not assigned_to_id(snow_item)]
+
+
+def change_task_snapshot(refresh: bool = False) -> ChangeTaskSnapshot:
+    """
+    Gets the change task snapshot for the run, change tasks are only read from ServiceNow once
+        Parameters:
+            refresh: if set to true the change tasks are read again
+    """
+    global _change_task_snapshot
+
+    if refresh or _change_task_snapshot is None:
+        _change_task_snapshot = ChangeTaskSnapshot()
+
+    return _change_task_snapshot
+
+
+def set_processed(short_description: str, assign_to_queue: bool, parent_link: str, change_type: str = None) -> str:
     """Injects PROCESSED to the end of the short desciption in ServiceNow"
 
     Keyword arguments:
     short_description -- short description in ServiceNow
     assign_to_queue: bool
+    change_type -- type of the parent change if it was read with the change task
     Return: str
     """
 
-    if is_a_standard_change(short_description, parent_link) == False:
+    if is_a_standard_change(short_description, parent_link, change_type) == False:
         if assign_to_queue:
             # if its assigned to the queue we need to remove the PROCESSED from the title
             return short_description.replace(
@@ -202,12 +472,14 @@ def set_processed(short_description: str, assign_to_queue: bool, parent_link: st
             return f"{short_description.replace('PROCESSED','').rstrip()} PROCESSED"
 
 
-def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
+def assign_snow_item(snow_item: dict, assign_to_queue: bool, queue=None) -> bool:
     """
     Assigns ServiceNow item to service account
         Parameters:
             snow_item: response from ServiceNow
             assign_to_queue: if true it assigns the snow item back to the queue
+            queue: ChangeTaskWriteQueue to send the update with later, only for callers that do not
+                   check the result as it is always true until the queue is flushed
     """
     # we need to update the change task body
     json_body = {
@@ -221,28 +493,47 @@ def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
         "short_description": set_processed(
             short_description=snow_item["short_description"],
             assign_to_queue=assign_to_queue,
-            parent_link=snow_item["change_request"]["link"],
+            parent_link=parent_change_link(snow_item),
+            change_type=parent_change_type(snow_item),
         ),
     }
-    endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
 
     # You cannot update descriptions in task from standard changes
     # So we need to figure out if it is a standard change
-    if is_a_standard_change(snow_item["short_description"], snow_item["change_request"]["link"]):
+    if is_a_standard_change(
+        snow_item["short_description"], parent_change_link(snow_item), parent_change_type(snow_item)
+    ):
         json_body.pop("short_description")
 
+    # keep the task we hold in step with ServiceNow so the rest of the run does not have to read it again,
+    # a queued update is only applied once the flush saved it so a failed write does not count as assigned
+    if queue is not None:
+        queue.add(sys_id=snow_item["sys_id"], json_body=json_body, on_saved=lambda: snow_item.update(json_body))
+        return True
+
+    if not update_change_task(sys_id=snow_item["sys_id"], json_body=json_body):
+        return False
+
+    snow_item.update(json_body)
+    return True
+
+
+def update_change_task(sys_id: str, json_body: dict) -> bool:
+    """
+    Updates a change task in ServiceNow
+        Parameters:
+            sys_id: sys_id of the change task
+            json_body: fields to update
+    """
+    endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
+
     # update SNOW item
     try:
-        results = requests.put(
-            url=f"{scheduler_config['BaseUrl']}{endpoint}/{snow_item['sys_id']}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
-            data=json.dumps(json_body),
+        results = service_now_client().put(
+            f"{endpoint}/{sys_id}", data=json.dumps(json_body)
         )
     except Exception as e:
-        log(e.message)
+        log(str(e))
         return False
 
     # if the status code is not 200 then it failed
@@ -251,39 +542,193 @@ def assign_snow_item(snow_item: dict, assign_to_queue: bool) -> bool:
         return False
     else:
         return True
+
+
+class ChangeTaskWriteQueue:
+    """
+    Collects change task updates and sends them through the ServiceNow batch API,
+    SnowBatchSize updates per request. Updates the batch did not save are sent again on their own
+        Parameters:
+            batch_size: max number of updates per batch request, SnowBatchSize from config if not passed in
+    """
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or int(scheduler_config.get("SnowBatchSize", 25))
+        self.updates = {}
+        self.callbacks = {}
+
+        # items are scheduled on several threads that all add to the same queue
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.updates)
+
+    def add(self, sys_id: str, json_body: dict, on_saved=None) -> None:
+        """
+        Queues an update of a change task
+            Parameters:
+                sys_id: sys_id of the change task
+                json_body: fields to update
+                on_saved: called once the flush has saved the update, not called if it failed
+        """
+        # a later update of the same change task wins, the same as sending them one after the other
+        with self.lock:
+            self.updates.setdefault(sys_id, {}).update(json_body)
+            if on_saved is not None:
+                self.callbacks.setdefault(sys_id, []).append(on_saved)
+
+    def flush(self) -> dict:
+        """
+        Sends every queued update
+            Returns:
+                dict: sys_id of each change task and true if the update was saved
+        """
+        with self.lock:
+            updates, self.updates = self.updates, {}
+            callbacks, self.callbacks = self.callbacks, {}
+        items = list(updates.items())
+
+        results = {}
+        for i in range(0, len(items), self.batch_size):
+            results.update(self.send_batch(items[i : i + self.batch_size]))
+
+        for sys_id, saved in results.items():
+            if not saved:
+                results[sys_id] = update_change_task(sys_id=sys_id, json_body=updates[sys_id])
+
+        for sys_id, saved in results.items():
+            if saved:
+                for on_saved in callbacks.get(sys_id, []):
+                    on_saved()
+
+        return results
+
+    def send_batch(self, chunk: list) -> dict:
+        """
+        Sends one batch request, every update in it is a PUT on the change task
+            Parameters:
+                chunk: list of sys_id and fields to update
+        """
+        endpoint = scheduler_config["UpdateChangeTaskEndpoint"]
+        rest_requests = [
+            {
+                "id": str(n),
+                "method": "PUT",
+                "url": f"{endpoint}/{sys_id}",
+                "headers": [
+                    {"name": "Content-Type", "value": "application/json"},
+                    {"name": "Accept", "value": "application/json"},
+                ],
+                # the batch API wants every body base64 encoded
+                "body": base64.b64encode(json.dumps(json_body).encode()).decode(),
+            }
+            for n, (sys_id, json_body) in enumerate(chunk)
+        ]
+
+        results = {sys_id: False for sys_id, _ in chunk}
+        try:
+            response = service_now_client().post(
+                scheduler_config.get("BatchEndpoint", "/api/now/v1/batch"),
+                data=json.dumps({"batch_request_id": str(uuid.uuid4()), "rest_requests": rest_requests}),
+            )
+        except Exception as e:
+            log(str(e))
+            return results
+
+        if response.status_code != 200:
+            log(response.text)
+            return results
+
+        # map each result back to its change task, requests that were not serviced stay false
+        for serviced in response.json().get("serviced_requests", []):
+            sys_id = chunk[int(serviced["id"])][0]
+            if serviced.get("status_code") == 200:
+                results[sys_id] = True
+            else:
+                log(f"Batch update of change task {sys_id} returned {serviced.get('status_code')}")
+
+        return results
+
+
+def change_task_writes() -> ChangeTaskWriteQueue:
+    """Gets the change task write queue for the run"""
+    global _change_task_writes
+
+    if _change_task_writes is None:
+        _change_task_writes = ChangeTaskWriteQueue()
+    return _change_task_writes
     
-def is_a_standard_change(short_description: str, parent_link: str) -> bool:
+def is_a_standard_change(short_description: str, parent_link: str, change_type: str = None) -> bool:
     """Verifies if a project is a standard change
         by checking the short description for SSIS and that the parent change is a type=standard
     Args:
         short_description (str): Short description from ServiceNow
-        parent_link (srt): comes from change_request.link in CTASK json
+        parent_link (srt): link to the parent change, see parent_change_link()
+        change_type (str): type of the parent change if it was read with the change task,
+            the parent change is only read when this is not passed in
 
     Returns:
         bool: true or false
     """
-    found = False
-    chg_record = retrieve_parent_change(parent_link)
-    if re.search(r"(ssis)", short_description, re.IGNORECASE):
-        if chg_record["type"] == "standard":
-            found = True
+    # only SSIS tasks can be standard changes, so the parent change is not needed for anything else
+    if not re.search(r"(ssis)", short_description, re.IGNORECASE):
+        return False
+
+    if change_type is None:
+        change_type = retrieve_parent_change(parent_link)["type"]
+
+    return change_type == "standard"
+
+def prefetch_parent_changes(snow_items: list) -> None:
+    """
+    Reads the parent changes of a batch of change tasks with one sys_idIN query per page
+    and keeps them for retrieve_parent_change
+        Parameters:
+            snow_items: change tasks from ServiceNow
+    """
+    missing = list(
+        dict.fromkeys(
+            sys_id
+            for sys_id in (
+                parent_change_id(snow_item)
+                for snow_item in snow_items
+                # only SSIS tasks without a dot-walked change type need their parent change
+                if parent_change_type(snow_item) is None
+                and re.search(r"(ssis)", str(snow_item["short_description"]), re.IGNORECASE)
+            )
+            if sys_id and sys_id not in _parent_changes
+        )
+    )
+
+    # sys_ids are 32 characters, keep the query string well under the url length limits
+    page_size = min(int(scheduler_config.get("SnowPageSize", 200)), 100)
+    for i in range(0, len(missing), page_size):
+        for change in iter_snow_items(
+            endpoint=f"{scheduler_config.get('ChangeRequestEndpoint', '/api/now/table/change_request')}?sysparm_query=",
+            query_string=urllib.parse.quote(f"sys_idIN{','.join(missing[i : i + page_size])}"),
+            fields=PARENT_CHANGE_FIELDS,
+            page_size=page_size,
+        ):
+            _parent_changes[change["sys_id"]] = change
 
-    return found
 
 def retrieve_parent_change(parent_link: str) -> list:
     """
-    Gets parent change from link in CTASK 
+    Gets parent change from link in CTASK, each parent change is only read once per run
         Parameters:
-            parent_link: change_request.link in CTASK json
+            parent_link: link to the parent change, see parent_change_link()
     """
+    sys_id = link_sys_id(parent_link)
+    if sys_id in _parent_changes:
+        return _parent_changes[sys_id]
 
     try:
-        change = requests.get(
-            url=f"{parent_link}",
-            auth=(
-                scheduler_config["ApiAuthentication"]["Username"],
-                scheduler_config["ApiAuthentication"]["Password"],
-            ),
+        change = service_now_client().get(
+            f"{parent_link}",
+            params={
+                "sysparm_fields": ",".join(PARENT_CHANGE_FIELDS),
+                "sysparm_exclude_reference_link": "true",
+            },
         )
     except Exception as e:
         error_string = str(e)
@@ -292,15 +737,8 @@ def retrieve_parent_change(parent_link: str) -> list:
 
     if change.status_code == 200:
         change = change.json()
+        _parent_changes[sys_id] = change["result"]
         return change["result"]
     else:
         log(change.text)
         return []
-
-
-print("Calling unassign tasks")
-unassign(change_tasks)
-
-print("Calling change tasks")
-tasks = change_tasks(assigned_to=False)
-print("unassigned tasks", tasks)
@@ -0,0 +1,189 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from pytz import utc
+from cmadevops_deployment_scheduler.config.config import scheduler_config
+from cmadevops_deployment_scheduler.modules.logwrite import log
+from cmadevops_deployment_scheduler.modules.local_state import state_path
+from cmadevops_deployment_scheduler.modules.clients import dry_run_enabled
+from cmadevops_deployment_scheduler.modules.service_now import assigned_to_id
+
+# outcomes that only change when someone edits the change task, an unchanged task is not looked at again
+SETTLED_OUTCOMES = {"MANUAL"}
+
+# outcomes that can also change in Octopus Deploy, such as a release that is created or promoted later.
+# An unchanged task is looked at again once TaskStoreRecheckMinutes have passed since it was last checked, less
+# TaskStoreRecheckMarginMinutes so the run one cron interval later rechecks it even if it started a little early
+RECHECK_OUTCOMES = {"NO_RELEASE", "NO_PROJECT", "RELEASE_NOT_FOUND", "NOT_PROMOTABLE"}
+
+# task store shared by every worker for the lifetime of the run
+_task_store = None
+_task_store_lock = threading.Lock()
+
+
+def title_key(short_description: str) -> str:
+    """
+    Title of a ServiceNow item without the PROCESSED marker we add and remove, in upper case
+        Parameters:
+            short_description: short description of Change Task in ServiceNow
+    """
+    return " ".join(str(short_description).replace("PROCESSED", "").split()).upper()
+
+
+class TaskStore:
+    """
+    Outcome of every change task the scheduler looked at, kept in SQLite between runs and indexed by sys_id
+        Parameters:
+            path: path of the database, TaskStoreFile in the state directory if not passed in
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or state_path(scheduler_config.get("TaskStoreFile", "change_tasks.sqlite3"))
+        self.connection = None
+
+        # items are scheduled on several threads that all share one connection
+        self.lock = threading.Lock()
+
+        try:
+            if dry_run_enabled():
+                # a dry run reads what the last real run saved and never creates or changes the database
+                if not os.path.exists(self.path):
+                    return
+                self.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.connection = sqlite3.connect(self.path, check_same_thread=False)
+                with self.connection:
+                    self.connection.execute(
+                        "CREATE TABLE IF NOT EXISTS change_tasks ("
+                        "sys_id TEXT PRIMARY KEY, "
+                        "sys_updated_on TEXT, "
+                        "title TEXT, "
+                        "planned_start_date TEXT, "
+                        "project_id TEXT, "
+                        "project_name TEXT, "
+                        "release_number TEXT, "
+                        "deployment_id TEXT, "
+                        "outcome TEXT, "
+                        "checked_on TEXT)"
+                    )
+            self.connection.row_factory = sqlite3.Row
+        except Exception as e:
+            # without the store every item is looked at, the same as before there was one
+            log(f"Unable to open task store {self.path}: {e}\n")
+            self.connection = None
+
+    def get(self, sys_id: str) -> dict:
+        """
+        Gets what the store holds for a change task, None if it was never recorded
+            Parameters:
+                sys_id: sys_id of the change task
+        """
+        if self.connection is None:
+            return None
+
+        try:
+            with self.lock:
+                row = self.connection.execute("SELECT * FROM change_tasks WHERE sys_id = ?", (sys_id,)).fetchone()
+        except Exception as e:
+            log(f"Unable to read task store {self.path}: {e}\n")
+            return None
+        return dict(row) if row else None
+
+    def skippable(self, snow_item: dict) -> bool:
+        """
+        Checks if a change task in the queue can be left alone because it has not changed since it last failed
+        for a reason only an edit can fix, see SETTLED_OUTCOMES and RECHECK_OUTCOMES
+            Parameters:
+                snow_item: item from ServiceNow
+        """
+        # assigned tasks are handled by unassign and authorize_deployments
+        if assigned_to_id(snow_item):
+            return False
+
+        row = self.get(snow_item["sys_id"])
+        if row is None:
+            return False
+
+        # our own updates change sys_updated_on as well, so the task is compared on the fields a person edits
+        if row["title"] != title_key(snow_item["short_description"]) or row["planned_start_date"] != snow_item.get(
+            "planned_start_date", ""
+        ):
+            return False
+
+        if row["outcome"] in SETTLED_OUTCOMES:
+            return True
+        if row["outcome"] in RECHECK_OUTCOMES:
+            # checked_on is when the item was looked at during the last run, which is later than that run started
+            recheck = timedelta(
+                minutes=int(scheduler_config.get("TaskStoreRecheckMinutes", 60))
+                - int(scheduler_config.get("TaskStoreRecheckMarginMinutes", 10))
+            )
+            return datetime.now(utc) - datetime.fromisoformat(row["checked_on"]) < recheck
+        return False
+
+    def record(self, plan: dict, outcome: str, deployment_id: str = "") -> None:
+        """
+        Saves the outcome of a planned ServiceNow item
+            Parameters:
+                plan: ServiceNow item planned by plan_item
+                outcome: what happened to the item, such as SCHEDULED or RELEASE_NOT_FOUND
+                deployment_id: Id of the deployment scheduled for the item
+        """
+        if self.connection is None or dry_run_enabled():
+            return
+
+        snow_item = plan["snow_item"]
+        try:
+            with self.lock, self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO change_tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        snow_item["sys_id"],
+                        snow_item.get("sys_updated_on", ""),
+                        title_key(snow_item["short_description"]),
+                        snow_item.get("planned_start_date", ""),
+                        plan["project_id"],
+                        plan["project_name"],
+                        plan["release_number"],
+                        deployment_id,
+                        outcome,
+                        datetime.now(utc).isoformat(),
+                    ),
+                )
+        except Exception as e:
+            log(f"Unable to save change task {snow_item['sys_id']} to task store {self.path}: {e}\n")
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def task_store() -> TaskStore:
+    """Gets the task store for the run"""
+    global _task_store
+
+    with _task_store_lock:
+        if _task_store is None:
+            _task_store = TaskStore()
+    return _task_store
+
+
+def changed_items(snow_items):
+    """
+    Leaves out the change tasks in the queue the task store can skip, see TaskStore.skippable
+        Parameters:
+            snow_items: JSON response from ServiceNow, or any iterable of items
+    """
+    store = task_store()
+    skipped = 0
+    for snow_item in snow_items:
+        if store.skippable(snow_item):
+            skipped += 1
+            continue
+        yield snow_item
+
+    if skipped:
+        log(f"{skipped} unchanged change tasks skipped, see task store {store.path}\n")
@@ -0,0 +1,121 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import types
+
+# the scheduler modules are deployed as the cmadevops_deployment_scheduler.modules package, the tests load them
+# from the repository under that name with a config of their own and stubbed clients instead of the services
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_DIRECTORY = tempfile.mkdtemp(prefix="scheduler_tests_")
+
+CONFIG = {
+    "BaseUrl": "https://snow.example.com",
+    "QueryChangeTaskEndpoint": "/api/now/table/change_task?sysparm_query=",
+    "UpdateChangeTaskEndpoint": "/api/now/table/change_task",
+    "ChsDevOpsSoftwareSolutionsId": "group",
+    "AutomationUserId": "automation",
+    "OctopusDeployApiKey": "API-KEY",
+    "OctopusDeployBaseUrl": "https://octopus.example.com",
+    "ReleaseEndpoint": "/api/releases",
+    "TasksEndpoint": "/api/tasks",
+    "DeploymentsEndpoint": "/api/deployments",
+    "ProjectsEndpoint": "/api/projects",
+    "ApiAuthentication": {"Username": "user", "Password": "password"},
+    "ProductionEnvironmentId": "Environments-1",
+    "WebexUrl": "https://webex.example.com/v1/messages",
+    "WebexRoom": "room",
+    "Bearer": "token",
+    "StateDirectory": STATE_DIRECTORY,
+}
+
+# every message the modules log
+LOG = []
+
+
+def install() -> None:
+    """Registers the package and its config so the scheduler modules can be imported"""
+    if "cmadevops_deployment_scheduler.modules" in sys.modules:
+        return
+
+    package = types.ModuleType("cmadevops_deployment_scheduler")
+    package.__path__ = []
+    config_package = types.ModuleType("cmadevops_deployment_scheduler.config")
+    config_package.__path__ = []
+    config = types.ModuleType("cmadevops_deployment_scheduler.config.config")
+    config.scheduler_config = CONFIG
+    modules = types.ModuleType("cmadevops_deployment_scheduler.modules")
+    modules.__path__ = [REPO]
+    logwrite = types.ModuleType("cmadevops_deployment_scheduler.modules.logwrite")
+    logwrite.log = LOG.append
+
+    package.config, package.modules = config_package, modules
+    config_package.config = config
+    modules.logwrite = logwrite
+    for module in (package, config_package, config, modules, logwrite):
+        sys.modules[module.__name__] = module
+
+
+install()
+
+from cmadevops_deployment_scheduler.modules import clients  # noqa: E402
+
+
+class StubClient:
+    """
+    Answers calls from routes instead of a service, every call is kept in calls
+        Parameters:
+            routes: list of method, endpoint pattern and handler, the handler gets the endpoint and the
+                    keyword arguments of the call and returns the status code and json body of the response
+    """
+
+    def __init__(self, routes: list = None):
+        self.routes = list(routes or [])
+        self.calls = []
+
+    def request(self, method: str, endpoint: str, **kwargs):
+        self.calls.append((method, endpoint, kwargs))
+        for route_method, pattern, handler in self.routes:
+            if route_method == method and re.search(pattern, endpoint):
+                status_code, body = handler(endpoint, kwargs)
+                return clients.fake_response(status_code, body)
+        return clients.fake_response(404, {"ErrorMessage": f"no route for {method} {endpoint}"})
+
+    def get(self, endpoint: str, **kwargs):
+        return self.request("GET", endpoint, **kwargs)
+
+    def post(self, endpoint: str, **kwargs):
+        return self.request("POST", endpoint, **kwargs)
+
+    def put(self, endpoint: str, **kwargs):
+        return self.request("PUT", endpoint, **kwargs)
+
+
+def use_clients(octopus: StubClient = None, service_now: StubClient = None, webex: StubClient = None) -> None:
+    """Hands the stubs to every module in place of the clients of the run"""
+    clients._octopus_client = octopus or StubClient()
+    clients._service_now_client = service_now or StubClient()
+    clients._webex_client = webex or StubClient()
+
+
+def reset() -> None:
+    """Forgets everything a run keeps, in memory and on disk, so every test starts like a new process"""
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("cmadevops_deployment_scheduler.modules.") or module is None:
+            continue
+        if getattr(module, "_task_store", None) is not None:
+            module._task_store.close()
+        for state in (
+            "_project_catalog", "_release_index", "_release_index_changed", "_task_index", "_change_task_snapshot",
+            "_change_task_writes", "_task_store", "_call_report", "_octopus_client", "_service_now_client", "_webex_client",
+        ):
+            if hasattr(module, state):
+                setattr(module, state, None)
+        for cache in ("_release_cache", "_progression_cache", "_parent_changes", "_release_index_synced"):
+            if isinstance(getattr(module, cache, None), (dict, set)):
+                getattr(module, cache).clear()
+
+    clients.enable_dry_run(False)
+    shutil.rmtree(STATE_DIRECTORY, ignore_errors=True)
+    del LOG[:]
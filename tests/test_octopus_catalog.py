@@ -0,0 +1,87 @@
+import unittest
+
+from tests.scheduler_stubs import install
+
+install()
+
+from cmadevops_deployment_scheduler.modules.octopus_catalog import ProjectCatalog, ProjectMatcher  # noqa: E402
+
+PROJECTS = [
+    {"Id": "Projects-1", "Name": "Billing", "Slug": "billing"},
+    {"Id": "Projects-2", "Name": "Billing API", "Slug": "billing-api"},
+    {"Id": "Projects-3", "Name": "Portal2", "Slug": "portal2"},
+    {"Id": "Projects-4", "Name": "DataSync", "Slug": "datasync"},
+    {"Id": "Projects-5", "Name": "Claims Service", "Slug": "claims-service"},
+]
+
+
+class TestProjectMatcher(unittest.TestCase):
+    def test_find_all_returns_every_name_with_its_position(self):
+        matcher = ProjectMatcher(["BILLING", "BILLING API", "API"])
+        found = sorted(matcher.find_all("DEPLOY BILLING API 1.0"))
+        self.assertEqual(found, [(7, 14, "BILLING"), (7, 18, "BILLING API"), (15, 18, "API")])
+
+    def test_find_all_follows_failure_links(self):
+        matcher = ProjectMatcher(["ABCD", "BC"])
+        self.assertEqual(list(matcher.find_all("XABCX")), [(2, 4, "BC")])
+
+    def test_empty_names_are_ignored(self):
+        matcher = ProjectMatcher(["", "APP"])
+        self.assertEqual(list(matcher.find_all("APP")), [(0, 3, "APP")])
+
+
+class TestProjectCatalog(unittest.TestCase):
+    def setUp(self):
+        self.catalog = ProjectCatalog(PROJECTS)
+
+    def test_get_by_name_slug_or_id(self):
+        self.assertEqual(self.catalog.get("billing api")["Id"], "Projects-2")
+        self.assertEqual(self.catalog.get("claims-service")["Id"], "Projects-5")
+        self.assertEqual(self.catalog.get("projects-4")["Name"], "DataSync")
+        self.assertEqual(self.catalog.get("missing"), {})
+
+    def test_match_prefers_the_longest_name(self):
+        project, start, end = self.catalog.match("Deploy Billing API 2024.1.3")
+        self.assertEqual(project["Name"], "Billing API")
+        self.assertEqual((start, end), (7, 18))
+
+    def test_match_skips_names_inside_bigger_words(self):
+        self.assertIsNone(self.catalog.match("Deploy Rebilling 1.0"))
+        self.assertEqual(self.catalog.match("Deploy billing 1.0")[0]["Name"], "Billing")
+
+    def test_match_without_a_project(self):
+        self.assertIsNone(self.catalog.match("Deploy Payments 1.0"))
+        self.assertIsNone(self.catalog.match(""))
+
+    def test_suggest_ranks_the_closest_name_first(self):
+        suggestions = self.catalog.suggest("Deploy Claims Servce 3.2")
+        score, project, name_text = suggestions[0]
+        self.assertEqual(project["Name"], "Claims Service")
+        self.assertEqual(name_text, "Claims Servce")
+        self.assertGreater(score, 0.9)
+
+    def test_suggest_keeps_numbers_that_are_part_of_a_name(self):
+        catalog = ProjectCatalog(
+            PROJECTS
+            + [
+                {"Id": "Projects-6", "Name": "Billing API 2", "Slug": "billing-api-2"},
+                {"Id": "Projects-7", "Name": "ETL 10", "Slug": "etl-10"},
+                {"Id": "Projects-8", "Name": "ETL 11", "Slug": "etl-11"},
+            ]
+        )
+
+        score, project, name_text = catalog.suggest("Deploy Biling API 2 1.0.4")[0]
+        self.assertEqual((project["Name"], name_text), ("Billing API 2", "Biling API 2"))
+        score, project, name_text = catalog.suggest("Deploy ETLL 10 2024.3.1")[0]
+        self.assertEqual((project["Name"], name_text), ("ETL 10", "ETLL 10"))
+
+        # the release number is still left out
+        self.assertEqual(catalog.suggest("Deploy Biling API 1.0.4")[0][1]["Name"], "Billing API")
+
+    def test_suggest_limits_the_suggestions(self):
+        self.assertLessEqual(len(self.catalog.suggest("Deploy Biling Portal DataSink", limit=2)), 2)
+        self.assertEqual(self.catalog.suggest(""), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+import unittest
+
+from tests.scheduler_stubs import StubClient, install, reset, use_clients
+
+install()
+
+from cmadevops_deployment_scheduler.modules import octopus_deploy  # noqa: E402
+from cmadevops_deployment_scheduler.modules.local_state import state_path, load_state, save_state  # noqa: E402
+from cmadevops_deployment_scheduler.modules.octopus_catalog import ProjectCatalog  # noqa: E402
+
+PROJECTS = [
+    {"Id": "Projects-1", "Name": "Billing API", "Slug": "billing-api"},
+    {"Id": "Projects-2", "Name": "Portal2", "Slug": "portal2"},
+    {"Id": "Projects-3", "Name": "DataSync", "Slug": "datasync"},
+    {"Id": "Projects-4", "Name": "Claims Service", "Slug": "claims-service"},
+]
+
+
+class TestClosestProject(unittest.TestCase):
+    def setUp(self):
+        reset()
+        use_clients()
+        self.catalog = ProjectCatalog(PROJECTS)
+
+    def closest(self, short_description: str) -> tuple:
+        project, name_text = octopus_deploy.closest_project(short_description, catalog=self.catalog)
+        return project.get("Name", ""), name_text
+
+    def test_other_separators_and_case_are_resolved(self):
+        self.assertEqual(self.closest("Deploy Billing-API 1.0.4"), ("Billing API", "Billing-API"))
+        self.assertEqual(self.closest("Deploy billingapi 1.0.4"), ("Billing API", "billingapi"))
+        self.assertEqual(self.closest("Deploy Claims_Service 3.2"), ("Claims Service", "Claims_Service"))
+        self.assertEqual(self.closest("Deploy Portal 2 3.1"), ("Portal2", "Portal 2"))
+
+    def test_other_numbers_are_not_resolved(self):
+        self.assertEqual(self.closest("Deploy Portal3 3.1"), ("", ""))
+        self.assertEqual(self.closest("Deploy DataSync2 5.0"), ("", ""))
+
+    def test_a_release_number_is_never_part_of_the_name(self):
+        self.assertEqual(self.closest("Deploy Portal 1.0"), ("", ""))
+        self.assertEqual(self.closest("Deploy Portal 2.1"), ("", ""))
+
+    def test_misspelled_names_are_only_suggested(self):
+        self.assertEqual(self.closest("Deploy Claims Servce 3.2"), ("", ""))
+        self.assertEqual(self.catalog.suggest("Deploy Claims Servce 3.2")[0][1]["Name"], "Claims Service")
+
+    def test_resolve_title(self):
+        self.assertEqual(
+            octopus_deploy.resolve_title("Deploy Billing-API 2024.1.3", catalog=self.catalog), ("Billing API", "2024.1.3")
+        )
+        self.assertEqual(octopus_deploy.resolve_title("Deploy Portal2 3.1", catalog=self.catalog), ("Portal2", "3.1"))
+        self.assertEqual(octopus_deploy.resolve_title("Deploy Portal3 3.1", catalog=self.catalog)[0], "")
+
+
+class TestSyncProjects(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.octopus = StubClient(
+            [
+                (
+                    "GET",
+                    r"/api/events$",
+                    lambda endpoint, kwargs: (
+                        200,
+                        {"Items": [{"Category": "Created", "RelatedDocumentIds": ["Projects-9"]}], "Links": {}},
+                    ),
+                ),
+                ("GET", r"/api/projects/Projects-9$", lambda endpoint, kwargs: (200, {"Id": "Projects-9", "Name": "Payments"})),
+            ]
+        )
+        use_clients(octopus=self.octopus)
+        save_state(
+            state_path("project_catalog.json"),
+            {"LastSyncedOn": "2024-05-01T12:00:00+00:00", "RunsSinceFullSync": 3, "Projects": PROJECTS},
+        )
+
+    def test_events_are_read_from_before_the_last_sync(self):
+        od_projects = octopus_deploy.sync_projects()
+
+        method, endpoint, kwargs = self.octopus.calls[0]
+        self.assertEqual(endpoint, "/api/events")
+        self.assertEqual(kwargs["params"]["from"], "2024-05-01T11:55:00+00:00")
+        self.assertIn("Payments", [p["Name"] for p in od_projects])
+        self.assertEqual(len(od_projects), len(PROJECTS) + 1)
+
+
+def release(version: str) -> dict:
+    return {"Id": f"Releases-{version}", "Version": version, "ProjectId": "Projects-1", "ChannelId": "Channels-1"}
+
+
+class TestReleaseIndex(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.events = []
+        # the release list is missing 2.0, it was created after the list was read
+        self.octopus = StubClient(
+            [
+                ("GET", r"/api/events$", lambda endpoint, kwargs: (200, {"Items": self.events, "Links": {}})),
+                ("GET", r"/releases$", lambda endpoint, kwargs: (200, {"Items": [release("1.1"), release("1.0")], "Links": {}})),
+                ("GET", r"/releases/2\.0$", lambda endpoint, kwargs: (200, release("2.0"))),
+            ]
+        )
+        use_clients(octopus=self.octopus)
+
+    def save_index(self) -> None:
+        save_state(
+            state_path("release_index.json"),
+            {
+                "LastSyncedOn": "2024-05-01T12:00:00+00:00",
+                "Projects": {"Projects-1": {"1.0": octopus_deploy.compact_release(release("1.0"))}},
+            },
+        )
+
+    def release_reads(self) -> list:
+        return [kwargs["params"] for method, endpoint, kwargs in self.octopus.calls if endpoint.endswith("/releases")]
+
+    def test_a_known_project_is_read_with_a_small_first_page(self):
+        self.save_index()
+
+        releases = octopus_deploy.sync_releases("Projects-1")
+
+        self.assertEqual(sorted(releases), ["1.0", "1.1"])
+        self.assertEqual(self.release_reads(), [{"take": 5}])
+
+    def test_a_new_project_is_read_in_full(self):
+        octopus_deploy.sync_releases("Projects-1")
+
+        self.assertEqual(self.release_reads(), [{"take": 100}])
+        self.assertFalse([call for call in self.octopus.calls if call[1] == "/api/events"])
+
+    def test_modified_and_deleted_releases_are_dropped(self):
+        self.save_index()
+        self.events = [{"Category": "Modified", "RelatedDocumentIds": ["Releases-1.0", "Projects-1"]}]
+
+        releases = octopus_deploy.sync_releases("Projects-1")
+
+        method, endpoint, kwargs = self.octopus.calls[0]
+        self.assertEqual(endpoint, "/api/events")
+        self.assertEqual(kwargs["params"]["documentTypes"], "Releases")
+        self.assertEqual(kwargs["params"]["from"], "2024-05-01T11:55:00+00:00")
+        # 1.0 is read again as it is no longer known, the whole first page is new
+        self.assertEqual(sorted(releases), ["1.0", "1.1"])
+
+    def test_the_index_is_saved_once_at_the_end_of_the_run(self):
+        self.save_index()
+
+        found = octopus_deploy.find_release(release_number="2.0", project_id="Projects-1")
+        self.assertEqual(found["Id"], "Releases-2.0")
+        self.assertEqual(sorted(load_state(state_path("release_index.json"))["Projects"]["Projects-1"]), ["1.0"])
+
+        octopus_deploy.save_release_index()
+
+        index = load_state(state_path("release_index.json"))
+        self.assertEqual(sorted(index["Projects"]["Projects-1"]), ["1.0", "1.1", "2.0"])
+        self.assertNotEqual(index["LastSyncedOn"], "2024-05-01T12:00:00+00:00")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import json
+import unittest
+
+from tests.scheduler_stubs import StubClient, install, reset, use_clients
+
+install()
+
+from cmadevops_deployment_scheduler.modules import reconciler  # noqa: E402
+from cmadevops_deployment_scheduler.modules.octopus_catalog import ProjectCatalog  # noqa: E402
+from cmadevops_deployment_scheduler.modules.task_store import task_store  # noqa: E402
+
+PROJECTS = [
+    {"Id": "Projects-1", "Name": "Billing", "Slug": "billing"},
+    {"Id": "Projects-2", "Name": "Claims", "Slug": "claims"},
+]
+
+
+def snow_item(number: int, short_description: str, assigned_to: str = "") -> dict:
+    return {
+        "sys_id": f"sys{number}",
+        "task_effective_number": f"CTASK{number}",
+        "short_description": short_description,
+        "planned_start_date": "2030-01-01 15:00:00",
+        "planned_end_date": "2030-01-01 16:00:00",
+        "assigned_to": assigned_to,
+        "change_request": "c" * 32,
+        "change_request.type": "normal",
+        "sys_updated_on": "2024-01-01 00:00:00",
+    }
+
+
+def release(project_id: str, version: str) -> dict:
+    return {"Id": f"Releases-{version}", "Version": version, "ProjectId": project_id, "ChannelId": "Channels-1"}
+
+
+def deployment(number: int, description: str) -> dict:
+    return {
+        "Id": f"ServerTasks-{number}",
+        "State": "Queued",
+        "Description": description,
+        "QueueTime": "2030-01-01T15:00:00.000+0000",
+    }
+
+
+def snapshot(snow_items: list, planned: list, deployments: list = (), queued: set = ()) -> dict:
+    """Snapshot as take_snapshot returns it, every release of the planned items is found and promotable"""
+    catalog = ProjectCatalog(PROJECTS)
+    plans = [reconciler.plan_item(snow_item=item, catalog=catalog) for item in planned]
+    releases = {
+        (plan["project_id"], plan["release_number"]): release(plan["project_id"], plan["release_number"])
+        for plan in plans
+        if plan["project_id"]
+    }
+    return {
+        "snow_items": snow_items,
+        "plans": plans,
+        "catalog": catalog,
+        "queued": set(queued),
+        "deployments": list(deployments),
+        "releases": releases,
+        "promotions": {str(details["Id"]): True for details in releases.values()},
+        "standard": set(),
+    }
+
+
+def by_id(actions: list) -> dict:
+    return {action["id"]: action for action in actions}
+
+
+class TestPlanChanges(unittest.TestCase):
+    def setUp(self):
+        reset()
+        use_clients()
+
+    def test_an_item_is_only_assigned_after_its_deployment_is_scheduled(self):
+        item = snow_item(1, "Deploy Billing 1.0.1")
+
+        actions = by_id(reconciler.plan_changes(snapshot([item], planned=[item])))
+
+        self.assertEqual(list(actions), ["schedule-sys1", "assign-sys1", "record-sys1", "notify-sys1"])
+        self.assertEqual(actions["schedule-sys1"]["deployment_resource"]["ReleaseId"], "Releases-1.0.1")
+        self.assertEqual(actions["assign-sys1"]["after"], "schedule-sys1")
+        self.assertEqual(actions["record-sys1"]["outcome"], "SCHEDULED")
+        self.assertEqual(actions["record-sys1"]["failed_outcome"], "SCHEDULE_FAILED")
+        self.assertEqual(actions["record-sys1"]["outcome_of"], "schedule-sys1")
+        self.assertEqual(actions["record-sys1"]["deployment_of"], "schedule-sys1")
+        self.assertEqual(actions["notify-sys1"]["outcome_of"], "schedule-sys1")
+
+    def test_an_assigned_item_goes_back_to_the_queue_unless_it_is_scheduled(self):
+        item = snow_item(2, "Deploy Billing 1.0.2", assigned_to="automation")
+
+        actions = by_id(reconciler.plan_changes(snapshot([item], planned=[item])))
+
+        self.assertEqual(actions["assign-sys2"]["after"], "schedule-sys2")
+        self.assertEqual(actions["requeue-sys2"]["unless"], "schedule-sys2")
+        self.assertNotIn("after", actions["requeue-sys2"])
+
+    def test_an_item_of_a_queued_release_is_assigned_without_scheduling(self):
+        item = snow_item(3, "Deploy Billing 1.0.3")
+
+        actions = by_id(reconciler.plan_changes(snapshot([item], planned=[item], queued={("Billing", "1.0.3")})))
+
+        self.assertNotIn("schedule-sys3", actions)
+        self.assertIsNone(actions["assign-sys3"]["after"])
+        self.assertEqual(actions["record-sys3"]["outcome"], "ALREADY_SCHEDULED")
+        self.assertEqual(actions["record-sys3"]["outcome_of"], "assign-sys3")
+
+    def test_items_that_fail_a_check_are_only_recorded_and_notified(self):
+        item = snow_item(4, "Deploy Payments 1.0.4")
+
+        actions = by_id(reconciler.plan_changes(snapshot([item], planned=[item])))
+
+        self.assertEqual(list(actions), ["record-sys4", "notify-sys4"])
+        self.assertEqual(actions["record-sys4"]["outcome"], "NO_PROJECT")
+        self.assertIsNone(actions["record-sys4"]["outcome_of"])
+
+    def test_a_deployment_without_a_change_task_is_cancelled(self):
+        processed = snow_item(5, "Deploy Claims 2.0.0 PROCESSED", assigned_to="automation")
+        deployments = [
+            deployment(1, "Deploy Claims release 2.0.0 to Prod"),
+            deployment(2, "Deploy Billing release 9.9.9 to Prod"),
+        ]
+
+        actions = by_id(reconciler.plan_changes(snapshot([processed], planned=[], deployments=deployments)))
+
+        self.assertEqual(list(actions), ["cancel-ServerTasks-2", "notify-ServerTasks-2"])
+        self.assertEqual(actions["notify-ServerTasks-2"]["outcome_of"], "cancel-ServerTasks-2")
+
+
+class TestApplyChanges(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.batches = []
+        self.messages = []
+        use_clients(
+            octopus=StubClient([("POST", r"/api/deployments$", lambda endpoint, kwargs: (500, {"ErrorMessage": "down"}))]),
+            service_now=StubClient([("POST", r"/api/now/v1/batch$", self.answer_batch)]),
+            webex=StubClient([("POST", r"/messages$", self.answer_webex)]),
+        )
+
+    def answer_batch(self, endpoint: str, kwargs: dict) -> tuple:
+        body = json.loads(kwargs["data"])
+        self.batches.append(body)
+        return 200, {"serviced_requests": [{"id": r["id"], "status_code": 200} for r in body["rest_requests"]]}
+
+    def answer_webex(self, endpoint: str, kwargs: dict) -> tuple:
+        self.messages.append(kwargs["data"]["markdown"])
+        return 200, {}
+
+    def test_a_failed_schedule_skips_the_assign_and_requeues_an_assigned_item(self):
+        unassigned = snow_item(1, "Deploy Billing 1.0.1")
+        assigned = snow_item(2, "Deploy Claims 1.0.2", assigned_to="automation")
+        actions = reconciler.plan_changes(snapshot([unassigned, assigned], planned=[unassigned, assigned]))
+
+        outcomes = reconciler.apply_changes(actions)
+
+        self.assertFalse(outcomes["schedule-sys1"])
+        self.assertNotIn("assign-sys1", outcomes)
+        self.assertNotIn("assign-sys2", outcomes)
+        self.assertTrue(outcomes["requeue-sys2"])
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(len(self.batches[0]["rest_requests"]), 1)
+
+        self.assertEqual(unassigned["assigned_to"], "")
+        self.assertEqual(assigned["assigned_to"], "")
+        self.assertEqual(task_store().get("sys1")["outcome"], "SCHEDULE_FAILED")
+        self.assertEqual(task_store().get("sys2")["outcome"], "SCHEDULE_FAILED")
+        self.assertEqual(len(self.messages), 2)
+        self.assertTrue(all("FAILED to schedule deployment" in message for message in self.messages))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+from datetime import datetime, timedelta
+
+from pytz import utc
+
+from tests.scheduler_stubs import StubClient, install, reset, use_clients
+
+install()
+
+from cmadevops_deployment_scheduler.modules import run_fingerprint  # noqa: E402
+from cmadevops_deployment_scheduler.modules.local_state import load_state, save_state  # noqa: E402
+
+FINGERPRINT = {
+    "ChangeTasks": {"Count": 3, "UpdatedOn": "2024-05-01 12:00:00"},
+    "QueuedTasks": {"Count": 1, "NewestId": "ServerTasks-1", "NewestQueueTime": "2024-05-01T12:00:00+00:00"},
+}
+
+
+def in_minutes(minutes: int) -> str:
+    return (datetime.now(utc) + timedelta(minutes=minutes)).isoformat()
+
+
+class TestCanSkipRun(unittest.TestCase):
+    def setUp(self):
+        reset()
+
+    def save_fingerprint(self, skipped_runs: int = 0, next_window: str = "") -> None:
+        save_state(
+            run_fingerprint.fingerprint_path(),
+            {"Fingerprint": FINGERPRINT, "NextWindow": next_window, "SkippedRuns": skipped_runs},
+        )
+
+    def test_an_unchanged_run_is_skipped_and_counted(self):
+        self.save_fingerprint(skipped_runs=2, next_window=in_minutes(180))
+
+        self.assertTrue(run_fingerprint.can_skip_run(dict(FINGERPRINT)))
+        self.assertEqual(load_state(run_fingerprint.fingerprint_path())["SkippedRuns"], 3)
+
+    def test_a_changed_or_missing_fingerprint_is_never_skipped(self):
+        self.save_fingerprint()
+
+        changed = dict(FINGERPRINT, ChangeTasks={"Count": 4, "UpdatedOn": "2024-05-01 12:05:00"})
+        self.assertFalse(run_fingerprint.can_skip_run(changed))
+        self.assertFalse(run_fingerprint.can_skip_run(None))
+
+    def test_nothing_is_skipped_without_a_saved_fingerprint(self):
+        self.assertFalse(run_fingerprint.can_skip_run(dict(FINGERPRINT)))
+
+    def test_a_run_is_not_skipped_after_the_max_skipped_runs(self):
+        self.save_fingerprint(skipped_runs=6)
+
+        self.assertFalse(run_fingerprint.can_skip_run(dict(FINGERPRINT)))
+        self.assertEqual(load_state(run_fingerprint.fingerprint_path())["SkippedRuns"], 6)
+
+    def test_a_run_is_not_skipped_close_to_the_next_window(self):
+        self.save_fingerprint(next_window=in_minutes(60))
+        self.assertFalse(run_fingerprint.can_skip_run(dict(FINGERPRINT)))
+
+        self.save_fingerprint(next_window="not a time")
+        self.assertFalse(run_fingerprint.can_skip_run(dict(FINGERPRINT)))
+
+
+class TestSaveRunFingerprint(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.count = 3
+        use_clients(
+            service_now=StubClient(
+                [
+                    (
+                        "GET",
+                        r"/api/now/stats/change_task",
+                        lambda endpoint, kwargs: (
+                            200,
+                            {"result": {"stats": {"count": str(self.count), "max": {"sys_updated_on": "2024-05-01 12:00:00"}}}},
+                        ),
+                    )
+                ]
+            ),
+            octopus=StubClient(
+                [
+                    (
+                        "GET",
+                        r"/api/tasks$",
+                        lambda endpoint, kwargs: (
+                            200,
+                            {
+                                "TotalResults": 1,
+                                "Items": [{"Id": "ServerTasks-1", "QueueTime": "2024-05-01T12:00:00+00:00"}],
+                            },
+                        ),
+                    )
+                ]
+            ),
+        )
+
+    def test_the_fingerprint_and_next_window_are_saved(self):
+        fingerprint = run_fingerprint.run_fingerprint()
+        self.assertEqual(fingerprint, FINGERPRINT)
+
+        snow_items = [{"planned_start_date": "2099-01-01 15:00:00"}, {"planned_start_date": "2000-01-01 15:00:00"}]
+        deployments = [{"QueueTime": "2099-01-02T15:00:00.000+0000"}]
+        run_fingerprint.save_run_fingerprint(fingerprint, snow_items=snow_items, deployments=deployments)
+
+        state = load_state(run_fingerprint.fingerprint_path())
+        self.assertEqual(state["Fingerprint"], FINGERPRINT)
+        self.assertEqual(state["NextWindow"], "2099-01-01T15:00:00+00:00")
+        self.assertEqual(state["SkippedRuns"], 0)
+
+    def test_changes_made_during_the_run_are_not_saved(self):
+        fingerprint = run_fingerprint.run_fingerprint()
+        self.count = 4
+
+        run_fingerprint.save_run_fingerprint(fingerprint, snow_items=[], deployments=[])
+
+        self.assertEqual(load_state(run_fingerprint.fingerprint_path()), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
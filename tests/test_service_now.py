@@ -0,0 +1,185 @@
+import base64
+import json
+import unittest
+import urllib.parse
+
+from tests.scheduler_stubs import StubClient, install, reset, use_clients
+
+install()
+
+from cmadevops_deployment_scheduler.modules import service_now  # noqa: E402
+from cmadevops_deployment_scheduler.modules.local_state import load_state, save_state, state_path  # noqa: E402
+
+
+def snow_item(number: int, **fields) -> dict:
+    item = {
+        "sys_id": f"sys{number}",
+        "task_effective_number": f"CTASK{number}",
+        "short_description": f"Deploy Billing 1.0.{number}",
+        "planned_start_date": "2030-01-01 15:00:00",
+        "assigned_to": "",
+        "change_request": "c" * 32,
+        "change_request.type": "normal",
+        "sys_updated_on": "2024-01-01 00:00:00",
+    }
+    item.update(fields)
+    return item
+
+
+class TestChangeTaskWriteQueue(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.batches = []
+        self.service_now = StubClient(
+            [
+                ("POST", r"/api/now/v1/batch$", self.answer_batch),
+                ("PUT", r"/change_task/sys1$", lambda endpoint, kwargs: (500, {"error": "locked"})),
+                ("PUT", r"/change_task/sys\d+$", lambda endpoint, kwargs: (200, {"result": json.loads(kwargs["data"])})),
+            ]
+        )
+        use_clients(service_now=self.service_now)
+
+    def answer_batch(self, endpoint: str, kwargs: dict) -> tuple:
+        # the first update is saved, the second fails and the third is not serviced at all
+        body = json.loads(kwargs["data"])
+        self.batches.append(body)
+        serviced = [{"id": body["rest_requests"][0]["id"], "status_code": 200}]
+        if len(body["rest_requests"]) > 1:
+            serviced.append({"id": body["rest_requests"][1]["id"], "status_code": 500})
+        return 200, {"batch_request_id": body["batch_request_id"], "serviced_requests": serviced, "unserviced_requests": []}
+
+    def test_each_result_is_mapped_back_to_its_change_task(self):
+        queue = service_now.ChangeTaskWriteQueue(batch_size=25)
+        for number in range(3):
+            queue.add(sys_id=f"sys{number}", json_body={"assigned_to": ""})
+
+        results = queue.flush()
+
+        # sys1 failed in the batch and again on its own, sys2 was not serviced and saved on its own
+        self.assertEqual(results, {"sys0": True, "sys1": False, "sys2": True})
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(
+            [(method, endpoint) for method, endpoint, _ in self.service_now.calls[1:]],
+            [("PUT", "/api/now/table/change_task/sys1"), ("PUT", "/api/now/table/change_task/sys2")],
+        )
+        self.assertEqual(len(queue), 0)
+
+    def test_batch_bodies_are_base64_encoded_puts(self):
+        queue = service_now.ChangeTaskWriteQueue()
+        queue.add(sys_id="sys0", json_body={"state": "Open"})
+        queue.add(sys_id="sys0", json_body={"assigned_to": ""})
+        queue.flush()
+
+        rest_request = self.batches[0]["rest_requests"][0]
+        self.assertEqual(rest_request["method"], "PUT")
+        self.assertEqual(rest_request["url"], "/api/now/table/change_task/sys0")
+        self.assertEqual(json.loads(base64.b64decode(rest_request["body"])), {"state": "Open", "assigned_to": ""})
+
+    def test_updates_are_split_into_batches(self):
+        queue = service_now.ChangeTaskWriteQueue(batch_size=2)
+        for number in (0, 2, 3):
+            queue.add(sys_id=f"sys{number}", json_body={"assigned_to": ""})
+        queue.flush()
+
+        self.assertEqual([len(batch["rest_requests"]) for batch in self.batches], [2, 1])
+
+
+class TestAssignSnowItem(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.saved = True
+        self.service_now = StubClient(
+            [
+                ("POST", r"/api/now/v1/batch$", self.answer_batch),
+                ("PUT", r"/change_task/", lambda endpoint, kwargs: (200 if self.saved else 500, {"result": {}})),
+            ]
+        )
+        use_clients(service_now=self.service_now)
+
+    def answer_batch(self, endpoint: str, kwargs: dict) -> tuple:
+        body = json.loads(kwargs["data"])
+        status_code = 200 if self.saved else 500
+        return 200, {"serviced_requests": [{"id": r["id"], "status_code": status_code} for r in body["rest_requests"]]}
+
+    def test_a_queued_update_is_applied_once_it_is_saved(self):
+        item = snow_item(0, assigned_to="automation", short_description="Deploy Billing 1.0.0")
+        queue = service_now.ChangeTaskWriteQueue()
+
+        self.assertTrue(service_now.assign_snow_item(snow_item=item, assign_to_queue=True, queue=queue))
+        self.assertEqual(item["assigned_to"], "automation")
+
+        queue.flush()
+        self.assertEqual(item["assigned_to"], "")
+        self.assertEqual(item["state"], "Open")
+
+    def test_a_queued_update_that_fails_leaves_the_item_alone(self):
+        self.saved = False
+        item = snow_item(0, assigned_to="automation", short_description="Deploy Billing 1.0.0 PROCESSED")
+        queue = service_now.ChangeTaskWriteQueue()
+
+        service_now.assign_snow_item(snow_item=item, assign_to_queue=True, queue=queue)
+        self.assertEqual(queue.flush(), {"sys0": False})
+
+        self.assertEqual(item["assigned_to"], "automation")
+        self.assertEqual(item["short_description"], "Deploy Billing 1.0.0 PROCESSED")
+        self.assertTrue(service_now.assigned_to_automation(item))
+
+    def test_a_direct_update_is_applied_when_it_is_saved(self):
+        item = snow_item(0)
+
+        self.assertTrue(service_now.assign_snow_item(snow_item=item, assign_to_queue=False))
+        self.assertEqual(item["assigned_to"], "automation")
+        self.assertTrue(item["short_description"].endswith("PROCESSED"))
+
+
+
+def open_task(number: int, **fields) -> dict:
+    fields = {"active": "true", "planned_end_date": "2030-01-01 16:00:00", "assignment_group": {"value": "group"}, **fields}
+    return snow_item(number, **fields)
+
+
+class TestSyncChangeTasks(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.queries = []
+        self.service_now = StubClient([("GET", r"/change_task\?", self.answer_query)])
+        use_clients(service_now=self.service_now)
+        save_state(
+            state_path("change_tasks.json"),
+            {
+                "LastSyncedOn": "2024-05-01 12:00:00",
+                "RunsSinceFullSync": 1,
+                "Tasks": {"sys1": open_task(1), "sys2": open_task(2)},
+            },
+        )
+
+    def answer_query(self, endpoint: str, kwargs: dict) -> tuple:
+        query = urllib.parse.unquote(endpoint.split("sysparm_query=", 1)[1])
+        self.queries.append(query)
+        if query.startswith("assignment_group=group^"):
+            return 200, {"result": [open_task(3)]}
+        # sys1 was moved to another group, the group query does not return it any more
+        return 200, {"result": [open_task(1, assignment_group={"value": "other"})]}
+
+    def test_a_task_moved_to_another_group_leaves_the_snapshot(self):
+        snow_items = service_now.sync_change_tasks()
+
+        self.assertEqual(sorted(item["sys_id"] for item in snow_items), ["sys2", "sys3"])
+        self.assertEqual(sorted(load_state(state_path("change_tasks.json"))["Tasks"]), ["sys2", "sys3"])
+
+    def test_the_open_tasks_are_queried_by_sys_id_since_the_last_sync(self):
+        service_now.sync_change_tasks()
+
+        self.assertEqual(len(self.queries), 2)
+        self.assertTrue(
+            self.queries[1].startswith("sys_idINsys1,sys2^assignment_group!=group^sys_updated_on>=2024-05-01 11:55:00")
+        )
+
+    def test_open_change_task_checks_the_group(self):
+        self.assertTrue(service_now.open_change_task(open_task(1)))
+        self.assertTrue(service_now.open_change_task(open_task(1, assignment_group="group")))
+        self.assertFalse(service_now.open_change_task(open_task(1, assignment_group={"value": "other"})))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from datetime import datetime, timedelta
+
+from pytz import utc
+
+from tests.scheduler_stubs import install, reset
+
+install()
+
+from cmadevops_deployment_scheduler.modules import service_now  # noqa: E402
+from cmadevops_deployment_scheduler.modules.task_store import TaskStore, title_key  # noqa: E402
+
+
+def snow_item(**fields) -> dict:
+    item = {
+        "sys_id": "sys1",
+        "short_description": "Deploy Billing 1.0.4 PROCESSED",
+        "planned_start_date": "2030-01-01 15:00:00",
+        "assigned_to": "",
+        "sys_updated_on": "2024-01-01 00:00:00",
+    }
+    item.update(fields)
+    return item
+
+
+def plan(item: dict) -> dict:
+    return {"snow_item": item, "project_id": "Projects-1", "project_name": "Billing", "release_number": "1.0.4"}
+
+
+class TestTaskStore(unittest.TestCase):
+    def setUp(self):
+        reset()
+        self.store = TaskStore()
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_the_change_task_fields_include_sys_updated_on(self):
+        self.assertIn("sys_updated_on", service_now.CHANGE_TASK_FIELDS)
+        self.assertEqual(len(service_now.CHANGE_TASK_SYNC_FIELDS), len(set(service_now.CHANGE_TASK_SYNC_FIELDS)))
+
+    def test_title_key_ignores_the_processed_marker(self):
+        self.assertEqual(title_key("Deploy  Billing 1.0.4 PROCESSED"), "DEPLOY BILLING 1.0.4")
+
+    def test_an_unchanged_settled_task_is_skipped(self):
+        self.store.record(plan(snow_item()), "MANUAL")
+
+        # our own update of the title changes sys_updated_on but not what a person edits
+        self.assertTrue(self.store.skippable(snow_item(short_description="Deploy Billing 1.0.4")))
+        self.assertTrue(self.store.skippable(snow_item(sys_updated_on="2024-02-01 00:00:00")))
+
+    def test_a_changed_title_or_start_is_not_skipped_when_sys_updated_on_is_the_same(self):
+        self.store.record(plan(snow_item()), "MANUAL")
+
+        self.assertFalse(self.store.skippable(snow_item(short_description="Deploy Billing 1.0.5")))
+        self.assertFalse(self.store.skippable(snow_item(planned_start_date="2030-01-02 15:00:00")))
+
+    def test_a_task_without_a_row_or_with_an_assignee_is_not_skipped(self):
+        self.assertFalse(self.store.skippable(snow_item()))
+
+        self.store.record(plan(snow_item()), "MANUAL")
+        self.assertFalse(self.store.skippable(snow_item(assigned_to="automation")))
+
+    def test_recheck_outcomes_are_looked_at_again_after_a_while(self):
+        self.store.record(plan(snow_item()), "RELEASE_NOT_FOUND")
+        self.assertTrue(self.store.skippable(snow_item()))
+
+        checked_on = (datetime.now(utc) - timedelta(minutes=61)).isoformat()
+        with self.store.connection:
+            self.store.connection.execute("UPDATE change_tasks SET checked_on = ?", (checked_on,))
+        self.assertFalse(self.store.skippable(snow_item()))
+
+    def test_recheck_outcomes_are_looked_at_again_one_cron_interval_later(self):
+        # the last run looked at the item a few seconds after it started, this run is one hour after that start
+        self.store.record(plan(snow_item()), "RELEASE_NOT_FOUND")
+        for checked_ago in (timedelta(minutes=60), timedelta(minutes=59, seconds=30)):
+            checked_on = (datetime.now(utc) - checked_ago).isoformat()
+            with self.store.connection:
+                self.store.connection.execute("UPDATE change_tasks SET checked_on = ?", (checked_on,))
+            self.assertFalse(self.store.skippable(snow_item()))
+
+    def test_other_outcomes_are_not_skipped(self):
+        self.store.record(plan(snow_item()), "SCHEDULED", deployment_id="Deployments-1")
+
+        self.assertFalse(self.store.skippable(snow_item()))
+        self.assertEqual(self.store.get("sys1")["deployment_id"], "Deployments-1")
+
+
+if __name__ == "__main__":
+    unittest.main()
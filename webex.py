@@ -2,6 +2,7 @@ import requests
 from cmadevops_deployment_scheduler.config.config import scheduler_config
 from urllib3.exceptions import InsecureRequestWarning
 from cmadevops_deployment_scheduler.modules.logwrite import log
+from cmadevops_deployment_scheduler.modules.clients import webex_client
 
 # disables console logging of insecure  https
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
@@ -13,7 +14,7 @@ def post_to_webex(message=str):
         payload = {"roomId": scheduler_config["WebexRoom"], "markdown": message}        
         headers = {"Authorization": "Bearer " f'{scheduler_config["Bearer"]}'}
 
-        requests.post(scheduler_config["WebexUrl"], headers=headers, data=payload).json()
+        webex_client().post(scheduler_config["WebexUrl"], headers=headers, data=payload).json()
         return True
     except Exception as e:
         error_string = str(e)